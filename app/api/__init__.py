@@ -4,4 +4,5 @@ API requests module
 
 from .edge_tts import EdgeTTS
 from .elevenlabs import ElevenLabs
+from .sample_cache import SampleCache
 from .ttsmaker import TTSMaker
@@ -0,0 +1,116 @@
+"""
+Cancellation of provider calls whose result is no longer wanted
+"""
+
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Coroutine, Iterator
+
+
+class RequestCancelled(RuntimeError):
+    """
+    Raised by provider calls aborted because their request was cancelled.
+    """
+
+
+class CancelToken:
+    """
+    Thread-safe cancellation flag with callbacks, shared between a request handler and the thread doing its work.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._cancelled: bool = False
+        self._callbacks: list[Callable[[], Any]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        Whether the request was cancelled.
+        """
+        return self._cancelled
+
+    def cancel(self) -> None:
+        """
+        Cancel the request and run the registered callbacks.
+        """
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], Any]) -> Callable[[], None]:
+        """
+        Register a callback run on cancellation, immediately if the request is already cancelled.
+
+        :param callback: function to run
+        :return: function unregistering the callback
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        callback()
+        return lambda: None
+
+    def _unregister(self, callback: Callable[[], Any]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+_current: ContextVar[CancelToken | None] = ContextVar("cancel_token", default=None)
+
+
+@contextmanager
+def cancel_scope(token: CancelToken) -> Iterator[CancelToken]:
+    """
+    Make a token the cancellation token of the provider calls run in this context.
+
+    :param token: cancellation token
+    """
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+def check_cancelled() -> None:
+    """
+    Raise `RequestCancelled` if the request running in this context was cancelled.
+    """
+    token: CancelToken | None = _current.get()
+    if token is not None and token.cancelled:
+        raise RequestCancelled("Request cancelled")
+
+
+def run_async(coro: Coroutine[Any, Any, Any]) -> Any:
+    """
+    Run a coroutine to completion like `asyncio.run`, cancelling it as soon as the current request is cancelled.
+
+    :param coro: coroutine
+    :return: result of the coroutine
+    """
+    token: CancelToken | None = _current.get()
+    if token is None:
+        return asyncio.run(coro)
+
+    async def main() -> Any:
+        task: asyncio.Task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        unregister: Callable[[], None] = token.on_cancel(lambda: loop.call_soon_threadsafe(task.cancel))
+        try:
+            return await coro
+        finally:
+            unregister()
+
+    try:
+        return asyncio.run(main())
+    except asyncio.CancelledError as e:
+        raise RequestCancelled("Request cancelled") from e
@@ -0,0 +1,178 @@
+"""
+Circuit breakers guarding the provider APIs
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+import config
+from loguru import logger
+
+from .cancellation import RequestCancelled
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of calling a provider whose breaker is open.
+    """
+
+
+class CircuitBreaker:  # pylint: disable=R0902
+    """
+    Stop calling a provider after consecutive failures or latency SLO breaches.
+
+    Closed: calls go through, `BREAKER_FAILURES` failures or slow calls in a row open the breaker.
+    Open: calls fail immediately with `CircuitOpenError`. With a probe, a background thread runs it every
+    `BREAKER_RESET_TIMEOUT` seconds and closes the breaker once it succeeds. Without a probe, the first call after the
+    timeout is let through as a trial (half-open) and closes or reopens the breaker.
+    Exceptions for which `excluded` returns True mean the provider answered (e.g. a rejected token), they do not count
+    as failures.
+    """
+
+    registry: dict[str, "CircuitBreaker"] = {}
+
+    def __init__(
+        self,
+        name: str,
+        probe: Callable[[], Any] | None = None,
+        excluded: Callable[[BaseException], bool] | None = None,
+    ) -> None:
+        self.name: str = name
+        self.probe: Callable[[], Any] | None = probe
+        self.excluded: Callable[[BaseException], bool] | None = excluded
+        self.state: str = "closed"
+        self.failures: int = 0
+        self.opens: int = 0
+        self.opened_at: float = 0.0
+        self.last_error: str = ""
+        self._trial: bool = False
+        self._lock = threading.Lock()
+        CircuitBreaker.registry[name] = self
+
+    def allow(self) -> None:
+        """
+        Check whether a call may go through.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open":
+                remaining: float = self.opened_at + config.BREAKER_RESET_TIMEOUT - time.time()
+                if remaining > 0 or self.probe is not None:
+                    raise CircuitOpenError(f"{self.name} is unavailable ({self.last_error}), retry later")
+                self.state = "half-open"
+            if self._trial:
+                raise CircuitOpenError(f"{self.name} is recovering, retry later")
+            self._trial = True
+
+    def success(self) -> None:
+        """
+        Record a successful call.
+        """
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"Circuit breaker {self.name} closed")
+            self.state = "closed"
+            self.failures = 0
+            self._trial = False
+
+    def failure(self, reason: str) -> None:
+        """
+        Record a failed or slow call.
+
+        :param reason: description of the failure
+        """
+        with self._lock:
+            self.failures += 1
+            self.last_error = reason
+            self._trial = False
+            if self.state == "open" or (self.state == "closed" and self.failures < config.BREAKER_FAILURES):
+                return
+            self.state = "open"
+            self.opened_at = time.time()
+            self.opens += 1
+        logger.warning(f"Circuit breaker {self.name} opened: {reason}")
+        if self.probe is not None:
+            threading.Thread(target=self._run_probe, name=f"breaker-{self.name}", daemon=True).start()
+
+    def _release(self) -> None:
+        with self._lock:
+            self._trial = False
+
+    def _run_probe(self) -> None:
+        """
+        Probe the provider until it answers again.
+        """
+        while self.state == "open":
+            time.sleep(config.BREAKER_RESET_TIMEOUT)
+            start: float = time.perf_counter()
+            try:
+                self.probe()
+            except Exception as e:  # pylint: disable=W0718
+                self.last_error = f"probe: {type(e).__name__}: {e}"
+                continue
+            if time.perf_counter() - start <= config.BREAKER_SLOW_SECONDS:
+                self.success()
+
+    @contextmanager
+    def guard(self, slow_after: float | None = None) -> Iterator[None]:
+        """
+        Run a provider call under the breaker.
+
+        :param slow_after: seconds after which a successful call still counts as an SLO breach, None to disable
+        """
+        self.allow()
+        start: float = time.perf_counter()
+        try:
+            yield
+        except (GeneratorExit, asyncio.CancelledError, KeyboardInterrupt, RequestCancelled):
+            self._release()
+            raise
+        except BaseException as e:
+            if self.excluded is not None and self.excluded(e):
+                self.success()
+            else:
+                self.failure(f"{type(e).__name__}: {e}")
+            raise
+        duration: float = time.perf_counter() - start
+        if slow_after is not None and duration > slow_after:
+            self.failure(f"slow call: {duration:.1f}s > {slow_after:.1f}s")
+        else:
+            self.success()
+
+    def call(self, func: Callable[..., Any], *args, slow_after: float | None = None, **kwargs) -> Any:
+        """
+        Run a blocking provider call under the breaker.
+
+        :param func: function doing the call
+        :param slow_after: latency SLO in seconds
+        :return: result of the call
+        """
+        with self.guard(slow_after):
+            return func(*args, **kwargs)
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Current state of the breaker, for the UI and metrics.
+        """
+        return {
+            "name": self.name,
+            "state": self.state,
+            "failures": self.failures,
+            "opens": self.opens,
+            "opened_at": self.opened_at,
+            "last_error": self.last_error,
+        }
+
+
+def synthesis_slo(text: str) -> float:
+    """
+    Latency SLO of a synthesis call, growing with the text length.
+
+    :param text: synthesized text
+    :return: seconds
+    """
+    return config.BREAKER_SLOW_SECONDS + len(text) / config.BREAKER_SLOW_CHARS_PER_SECOND
@@ -0,0 +1,172 @@
+"""
+In-flight request coalescing shared by the provider APIs
+"""
+
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Hashable
+
+from loguru import logger
+
+from .cancellation import RequestCancelled, check_cancelled
+
+# result of a call whose leader was cancelled, the waiting callers restart it
+HANDED_OFF = object()
+
+
+class RequestCoalescer:
+    """
+    Collapse concurrent identical calls into a single upstream call.
+
+    The first caller of a key becomes the leader and runs the call, every caller arriving while it is still
+    running waits for the same result (or exception) instead of issuing its own request. `led` tells a caller
+    whether its last call was the upstream one, e.g. to charge a quota once per upstream request.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self._lock = threading.Lock()
+        self._inflight: dict[Hashable, Future] = {}
+        self._led: ContextVar[bool] = ContextVar(f"coalescer_led_{name}", default=False)
+
+    def led(self) -> bool:
+        """
+        Whether the last call made in this context ran the upstream call, rather than sharing another caller's.
+        """
+        return self._led.get()
+
+    def _claim(self, key: Hashable) -> tuple[Future, bool]:
+        """
+        Get the in-flight future of a key, registering a new one if there is none.
+
+        :param key: normalized request key
+        :return: future of the call, whether the caller is the leader
+        """
+        with self._lock:
+            future: Future | None = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _release(self, key: Hashable) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None, error: BaseException | None = None) -> None:
+        """
+        Unregister a call, then settle its future, so a waiting caller retrying finds the key free.
+        """
+        self._release(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def call(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking call, or wait for an identical one already in flight.
+
+        If the leader's request is cancelled, the call is handed off: a waiting caller restarts it instead of failing.
+
+        :param key: normalized request key
+        :param func: function doing the upstream call
+        :return: result of the call
+        """
+        self._led.set(False)
+        while True:
+            future, leader = self._claim(key)
+            if leader:
+                break
+            logger.debug(f"{self.name}: joined in-flight request")
+            result: Any = future.result()
+            if result is not HANDED_OFF:
+                return result
+            check_cancelled()
+            logger.debug(f"{self.name}: leader cancelled, taking over the request")
+        try:
+            result = func(*args, **kwargs)
+        except RequestCancelled:
+            self._finish(key, future, HANDED_OFF)
+            raise
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        self._led.set(True)
+        return result
+
+    async def acall(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Await a coroutine, or an identical one already in flight in any thread or event loop.
+
+        If the leader's request is cancelled, the call is handed off: a waiting caller restarts it instead of failing.
+
+        :param key: normalized request key
+        :param func: coroutine function doing the upstream call
+        :return: result of the call
+        """
+        self._led.set(False)
+        while True:
+            future, leader = self._claim(key)
+            if leader:
+                break
+            logger.debug(f"{self.name}: joined in-flight request")
+            # shielded, so cancelling this caller does not cancel the shared future of the others
+            result: Any = await asyncio.shield(asyncio.wrap_future(future))
+            if result is not HANDED_OFF:
+                return result
+            logger.debug(f"{self.name}: leader cancelled, taking over the request")
+        try:
+            result = await func(*args, **kwargs)
+        except (asyncio.CancelledError, RequestCancelled):
+            self._finish(key, future, HANDED_OFF)
+            raise
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        self._led.set(True)
+        return result
+
+    def inflight(self) -> int:
+        """
+        Number of distinct calls currently in flight.
+        """
+        with self._lock:
+            return len(self._inflight)
+
+
+def normalize_key(provider: str, voice: str | int, text: str, **settings: Any) -> tuple:
+    """
+    Build the coalescing key of a synthesis request. Requests billed to an account must pass its `account_key` as a
+    setting, so callers with different keys never share a call.
+
+    :param provider: provider name
+    :param voice: voice id or short name
+    :param text: text content
+    :param settings: remaining synthesis settings
+    :return: hashable key
+    """
+    normalized: list[tuple[str, Any]] = []
+    for name, value in sorted(settings.items()):
+        if isinstance(value, float):
+            value = round(value, 4)
+        elif isinstance(value, str):
+            value = value.strip()
+        normalized.append((name, value))
+    return provider, str(voice), text, tuple(normalized)
+
+
+def account_key(token: str) -> str:
+    """
+    Identify the account of an API key or token in request keys, without keeping the secret itself.
+
+    :param token: API key or token
+    :return: sha256 hex digest of the token
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
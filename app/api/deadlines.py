@@ -0,0 +1,109 @@
+"""
+Adaptive deadlines of the provider calls
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+import config
+
+
+class DeadlineExceeded(RuntimeError):
+    """
+    Raised when a provider call runs past its deadline.
+    """
+
+
+class DeadlineEstimator:
+    """
+    Learn how long an operation of a provider takes and derive the deadline of each call from its text length.
+
+    The last `DEADLINE_WINDOW` calls are fitted as duration = latency + characters / throughput (least squares), and
+    the prediction is scaled by the `DEADLINE_PERCENTILE` of the observed to predicted duration ratio, so the deadline
+    follows both the typical speed of the provider and how much it varies, for short and long texts alike. A call gets
+    `DEADLINE_FACTOR` times this duration, clamped to `DEADLINE_MIN`-`DEADLINE_MAX` seconds. Until
+    `DEADLINE_MIN_SAMPLES` calls are known, the deadline is the generous `DEADLINE_DEFAULT` seconds plus the text at
+    `DEADLINE_DEFAULT_CHARS_PER_SECOND`. Calls failing at their deadline are recorded with the deadline as duration, so
+    a provider getting slower pushes its deadlines up instead of failing forever.
+    """
+
+    registry: dict[tuple[str, str], "DeadlineEstimator"] = {}
+
+    def __init__(self, provider: str, operation: str) -> None:
+        self.provider: str = provider
+        self.operation: str = operation
+        self.samples: deque[tuple[int, float]] = deque(maxlen=config.DEADLINE_WINDOW)
+        self.latency: float = 0.0
+        self.seconds_per_character: float = 0.0
+        self.spread: float = 1.0
+        self._lock = threading.Lock()
+        DeadlineEstimator.registry[(provider, operation)] = self
+
+    def record(self, seconds: float, characters: int = 0) -> None:
+        """
+        Record the duration of a call and refit the model.
+
+        :param seconds: duration of the call
+        :param characters: characters of the text sent
+        """
+        with self._lock:
+            self.samples.append((characters, seconds))
+            count: int = len(self.samples)
+            mean_x: float = sum(x for x, _ in self.samples) / count
+            mean_y: float = sum(y for _, y in self.samples) / count
+            variance: float = sum((x - mean_x) ** 2 for x, _ in self.samples)
+            covariance: float = sum((x - mean_x) * (y - mean_y) for x, y in self.samples)
+            slope: float = max(0.0, covariance / variance) if variance > 0 else 0.0
+            intercept: float = max(0.0, mean_y - slope * mean_x)
+            ratios: list[float] = sorted(y / max(intercept + slope * x, 1e-3) for x, y in self.samples)
+            self.latency, self.seconds_per_character = intercept, slope
+            self.spread = max(1.0, ratios[min(count - 1, int(config.DEADLINE_PERCENTILE * count))])
+
+    def timeout(self, characters: int = 0) -> float:
+        """
+        Get the deadline of a call.
+
+        :param characters: characters of the text sent
+        :return: seconds
+        """
+        if len(self.samples) < config.DEADLINE_MIN_SAMPLES:
+            seconds: float = config.DEADLINE_DEFAULT + characters / config.DEADLINE_DEFAULT_CHARS_PER_SECOND
+        else:
+            seconds = config.DEADLINE_FACTOR * (self.latency + characters * self.seconds_per_character) * self.spread
+        return min(max(seconds, config.DEADLINE_MIN), config.DEADLINE_MAX)
+
+    @contextmanager
+    def deadline(self, characters: int = 0) -> Iterator[float]:
+        """
+        Time a call, recording its duration if it succeeds or fails at its deadline.
+
+        :param characters: characters of the text sent
+        :return: deadline of the call in seconds, to be passed to the HTTP or websocket client
+        """
+        timeout: float = self.timeout(characters)
+        start: float = time.perf_counter()
+        try:
+            yield timeout
+        except BaseException:
+            elapsed: float = time.perf_counter() - start
+            if elapsed >= timeout:
+                self.record(elapsed, characters)
+            raise
+        self.record(time.perf_counter() - start, characters)
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Current model of the operation, for the UI and metrics.
+        """
+        return {
+            "provider": self.provider,
+            "operation": self.operation,
+            "samples": len(self.samples),
+            "latency": self.latency,
+            "chars_per_second": 1 / self.seconds_per_character if self.seconds_per_character else None,
+            "spread": self.spread,
+            "timeout": self.timeout(),
+        }
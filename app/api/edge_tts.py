@@ -2,14 +2,22 @@
 API requests of edge-tts
 """
 
+import asyncio
 from typing import NoReturn
 
+import config
 import edge_tts
 import requests
 from edge_tts.constants import VOICE_LIST
 from loguru import logger
-from tinydb import TinyDB, where
-from tinydb.storages import MemoryStorage
+
+from .circuit_breaker import CircuitBreaker, synthesis_slo
+from .coalescer import RequestCoalescer, normalize_key
+from .deadlines import DeadlineEstimator, DeadlineExceeded
+from .json_decoder import loads
+from .shared_store import RateLimiter, SharedStore
+from .timing import stage
+from .voice import EdgeCatalog, EdgeVoice
 
 
 class EdgeTTS:
@@ -17,71 +25,92 @@ class EdgeTTS:
     edge-tts class
     """
 
-    language_code_list: list[str] = []
-    voices_db = TinyDB(storage=MemoryStorage)
+    catalog: EdgeCatalog | None = None
+    catalog_version: int = 0
+    snapshot_version: float | None = None
+    coalescer = RequestCoalescer("edge-tts")
+    breaker = CircuitBreaker("edge-tts", excluded=lambda e: isinstance(e, ValueError))
+    voices_deadline = DeadlineEstimator("edge-tts", "voices")
+    synthesis_deadline = DeadlineEstimator("edge-tts", "synthesize")
 
     @classmethod
     def get_voice_list(cls) -> NoReturn:
         """
         Get voice list supported by Edge, this pulls data from the URL used by Microsoft Edge to return a list of
-        all available voices.
+        all available voices. The list is shared with the other worker processes through a snapshot.
         """
         try:
-            headers: dict[str, str] = {
-                "Authority": "speech.platform.bing.com",
-                "Sec-CH-UA": '" Not;A Brand";v="99", "Microsoft Edge";v="91", "Chromium";v="91"',
-                "Sec-CH-UA-Mobile": "?0",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                "(KHTML, like Gecko) Chrome/91.0.4472.77 Safari/537.36 Edg/91.0.864.41",
-                "Accept": "*/*",
-                "Sec-Fetch-Site": "none",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Dest": "empty",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Accept-Language": "en-US,en;q=0.9",
-            }
-            res: requests.Response = requests.get(VOICE_LIST, headers=headers, timeout=5)
-            if res.status_code == 200:
-                if not cls.voices_db.all():
-                    cls.voices_db.insert_multiple(res.json())
-                if not cls.language_code_list:
-                    for voice in res.json():
-                        language_code: str = voice["Locale"]
-                        if language_code not in cls.language_code_list:
-                            cls.language_code_list.append(language_code)
-        except (requests.exceptions.RequestException, KeyError) as e:
+            data, version = SharedStore.load_snapshot(
+                "edge-tts", lambda: cls.breaker.call(cls._fetch_voice_list, slow_after=config.BREAKER_SLOW_SECONDS)
+            )
+            with stage("decode"):
+                cls.catalog = EdgeCatalog.build(loads(data))
+            cls.snapshot_version = version
+            cls.catalog_version += 1
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
             logger.critical(e)
             raise RuntimeError(e) from e
 
+    @classmethod
+    def _fetch_voice_list(cls) -> bytes:
+        """
+        Download the voice list from Bing.
+
+        :return: raw voice list
+        """
+        headers: dict[str, str] = {
+            "Authority": "speech.platform.bing.com",
+            "Sec-CH-UA": '" Not;A Brand";v="99", "Microsoft Edge";v="91", "Chromium";v="91"',
+            "Sec-CH-UA-Mobile": "?0",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+            "(KHTML, like Gecko) Chrome/91.0.4472.77 Safari/537.36 Edg/91.0.864.41",
+            "Accept": "*/*",
+            "Sec-Fetch-Site": "none",
+            "Sec-Fetch-Mode": "cors",
+            "Sec-Fetch-Dest": "empty",
+            "Accept-Encoding": "gzip, deflate, br",
+            "Accept-Language": "en-US,en;q=0.9",
+        }
+        with cls.voices_deadline.deadline() as timeout:
+            res: requests.Response = requests.get(VOICE_LIST, headers=headers, timeout=timeout)
+        res.raise_for_status()
+        return res.content
+
+    @classmethod
+    def get_catalog(cls) -> EdgeCatalog:
+        """
+        Get the voice catalog, loading it on first use or when another worker refreshed it.
+
+        :return: voice catalog
+        """
+        if cls.catalog is None or SharedStore.version("edge-tts") != cls.snapshot_version:
+            cls.get_voice_list()
+        if cls.catalog is None:
+            raise RuntimeError("Fail to get edge-tts voice list")
+        return cls.catalog
+
     @classmethod
     def get_language_code(cls) -> list[str]:
         """
         Get language code of edge-tts
 
-        :return: a list of language code
+        :return: a sorted list of language code
         """
-        if not cls.language_code_list:
-            cls.get_voice_list()
-        return cls.language_code_list
+        return cls.get_catalog().locales
 
     @classmethod
-    def get_voices(cls, lang_code: str) -> list[tuple[str, str]]:
+    def get_voices(
+        cls, lang_code: str, gender: str | None = None, category: str | None = None
+    ) -> list[tuple[str, str]]:
         """
         Get a list of voices based on the specified language code.
 
         :param lang_code: The language code to filter the voices.
+        :param gender: only keep voices of this gender
+        :param category: only keep voices tagged with this content category
         :return: A list of tuples containing the friendly name and short name of the voices.
         """
-        if not cls.voices_db.all():
-            cls.get_voice_list()
-        try:
-            voices_list: list[tuple[str, str]] = []
-            for voice in cls.voices_db.search(where("Locale") == lang_code):
-                voices_list.append((voice["FriendlyName"], voice["ShortName"]))
-            return voices_list
-        except KeyError as e:
-            logger.error(e)
-            raise RuntimeError(e) from e
+        return cls.get_catalog().get_choices(lang_code, gender, category)
 
     @classmethod
     def get_voice_info(cls, short_name: str) -> tuple[str, str, str]:
@@ -91,18 +120,9 @@ class EdgeTTS:
         :param short_name: short name of voice
         :return: a tuple of gender, content categories, voice personalities
         """
-        if not cls.voices_db.all():
-            cls.get_voice_list()
         try:
-            voice_info: list[dict[str, str | dict[str, list[str]]]] = cls.voices_db.search(
-                where("ShortName") == short_name
-            )
-            assert len(voice_info) == 1
-            return (
-                voice_info[0]["Gender"],
-                ", ".join(voice_info[0]["VoiceTag"]["ContentCategories"]),
-                ", ".join(voice_info[0]["VoiceTag"]["VoicePersonalities"]),
-            )
+            voice: EdgeVoice = cls.get_catalog().voices[short_name]
+            return voice.gender, voice.categories_text, voice.personalities_text
         except KeyError as e:
             logger.error(e)
             raise RuntimeError(e) from e
@@ -116,20 +136,73 @@ class EdgeTTS:
         :param voice: voice speaker name
         :return: sample rate, audio data
         """
-        audio: bytes = bytes()
-        communicate = edge_tts.Communicate(text, voice)
-        async for chunk in communicate.stream():
-            if chunk["type"] == "audio":
-                audio += chunk["data"]
-        return audio
+        key: tuple = normalize_key("edge-tts", voice, text)
+        return await cls.coalescer.acall(key, cls._generate_audio, text, voice)
+
+    @classmethod
+    async def generate_script(
+        cls, lines: list[tuple[str, str]], concurrency: int = config.SCRIPT_CONCURRENCY
+    ) -> list[bytes]:
+        """
+        Synthesize the lines of a script concurrently on the running event loop, the first failure cancels the others.
+
+        :param lines: voice short name and text of each line
+        :param concurrency: maximum number of lines synthesized at once
+        :return: audio data of each line, in order
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def generate(voice: str, text: str) -> bytes:
+            async with semaphore:
+                return await cls.generate_audio(text, voice)
+
+        tasks: list[asyncio.Task] = [asyncio.ensure_future(generate(voice, text)) for voice, text in lines]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            # wait for the cancelled lines to leave the semaphore and the coalescer before propagating
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    @classmethod
+    async def _generate_audio(cls, text: str, voice: str) -> bytes:
+        """
+        Stream audio of a single request from edge-tts
+
+        :param text: audio content text
+        :param voice: voice speaker name
+        :return: audio data
+        """
+        if config.RATE_LIMITS.get("edge-tts"):
+            await asyncio.to_thread(RateLimiter.acquire, "edge-tts")
+        audio = bytearray()
+
+        async def stream(communicate: edge_tts.Communicate) -> None:
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    audio.extend(chunk["data"])
+
+        with cls.breaker.guard(synthesis_slo(text)), cls.synthesis_deadline.deadline(len(text)) as timeout:
+            try:
+                # cancels the pending websocket read once the deadline passes
+                await asyncio.wait_for(stream(edge_tts.Communicate(text, voice)), timeout)
+            except asyncio.TimeoutError as e:
+                raise DeadlineExceeded(f"edge-tts did not finish {len(text)} characters in {timeout:.1f}s") from e
+        return bytes(audio)
 
     @classmethod
     def clear_info(cls) -> bool:
         """
         Clear all stored information.
         """
-        if cls.language_code_list:
-            cls.language_code_list = []
-        if cls.voices_db.all():
-            cls.voices_db.truncate()
-        return (not cls.language_code_list) and (not cls.voices_db.all())
+        cls.catalog = None
+        cls.snapshot_version = None
+        cls.catalog_version += 1
+        SharedStore.drop_snapshot("edge-tts")
+        return cls.catalog is None
+
+
+# the probe is only defined once the class is
+EdgeTTS.breaker.probe = EdgeTTS._fetch_voice_list  # pylint: disable=W0212
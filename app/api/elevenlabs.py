@@ -2,12 +2,43 @@
 API requests of ElevenLabs
 """
 
-from typing import Any, NoReturn
+import json
+import time
+from contextlib import closing
+from dataclasses import asdict
+from typing import Any, Iterator, NoReturn
 
-from elevenlabs import API, Subscription, Voice, Voices, VoiceSettings, api_base_url_v1, generate
+import config
+import requests
+from elevenlabs import API, Subscription, Voice, Voices, VoiceSettings, api_base_url_v1
+from elevenlabs.api.error import APIError, AuthorizationError, RateLimitError
 from loguru import logger
-from tinydb import TinyDB, where
-from tinydb.storages import MemoryStorage
+
+from .cancellation import check_cancelled
+from .circuit_breaker import CircuitBreaker, synthesis_slo
+from .coalescer import RequestCoalescer, account_key, normalize_key
+from .deadlines import DeadlineEstimator, DeadlineExceeded
+from .json_decoder import loads
+from .shared_store import RateLimiter, SharedStore
+from .timing import stage
+from .voice import ElevenLabsVoice
+
+
+def is_client_error(error: BaseException) -> bool:
+    """
+    Whether ElevenLabs rejected a request (bad token, quota, invalid voice...) rather than failed to serve it.
+
+    The SDK raises `APIError` for every status but 200, with the HTTP status as `status` when the body has no structured
+    error, and the ElevenLabs error code (e.g. "voice_not_found") when it has one, which only client errors have.
+
+    :param error: exception raised by a call
+    :return: True for client errors, which must not open the breaker
+    """
+    if isinstance(error, (AuthorizationError, RateLimitError)):
+        return True
+    if not isinstance(error, APIError):
+        return False
+    return not error.status.isdigit() or int(error.status) < 500
 
 
 class ElevenLabs:
@@ -16,19 +47,48 @@ class ElevenLabs:
     """
 
     voices_name_list: list[tuple[str, str]] = []
-    voices_db = TinyDB(storage=MemoryStorage)
+    voices_db: dict[str, ElevenLabsVoice] = {}
+    catalog_version: int = 0
+    snapshot_version: float | None = None
+    coalescer = RequestCoalescer("elevenlabs")
+    breaker = CircuitBreaker("elevenlabs", probe=Voices.from_api, excluded=is_client_error)
+    voices_deadline = DeadlineEstimator("elevenlabs", "voices")
+    synthesis_deadline = DeadlineEstimator("elevenlabs", "synthesize")
+    stream_deadline = DeadlineEstimator("elevenlabs", "stream")
+    token_deadline = DeadlineEstimator("elevenlabs", "token_status")
 
     @classmethod
     def get_voice_list(cls) -> NoReturn:
         """
-        Get voice informations of ElevenLabs
+        Get voice informations of ElevenLabs, shared with the other worker processes through a snapshot
         """
-        assert not cls.voices_name_list
-        assert not cls.voices_db.all()
+        data, version = SharedStore.load_snapshot(
+            "elevenlabs", lambda: cls.breaker.call(cls._fetch_voice_list, slow_after=config.BREAKER_SLOW_SECONDS)
+        )
+        with stage("decode"):
+            voices: list[ElevenLabsVoice] = [ElevenLabsVoice.from_json(entry) for entry in loads(data)]
+        cls.voices_name_list = [(voice.name, voice.voice_id) for voice in voices]
+        cls.voices_db = {voice.voice_id: voice for voice in voices}
+        cls.snapshot_version = version
+        cls.catalog_version += 1
 
-        for voice in Voices.from_api():
-            cls.voices_name_list.append((voice.name, voice.voice_id))
-            cls.voices_db.insert(vars(voice))
+    @classmethod
+    def _fetch_voice_list(cls) -> bytes:
+        """
+        Download the voice list from ElevenLabs.
+
+        :return: voice records serialized as JSON
+        """
+        with cls.voices_deadline.deadline() as timeout:
+            voices: Voices = Voices(**API.get(f"{api_base_url_v1}/voices", timeout=timeout).json())
+        return json.dumps([asdict(ElevenLabsVoice.from_sdk(voice)) for voice in voices]).encode()
+
+    @classmethod
+    def is_stale(cls) -> bool:
+        """
+        Whether the voice list has to be (re)loaded, because it was never loaded or another worker refreshed it.
+        """
+        return not cls.voices_name_list or SharedStore.version("elevenlabs") != cls.snapshot_version
 
     @classmethod
     def get_voices(cls) -> list[tuple[str, str]]:
@@ -37,7 +97,7 @@ class ElevenLabs:
 
         :return: a list containing voice names
         """
-        if not cls.voices_name_list:
+        if cls.is_stale():
             cls.get_voice_list()
         return cls.voices_name_list
 
@@ -49,19 +109,11 @@ class ElevenLabs:
         :param voice_id: id of voice
         :return: information of gender, accent, age, description, use case and sample url.
         """
-        if not cls.voices_name_list:
+        if cls.is_stale():
             cls.get_voice_list()
         try:
-            voice_info: list[dict[str, Any]] = cls.voices_db.search(where("voice_id") == voice_id)
-            assert len(voice_info) == 1
-            return (
-                voice_info[0]["labels"]["gender"],
-                voice_info[0]["labels"]["accent"],
-                voice_info[0]["labels"]["age"],
-                voice_info[0]["labels"]["description"],
-                voice_info[0]["labels"]["use case"],
-                voice_info[0]["preview_url"],
-            )
+            voice: ElevenLabsVoice = cls.voices_db[voice_id]
+            return voice.gender, voice.accent, voice.age, voice.description, voice.use_case, voice.preview_url
         except KeyError as e:
             logger.error(e)
             raise RuntimeError(e) from e
@@ -75,10 +127,42 @@ class ElevenLabs:
         :return: some token information.
         """
         url: str = f"{api_base_url_v1}/user/subscription"
-        resp: dict[str, Any] = API.get(url=url, api_key=token).json()
+        with cls.token_deadline.deadline() as timeout:
+            resp: dict[str, Any] = cls.breaker.call(
+                API.get, url=url, api_key=token, timeout=timeout, slow_after=config.BREAKER_SLOW_SECONDS
+            ).json()
         sub_info: Subscription = Subscription(**resp)
         return sub_info.character_count, sub_info.character_limit, sub_info.next_character_count_reset_unix
 
+    @staticmethod
+    def _stream(  # pylint: disable=R0913
+        token: str,
+        text: str,
+        voice: Voice,
+        model: str,
+        latency: int,
+        output_format: str,
+        timeout: float,
+    ) -> Iterator[bytes]:
+        """
+        Post a text to the streaming endpoint and iterate over the audio chunks, like the SDK's `generate` but with a
+        timeout on the connection and on each read, and closing the connection when the iteration stops.
+
+        :param timeout: seconds to connect and between two chunks
+        :return: an iterator of audio chunks
+        """
+        url: str = (
+            f"{api_base_url_v1}/text-to-speech/{voice.voice_id}/stream"
+            f"?optimize_streaming_latency={latency}&output_format={output_format}"
+        )
+        data: dict[str, Any] = {
+            "text": text,
+            "model_id": model,
+            "voice_settings": voice.settings.model_dump() if voice.settings else None,
+        }
+        with closing(API.post(url, json=data, stream=True, api_key=token, timeout=timeout)) as res:
+            yield from (chunk for chunk in res.iter_content(chunk_size=8192) if chunk)
+
     @classmethod
     def generate_audio(  # pylint: disable=R0913
         cls,
@@ -90,6 +174,7 @@ class ElevenLabs:
         similarity: float = 0.5,
         style: float = 0.0,
         speaker_boost: bool = True,
+        output_format: str = "mp3_44100_128",
     ) -> bytes:
         """
         Generate audio
@@ -102,7 +187,104 @@ class ElevenLabs:
         :param similarity: similarity value
         :param style: style value
         :param speaker_boost: use speaker boost value
-        :return: sample rate, audio data
+        :param output_format: ElevenLabs output format, e.g. "mp3_44100_128" or raw "pcm_44100"
+        :return: audio data
+        """
+        key: tuple = normalize_key(
+            "elevenlabs",
+            voice_id,
+            text,
+            account=account_key(token),
+            model=model,
+            stability=stability,
+            similarity=similarity,
+            style=style,
+            speaker_boost=speaker_boost,
+            output_format=output_format,
+        )
+        return cls.coalescer.call(
+            key,
+            cls._generate_audio,
+            token,
+            text,
+            voice_id,
+            model,
+            stability,
+            similarity,
+            style,
+            speaker_boost,
+            output_format,
+        )
+
+    @classmethod
+    def _generate_audio(  # pylint: disable=R0913
+        cls,
+        token: str,
+        text: str,
+        voice_id: str,
+        model: str,
+        stability: float,
+        similarity: float,
+        style: float,
+        speaker_boost: bool,
+        output_format: str,
+    ) -> bytes:
+        """
+        Send a single generate request to ElevenLabs, see `generate_audio`
+
+        The streaming endpoint is used without latency optimization, which produces the same audio as the plain one,
+        so a cancelled request stops between two chunks and ElevenLabs stops generating when the connection closes.
+        """
+        settings = VoiceSettings(
+            stability=stability,
+            similarity_boost=similarity,
+            style=style,
+            use_speaker_boost=speaker_boost,
+        )
+        voice = Voice(voice_id=voice_id, settings=settings)
+        RateLimiter.acquire("elevenlabs")
+        check_cancelled()
+        audio = bytearray()
+        with cls.breaker.guard(synthesis_slo(text)), cls.synthesis_deadline.deadline(len(text)) as timeout:
+            end: float = time.perf_counter() + timeout
+            message: str = f"ElevenLabs did not finish {len(text)} characters in {timeout:.1f}s"
+            try:
+                with closing(cls._stream(token, text, voice, model, 0, output_format, timeout)) as chunks:
+                    for chunk in chunks:
+                        check_cancelled()
+                        if time.perf_counter() > end:
+                            raise DeadlineExceeded(message)
+                        audio += chunk
+            except requests.exceptions.Timeout as e:
+                raise DeadlineExceeded(message) from e
+        return bytes(audio)
+
+    @classmethod
+    def generate_audio_stream(  # pylint: disable=R0913
+        cls,
+        token: str,
+        text: str,
+        voice_id: str,
+        model: str = "eleven_multilingual_v2",
+        stability: float = 0.71,
+        similarity: float = 0.5,
+        style: float = 0.0,
+        speaker_boost: bool = True,
+        latency: int = 1,
+    ) -> Iterator[bytes]:
+        """
+        Generate audio as a chunked stream, chunks are yielded as soon as ElevenLabs sends them
+
+        :param token: API token
+        :param text: text content
+        :param voice_id: voice speaker id
+        :param model: elevenlabs model name
+        :param stability: stability value
+        :param similarity: similarity value
+        :param style: style value
+        :param speaker_boost: use speaker boost value
+        :param latency: streaming latency optimization, 0: off, 4: max, trades quality for time to first audio
+        :return: an iterator of mp3 chunks
         """
         settings = VoiceSettings(
             stability=stability,
@@ -111,8 +293,22 @@ class ElevenLabs:
             use_speaker_boost=speaker_boost,
         )
         voice = Voice(voice_id=voice_id, settings=settings)
-        audio: bytes = generate(text=text, api_key=token, model=model, voice=voice)
-        return audio
+        RateLimiter.acquire("elevenlabs")
+        # no SLO nor total deadline: the duration of a stream includes the time the client takes to consume it, only
+        # the time to the first chunk is learned, and bounds the wait for each chunk
+        timeout: float = cls.stream_deadline.timeout()
+        start: float = time.perf_counter()
+        with cls.breaker.guard():
+            try:
+                with closing(cls._stream(token, text, voice, model, int(latency), "mp3_44100_128", timeout)) as chunks:
+                    for index, chunk in enumerate(chunks):
+                        if index == 0:
+                            cls.stream_deadline.record(time.perf_counter() - start)
+                        check_cancelled()
+                        yield chunk
+            except requests.exceptions.Timeout as e:
+                cls.stream_deadline.record(timeout)
+                raise DeadlineExceeded(f"ElevenLabs did not send audio within {timeout:.1f}s") from e
 
     @classmethod
     def clear_info(cls) -> bool:
@@ -121,6 +317,9 @@ class ElevenLabs:
         """
         if cls.voices_name_list:
             cls.voices_name_list = []
-        if cls.voices_db.all():
-            cls.voices_db.truncate()
-        return (not cls.voices_name_list) and (not cls.voices_db.all())
+        if cls.voices_db:
+            cls.voices_db = {}
+        cls.snapshot_version = None
+        cls.catalog_version += 1
+        SharedStore.drop_snapshot("elevenlabs")
+        return (not cls.voices_name_list) and (not cls.voices_db)
@@ -0,0 +1,35 @@
+"""
+JSON decoding of provider responses
+"""
+
+import json
+from typing import Any, Callable
+
+import config
+from loguru import logger
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def _select_decoder() -> Callable[[bytes | str], Any]:
+    """
+    Pick the JSON decoder configured by `config.JSON_DECODER`.
+
+    :return: a function decoding a JSON document
+    """
+    if config.JSON_DECODER not in ("auto", "json", "orjson"):
+        logger.warning(f"Unknown FREE_TTS_JSON_DECODER {config.JSON_DECODER!r}, using auto")
+    if config.JSON_DECODER == "json":
+        return json.loads
+    if orjson is not None:
+        return orjson.loads
+    if config.JSON_DECODER == "orjson":
+        raise RuntimeError("FREE_TTS_JSON_DECODER=orjson is set but orjson is not installed")
+    return json.loads
+
+
+loads: Callable[[bytes | str], Any] = _select_decoder()
+logger.debug(f"JSON decoder: {loads.__module__}")
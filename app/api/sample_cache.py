@@ -0,0 +1,136 @@
+"""
+Local cache of voice preview samples
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+
+import config
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+
+from .coalescer import RequestCoalescer
+
+
+class SampleCache:
+    """
+    Download each preview sample once over a pooled session and serve it from disk.
+
+    Files are keyed by a hash of their URL, the ETag of the download is kept next to the file so stale samples are
+    revalidated with a conditional request instead of being downloaded again.
+    """
+
+    cache_dir: Path = Path(config.CACHE_DIR, "samples")
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    coalescer = RequestCoalescer("sample-cache")
+    executor = ThreadPoolExecutor(max_workers=config.SAMPLE_PREFETCH_WORKERS, thread_name_prefix="sample-prefetch")
+    selections: Counter = Counter()
+    _lock = threading.Lock()
+    _unsaved: int = 0
+
+    @classmethod
+    def _path(cls, url: str) -> Path:
+        suffix: str = Path(urlparse(url).path).suffix or ".mp3"
+        return cls.cache_dir / f"{hashlib.sha256(url.encode()).hexdigest()[:32]}{suffix}"
+
+    @classmethod
+    def get(cls, url: str) -> str:
+        """
+        Get a local copy of a sample, downloading it on a miss.
+
+        :param url: remote URL of the sample
+        :return: local file path, or the remote URL if the download failed
+        """
+        if not url:
+            return url
+        cls.record_selection(url)
+        try:
+            return str(cls.coalescer.call(url, cls._fetch, url))
+        except (requests.exceptions.RequestException, OSError) as e:
+            logger.error(f"Fail to cache sample {url}: {e}")
+            return url
+
+    @classmethod
+    def _fetch(cls, url: str) -> Path:
+        """
+        Download a sample, or revalidate it once it is older than `SAMPLE_CACHE_MAX_AGE`.
+
+        :param url: remote URL of the sample
+        :return: local file path
+        """
+        path: Path = cls._path(url)
+        etag_path: Path = path.with_suffix(path.suffix + ".etag")
+        headers: dict[str, str] = {}
+        if path.exists():
+            if time.time() - path.stat().st_mtime < config.SAMPLE_CACHE_MAX_AGE:
+                return path
+            if etag_path.exists():
+                headers["If-None-Match"] = etag_path.read_text(encoding="utf-8")
+
+        res: requests.Response = cls.session.get(url, headers=headers, timeout=10)
+        if res.status_code == 304:
+            path.touch()
+            return path
+        res.raise_for_status()
+
+        cls.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path: Path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(res.content)
+        os.replace(tmp_path, path)
+        if etag := res.headers.get("ETag"):
+            etag_path.write_text(etag, encoding="utf-8")
+        logger.debug(f"Cached sample {url}")
+        return path
+
+    @classmethod
+    def record_selection(cls, url: str) -> None:
+        """
+        Count a selection of a sample, the counts drive `prefetch_popular`.
+
+        :param url: remote URL of the sample
+        """
+        with cls._lock:
+            cls.selections[url] += 1
+            cls._unsaved += 1
+            if cls._unsaved < 20:
+                return
+            cls._unsaved = 0
+            counts: dict[str, int] = dict(cls.selections)
+        cls.executor.submit(cls._save_selections, counts)
+
+    @classmethod
+    def _save_selections(cls, counts: dict[str, int]) -> None:
+        cls.cache_dir.mkdir(parents=True, exist_ok=True)
+        (cls.cache_dir / "selections.json").write_text(json.dumps(counts), encoding="utf-8")
+
+    @classmethod
+    def prefetch_popular(cls, top_n: int = config.SAMPLE_PREFETCH_TOP_N) -> None:
+        """
+        Download the most selected samples in the background.
+
+        :param top_n: number of samples to prefetch
+        """
+        selections_path: Path = cls.cache_dir / "selections.json"
+        if selections_path.exists() and not cls.selections:
+            try:
+                cls.selections.update(json.loads(selections_path.read_text(encoding="utf-8")))
+            except ValueError as e:
+                logger.warning(f"Ignore broken sample selections file: {e}")
+        for url, _ in cls.selections.most_common(top_n):
+            cls.executor.submit(cls._prefetch, url)
+
+    @classmethod
+    def _prefetch(cls, url: str) -> None:
+        try:
+            cls.coalescer.call(url, cls._fetch, url)
+        except (requests.exceptions.RequestException, OSError) as e:
+            logger.warning(f"Fail to prefetch sample {url}: {e}")
@@ -0,0 +1,169 @@
+"""
+State shared by every worker process: catalog snapshots and upstream rate limits
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+import config
+from loguru import logger
+
+
+class SharedStore:
+    """
+    SQLite-backed key-value store visible to every worker process of the server.
+
+    Catalog snapshots are stored as the raw upstream payload together with a version (the time they were written), so
+    a worker can tell with a single indexed read whether another worker refreshed or cleared a catalog. That read is
+    done at most once every `SNAPSHOT_CHECK_INTERVAL` seconds per snapshot, changes made by the worker itself are seen
+    at once.
+    """
+
+    db_path: Path = Path(config.SHARED_DB_PATH)
+    _local = threading.local()
+    _versions: dict[str, tuple[float, float | None]] = {}
+
+    @classmethod
+    def connect(cls) -> sqlite3.Connection:
+        """
+        Get the database connection of the current thread.
+        """
+        connection: sqlite3.Connection | None = getattr(cls._local, "connection", None)
+        if connection is None:
+            cls.db_path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(cls.db_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS snapshots (
+                    name TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    version REAL NOT NULL,
+                    expires REAL NOT NULL
+                )"""
+            )
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS rate_limits (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                )"""
+            )
+            cls._local.connection = connection
+        return connection
+
+    @classmethod
+    def version(cls, name: str) -> float | None:
+        """
+        Get the version of a snapshot.
+
+        :param name: snapshot name
+        :return: version, None if there is no valid snapshot
+        """
+        checked: tuple[float, float | None] | None = cls._versions.get(name)
+        if checked is not None and time.monotonic() - checked[0] < config.SNAPSHOT_CHECK_INTERVAL:
+            return checked[1]
+        row: tuple | None = (
+            cls.connect().execute("SELECT version, expires FROM snapshots WHERE name = ?", (name,)).fetchone()
+        )
+        version: float | None = None if row is None or row[1] < time.time() else row[0]
+        cls._versions[name] = (time.monotonic(), version)
+        return version
+
+    @classmethod
+    def load_snapshot(cls, name: str, fetch: Callable[[], bytes]) -> tuple[bytes, float]:
+        """
+        Get a snapshot, fetching and storing it if no worker did it yet.
+
+        :param name: snapshot name
+        :param fetch: function returning the upstream payload
+        :return: payload and version of the snapshot
+        """
+        row: tuple | None = (
+            cls.connect()
+            .execute("SELECT value, version FROM snapshots WHERE name = ? AND expires >= ?", (name, time.time()))
+            .fetchone()
+        )
+        if row is not None:
+            cls._versions[name] = (time.monotonic(), row[1])
+            return bytes(row[0]), row[1]
+        value: bytes = fetch()
+        version: float = time.time()
+        cls.connect().execute(
+            "INSERT OR REPLACE INTO snapshots (name, value, version, expires) VALUES (?, ?, ?, ?)",
+            (name, value, version, version + config.CATALOG_TTL),
+        )
+        cls._versions[name] = (time.monotonic(), version)
+        logger.debug(f"Stored {name} snapshot ({len(value)} bytes)")
+        return value, version
+
+    @classmethod
+    def drop_snapshot(cls, name: str) -> None:
+        """
+        Remove a snapshot, so the next worker needing it fetches it again.
+
+        :param name: snapshot name
+        """
+        cls.connect().execute("DELETE FROM snapshots WHERE name = ?", (name,))
+        cls._versions.pop(name, None)
+
+
+class RateLimiter:
+    """
+    Token bucket per provider shared by every worker process.
+
+    Limits come from `RATE_LIMITS` (requests per second, bursting up to one second worth of requests), providers
+    without a limit are never throttled and never touch the database.
+    """
+
+    @classmethod
+    def acquire(cls, provider: str, timeout: float = 60.0) -> None:
+        """
+        Wait until the provider may receive another request.
+
+        :param provider: provider name
+        :param timeout: maximum number of seconds to wait
+        """
+        rate: float | None = config.RATE_LIMITS.get(provider)
+        if not rate:
+            return
+        deadline: float = time.monotonic() + timeout
+        while True:
+            wait: float = cls._take(provider, rate)
+            if wait <= 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RuntimeError(f"{provider}: rate limit exceeded")
+            time.sleep(wait)
+
+    @classmethod
+    def _take(cls, provider: str, rate: float) -> float:
+        """
+        Take a token from the bucket of a provider.
+
+        :param provider: provider name
+        :param rate: requests per second
+        :return: 0 if a token was taken, otherwise seconds until one is available
+        """
+        connection: sqlite3.Connection = SharedStore.connect()
+        now: float = time.time()
+        burst: float = max(1.0, rate)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row: tuple | None = connection.execute(
+                "SELECT tokens, updated FROM rate_limits WHERE name = ?", (provider,)
+            ).fetchone()
+            tokens: float = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            if tokens >= 1:
+                connection.execute(
+                    "INSERT OR REPLACE INTO rate_limits (name, tokens, updated) VALUES (?, ?, ?)",
+                    (provider, tokens - 1, now),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return 0 if tokens >= 1 else (1 - tokens) / rate
@@ -0,0 +1,42 @@
+"""
+Stage timings of the request running in this context, recorded by whoever handles the request
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+_recorder: ContextVar[Callable[[str, float], None] | None] = ContextVar("stage_recorder", default=None)
+
+
+@contextmanager
+def record_stages(recorder: Callable[[str, float], None]) -> Iterator[None]:
+    """
+    Send the stages timed in this context to a recorder.
+
+    :param recorder: function called with the stage name and its duration in milliseconds
+    """
+    token = _recorder.set(recorder)
+    try:
+        yield
+    finally:
+        _recorder.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a stage of the request running in this context, does nothing outside of a recorded request.
+
+    :param name: stage name, e.g. "decode"
+    """
+    recorder: Callable[[str, float], None] | None = _recorder.get()
+    if recorder is None:
+        yield
+        return
+    start: float = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder(name, (time.perf_counter() - start) * 1000)
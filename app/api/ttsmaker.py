@@ -1,12 +1,105 @@
 """
 API requests of TTSMaker
 """
-from typing import NoReturn
+from dataclasses import dataclass
+from typing import Any, NoReturn
 
+import config
 import requests
 from loguru import logger
-from tinydb import TinyDB, where
-from tinydb.storages import MemoryStorage
+
+from .cancellation import check_cancelled
+from .circuit_breaker import CircuitBreaker, synthesis_slo
+from .coalescer import RequestCoalescer, account_key, normalize_key
+from .deadlines import DeadlineEstimator
+from .json_decoder import loads
+from .shared_store import RateLimiter, SharedStore
+from .timing import stage
+from .voice import TTSMakerVoice
+
+
+@dataclass(slots=True, frozen=True)
+class TokenStatus:
+    """
+    Quota status of a TTSMaker token.
+    """
+
+    max_characters: int
+    used_characters: int
+    available_characters: int
+    remaining_days: float
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> "TokenStatus":
+        """
+        Build a token status from the `token_status` object of a TTSMaker response.
+
+        :param data: decoded JSON object
+        :return: token status
+        """
+        return cls(
+            max_characters=int(data["current_cycle_max_characters"]),
+            used_characters=int(data["current_cycle_characters_used"]),
+            available_characters=int(data["current_cycle_characters_available"]),
+            remaining_days=float(data["remaining_days_to_reset_quota"]),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class TTSMakerResponse:
+    """
+    A TTSMaker API response, decoded once into the fields the API calls use.
+    """
+
+    status: str
+    error_code: str = ""
+    error_details: str = ""
+    audio_file_url: str | None = None
+    token_status: TokenStatus | None = None
+
+    @classmethod
+    def parse(cls, res: requests.Response) -> "TTSMakerResponse":
+        """
+        Decode the body of a TTSMaker response.
+
+        :param res: HTTP response
+        :return: decoded response
+        """
+        with stage("decode"):
+            body: dict[str, Any] = loads(res.content)
+            token_status: dict[str, Any] | None = body.get("token_status")
+            return cls(
+                status=body.get("status", ""),
+                error_code=str(body.get("error_code", "")),
+                error_details=str(body.get("error_details", "")),
+                audio_file_url=body.get("audio_file_url"),
+                token_status=TokenStatus.from_json(token_status) if token_status else None,
+            )
+
+    @property
+    def ok(self) -> bool:
+        """
+        Whether the API reports success.
+        """
+        return self.status == "success"
+
+    @property
+    def error_message(self) -> str:
+        """
+        Error message built from the error payload.
+        """
+        return f"{self.error_code}: {self.error_details}"
+
+    def raise_for_error(self) -> "TTSMakerResponse":
+        """
+        Raise a RuntimeError if the API reports an error.
+
+        :return: the response itself
+        """
+        if not self.ok:
+            logger.error(self.error_message)
+            raise RuntimeError(self.error_message)
+        return self
 
 
 class TTSMaker:
@@ -15,32 +108,81 @@ class TTSMaker:
     """
 
     language_list: list[str] = []
-    voices_db = TinyDB(storage=MemoryStorage)
+    voices_db: dict[int, TTSMakerVoice] = {}
+    catalog_version: int = 0
+    snapshot_version: float | None = None
+    coalescer = RequestCoalescer("ttsmaker")
+    breaker = CircuitBreaker("ttsmaker")
+    voices_deadline = DeadlineEstimator("ttsmaker", "voices")
+    synthesis_deadline = DeadlineEstimator("ttsmaker", "synthesize")
+    token_deadline = DeadlineEstimator("ttsmaker", "token_status")
+
+    @staticmethod
+    def _request(method: str, **kwargs) -> requests.Response:
+        """
+        Send a request, server errors raise so the circuit breaker counts them.
+
+        :param method: HTTP method
+        :return: HTTP response
+        """
+        res: requests.Response = requests.request(method, **kwargs)
+        if res.status_code >= 500:
+            res.raise_for_status()
+        return res
 
     @classmethod
     def get_voice_list(cls, url: str, token: str) -> NoReturn:
         """
-        Get voice information of TTSMaker.
+        Get voice information of TTSMaker, shared with the other worker processes through a snapshot.
 
         :param url: URL of TTSMarker API
         :param token: developer token
         """
         try:
-            params: dict[str, str] = {"token": token}
-            res: requests.Response = requests.get(url=f"https://{url}/v1/get-voice-list", params=params, timeout=5)
-            if res.status_code == 200:
-                if res.json()["status"] == "success":
-                    cls.language_list = res.json()["support_language_list"]
-                    if not cls.voices_db.all():
-                        cls.voices_db.insert_multiple(res.json()["voices_detailed_list"])
-                else:
-                    err_msg: str = f"{res.json()['error_code']}: {res.json()['error_details']}"
-                    logger.error(err_msg)
-                    raise RuntimeError(err_msg)
-        except (requests.exceptions.RequestException, KeyError) as e:
+            data, version = SharedStore.load_snapshot("ttsmaker", lambda: cls._fetch_voice_list(url, token))
+            with stage("decode"):
+                body: dict[str, Any] = loads(data)
+                voices_db: dict[int, TTSMakerVoice] = {
+                    voice.id: voice for voice in map(TTSMakerVoice.from_json, body["voices_detailed_list"])
+                }
+            cls.language_list = body["support_language_list"]
+            cls.voices_db = voices_db
+            cls.snapshot_version = version
+            cls.catalog_version += 1
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
             logger.critical(e)
             raise RuntimeError(e) from e
 
+    @classmethod
+    def _fetch_voice_list(cls, url: str, token: str) -> bytes:
+        """
+        Download the voice list from TTSMaker.
+
+        :param url: URL of TTSMarker API
+        :param token: developer token
+        :return: raw response body
+        """
+        params: dict[str, str] = {"token": token}
+        with cls.voices_deadline.deadline() as timeout:
+            res: requests.Response = cls.breaker.call(
+                cls._request,
+                "get",
+                url=f"https://{url}/v1/get-voice-list",
+                params=params,
+                timeout=timeout,
+                slow_after=config.BREAKER_SLOW_SECONDS,
+            )
+        res.raise_for_status()
+        TTSMakerResponse.parse(res).raise_for_error()
+        return res.content
+
+    @classmethod
+    def is_stale(cls) -> bool:
+        """
+        Whether the voice list has to be (re)loaded, because it was never loaded or another worker refreshed it.
+        """
+        return not cls.voices_db or SharedStore.version("ttsmaker") != cls.snapshot_version
+
     @classmethod
     def get_languages(cls, url: str, token: str) -> list[str]:
         """
@@ -50,7 +192,7 @@ class TTSMaker:
         :param token: developer token
         :return: list of languages
         """
-        if not cls.language_list:
+        if not cls.language_list or cls.is_stale():
             cls.get_voice_list(url, token)
         return cls.language_list
 
@@ -64,10 +206,10 @@ class TTSMaker:
         :param language: user selected language
         :return: a list of multiple tuples consisting of names and ids
         """
-        if not cls.voices_db.all():
+        if cls.is_stale():
             cls.get_voice_list(url, token)
         voices_list: list[tuple[str, int]] = [
-            (voice_info["name"], voice_info["id"]) for voice_info in cls.voices_db.search(where("language") == language)
+            (voice.name, voice.id) for voice in cls.voices_db.values() if voice.language == language
         ]
         return voices_list
 
@@ -81,17 +223,11 @@ class TTSMaker:
         :param voice_id: ID of voice selected by user
         :return: a tuple of informations
         """
-        if not cls.voices_db.all():
+        if cls.is_stale():
             cls.get_voice_list(url, token)
         try:
-            voice_info: list[dict[str, int | str | bool]] = cls.voices_db.search(where("id") == voice_id)
-            assert len(voice_info) == 1
-            return (
-                "Male" if voice_info[0]["gender"] == 1 else "Female",
-                voice_info[0]["is_need_queue"],
-                voice_info[0]["text_characters_limit"],
-                voice_info[0]["audio_sample_file_url"],
-            )
+            voice: TTSMakerVoice = cls.voices_db[voice_id]
+            return voice.gender, voice.is_need_queue, voice.text_characters_limit, voice.audio_sample_file_url
         except KeyError as e:
             logger.error(e)
             raise RuntimeError(e) from e
@@ -123,6 +259,47 @@ class TTSMaker:
                                           all pauses will be canceled automatically, defaults to 0
         :return: URL of generated audio
         """
+        key: tuple = normalize_key(
+            "ttsmaker",
+            voice_id,
+            text,
+            account=account_key(token),
+            url=url,
+            audio_format=audio_format,
+            audio_speed=float(audio_speed),
+            audio_volume=float(audio_volume),
+            text_paragraph_pause_time=int(text_paragraph_pause_time),
+        )
+        return cls.coalescer.call(
+            key,
+            cls._create_tts_order,
+            url,
+            token,
+            text,
+            voice_id,
+            audio_format,
+            audio_speed,
+            audio_volume,
+            text_paragraph_pause_time,
+        )
+
+    @classmethod
+    def _create_tts_order(  # pylint: disable=R0913
+        cls,
+        url: str,
+        token: str,
+        text: str,
+        voice_id: int,
+        audio_format: str,
+        audio_speed: float,
+        audio_volume: float,
+        text_paragraph_pause_time: int,
+    ) -> str | None:
+        """
+        Send a single create-tts-order request, see `create_tts_order`
+        """
+        RateLimiter.acquire("ttsmaker")
+        check_cancelled()
         try:
             headers: dict[str, str] = {"Content-Type": "application/json; charset=utf-8"}
             params: dict[str, int | float | str] = {
@@ -134,48 +311,46 @@ class TTSMaker:
                 "audio_volume": audio_volume,
                 "text_paragraph_pause_time": text_paragraph_pause_time,
             }
-            res: requests.Response = requests.post(
-                url=f"https://{url}/v1/create-tts-order",
-                headers=headers,
-                json=params,
-                timeout=5,
-            )
+            with cls.synthesis_deadline.deadline(len(text)) as timeout:
+                res: requests.Response = cls.breaker.call(
+                    cls._request,
+                    "post",
+                    url=f"https://{url}/v1/create-tts-order",
+                    headers=headers,
+                    json=params,
+                    timeout=timeout,
+                    slow_after=synthesis_slo(text),
+                )
             if res.status_code == 200:
-                if res.json()["status"] == "success":
-                    return res.json()["audio_file_url"]
-                err_msg: str = f"{res.json()['error_code']}: {res.json()['error_details']}"
-                logger.error(err_msg)
-                raise RuntimeError(err_msg)
-        except requests.exceptions.RequestException as e:
+                return TTSMakerResponse.parse(res).raise_for_error().audio_file_url
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
             logger.critical(e)
             raise RuntimeError(e) from e
         return None
 
     @classmethod
-    def get_token_status(cls, url: str, token: str) -> tuple[int, int, int, float] | None:
+    def get_token_status(cls, url: str, token: str) -> TokenStatus | None:
         """
         Get token information
 
         :param url: URL of TTSMaker API
         :param token: developer token
-        :return: a tuple of token status
+        :return: token status
         """
         try:
             params: dict[str, str] = {"token": token}
-            res: requests.Response = requests.get(url=f"https://{url}/v1/get-token-status", params=params, timeout=5)
+            with cls.token_deadline.deadline() as timeout:
+                res: requests.Response = cls.breaker.call(
+                    cls._request,
+                    "get",
+                    url=f"https://{url}/v1/get-token-status",
+                    params=params,
+                    timeout=timeout,
+                    slow_after=config.BREAKER_SLOW_SECONDS,
+                )
             if res.status_code == 200:
-                if res.json()["status"] == "success":
-                    token_status: dict[str, int | float] = res.json()["token_status"]
-                    return (
-                        token_status["current_cycle_max_characters"],
-                        token_status["current_cycle_characters_used"],
-                        token_status["current_cycle_characters_available"],
-                        token_status["remaining_days_to_reset_quota"],
-                    )
-                err_msg: str = f"{res.json()['error_code']}: {res.json()['error_details']}"
-                logger.error(err_msg)
-                raise RuntimeError(err_msg)
-        except requests.exceptions.RequestException as e:
+                return TTSMakerResponse.parse(res).raise_for_error().token_status
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
             logger.critical(e)
             raise RuntimeError(e) from e
         return None
@@ -187,6 +362,9 @@ class TTSMaker:
         """
         if cls.language_list:
             cls.language_list = []
-        if cls.voices_db.all():
-            cls.voices_db.truncate()
-        return (not cls.language_list) and (not cls.voices_db.all())
+        if cls.voices_db:
+            cls.voices_db = {}
+        cls.snapshot_version = None
+        cls.catalog_version += 1
+        SharedStore.drop_snapshot("ttsmaker")
+        return (not cls.language_list) and (not cls.voices_db)
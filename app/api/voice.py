@@ -0,0 +1,204 @@
+"""
+Compact voice records shared by the provider catalogs
+"""
+
+import sys
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import Any, Iterable
+
+
+def intern_str(value: Any) -> str:
+    """
+    Intern a catalog string so repeated values (locales, genders, categories...) share one object.
+
+    :param value: raw value, None becomes an empty string
+    :return: interned string
+    """
+    return sys.intern(str(value)) if value is not None else ""
+
+
+@dataclass(slots=True, frozen=True)
+class EdgeVoice:
+    """
+    A voice of edge-tts
+    """
+
+    short_name: str
+    friendly_name: str
+    locale: str
+    gender: str
+    categories: tuple[str, ...]
+    personalities: tuple[str, ...]
+    categories_text: str
+    personalities_text: str
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> "EdgeVoice":
+        """
+        Build a record from an entry of the Bing voice list.
+
+        :param data: voice entry
+        :return: voice record
+        """
+        tags: dict[str, list[str]] = data.get("VoiceTag") or {}
+        categories: tuple[str, ...] = tuple(intern_str(tag) for tag in tags.get("ContentCategories", ()))
+        personalities: tuple[str, ...] = tuple(intern_str(tag) for tag in tags.get("VoicePersonalities", ()))
+        return cls(
+            short_name=data["ShortName"],
+            friendly_name=data["FriendlyName"],
+            locale=intern_str(data["Locale"]),
+            gender=intern_str(data["Gender"]),
+            categories=categories,
+            personalities=personalities,
+            categories_text=intern_str(", ".join(categories)),
+            personalities_text=intern_str(", ".join(personalities)),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class EdgeCatalog:
+    """
+    Voice catalog of edge-tts, with every view the UI needs derived in a single pass over the voice list
+    """
+
+    voices: dict[str, EdgeVoice]
+    locales: list[str]
+    choices: dict[str, list[tuple[str, str]]]
+    facets: dict[tuple[str, str], frozenset[str]]
+
+    @classmethod
+    def build(cls, entries: Iterable[dict[str, Any]]) -> "EdgeCatalog":
+        """
+        Build the catalog from the Bing voice list.
+
+        :param entries: voice entries
+        :return: voice catalog
+        """
+        voices: dict[str, EdgeVoice] = {}
+        grouped: dict[str, list[EdgeVoice]] = {}
+        facets: dict[tuple[str, str], set[str]] = {}
+        for entry in entries:
+            voice: EdgeVoice = EdgeVoice.from_json(entry)
+            voices[voice.short_name] = voice
+            grouped.setdefault(voice.locale, []).append(voice)
+            facets.setdefault(("gender", voice.gender), set()).add(voice.short_name)
+            for category in voice.categories:
+                facets.setdefault(("category", category), set()).add(voice.short_name)
+        by_name = attrgetter("friendly_name")
+        return cls(
+            voices=voices,
+            locales=sorted(grouped),
+            choices={
+                locale: [(voice.friendly_name, voice.short_name) for voice in sorted(group, key=by_name)]
+                for locale, group in grouped.items()
+            },
+            facets={key: frozenset(names) for key, names in facets.items()},
+        )
+
+    def facet_values(self, facet: str) -> list[str]:
+        """
+        Get the sorted values of a facet.
+
+        :param facet: "gender" or "category"
+        :return: facet values
+        """
+        return sorted(value for name, value in self.facets if name == facet)
+
+    def get_choices(self, locale: str, gender: str | None = None, category: str | None = None) -> list[tuple[str, str]]:
+        """
+        Get dropdown choices of a locale, optionally narrowed by facets.
+
+        :param locale: language code
+        :param gender: only keep voices of this gender
+        :param category: only keep voices tagged with this content category
+        :return: a list of tuples containing the friendly name and short name of the voices
+        """
+        choices: list[tuple[str, str]] = self.choices.get(locale, [])
+        selected: list[frozenset[str]] = [
+            self.facets.get((facet, value), frozenset())
+            for facet, value in (("gender", gender), ("category", category))
+            if value
+        ]
+        if not selected:
+            return choices
+        return [choice for choice in choices if all(choice[1] in names for names in selected)]
+
+
+@dataclass(slots=True, frozen=True)
+class ElevenLabsVoice:  # pylint: disable=R0902
+    """
+    A voice of ElevenLabs
+    """
+
+    voice_id: str
+    name: str
+    gender: str
+    accent: str
+    age: str
+    description: str
+    use_case: str
+    preview_url: str
+
+    @classmethod
+    def from_sdk(cls, voice: Any) -> "ElevenLabsVoice":
+        """
+        Build a record from an `elevenlabs.Voice`, keeping only the displayed fields.
+
+        :param voice: voice object of the SDK
+        :return: voice record
+        """
+        labels: dict[str, str] = voice.labels or {}
+        return cls(
+            voice_id=voice.voice_id,
+            name=voice.name,
+            gender=intern_str(labels.get("gender")),
+            accent=intern_str(labels.get("accent")),
+            age=intern_str(labels.get("age")),
+            description=intern_str(labels.get("description")),
+            use_case=intern_str(labels.get("use case")),
+            preview_url=voice.preview_url or "",
+        )
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> "ElevenLabsVoice":
+        """
+        Rebuild a record from its serialized fields, e.g. a catalog snapshot.
+
+        :param data: record fields
+        :return: voice record
+        """
+        return cls(**{name: intern_str(value) for name, value in data.items()})
+
+
+@dataclass(slots=True, frozen=True)
+class TTSMakerVoice:
+    """
+    A voice of TTSMaker
+    """
+
+    id: int  # pylint: disable=C0103
+    name: str
+    language: str
+    gender: str
+    is_need_queue: bool
+    text_characters_limit: int
+    audio_sample_file_url: str
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> "TTSMakerVoice":
+        """
+        Build a record from an entry of `voices_detailed_list`.
+
+        :param data: voice entry
+        :return: voice record
+        """
+        return cls(
+            id=data["id"],
+            name=data["name"],
+            language=intern_str(data["language"]),
+            gender=intern_str("Male" if data["gender"] == 1 else "Female"),
+            is_need_queue=data["is_need_queue"],
+            text_characters_limit=data["text_characters_limit"],
+            audio_sample_file_url=data["audio_sample_file_url"],
+        )
@@ -0,0 +1,155 @@
+"""
+Runtime settings, every value can be overridden by an environment variable of the same name prefixed with `FREE_TTS_`
+"""
+
+import os
+from pathlib import Path
+
+
+def _env(name: str, default: str) -> str:
+    return os.environ.get(f"FREE_TTS_{name}", default)
+
+
+# "auto" uses orjson when it is installed, "orjson" requires it, "json" always uses the standard library
+JSON_DECODER: str = _env("JSON_DECODER", "auto")
+
+# root directory of every on-disk cache
+CACHE_DIR: str = _env("CACHE_DIR", os.path.join(Path().resolve(), "cache"))
+
+# voice preview samples: seconds before a cached sample is revalidated, how many of the most selected samples are
+# prefetched at startup and how many threads download them
+SAMPLE_CACHE_MAX_AGE: int = int(_env("SAMPLE_CACHE_MAX_AGE", "86400"))
+SAMPLE_PREFETCH_TOP_N: int = int(_env("SAMPLE_PREFETCH_TOP_N", "20"))
+SAMPLE_PREFETCH_WORKERS: int = int(_env("SAMPLE_PREFETCH_WORKERS", "2"))
+
+# audio transcoding: ffmpeg binary and number of ffmpeg processes running at once
+FFMPEG_BINARY: str = _env("FFMPEG_BINARY", "ffmpeg")
+TRANSCODE_WORKERS: int = int(_env("TRANSCODE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# synthesized audio store: directory and size budget in bytes
+AUDIO_STORE_DIR: str = _env("AUDIO_STORE_DIR", os.path.join(CACHE_DIR, "audio"))
+AUDIO_STORE_MAX_BYTES: int = int(_env("AUDIO_STORE_MAX_BYTES", str(2 * 1024**3)))
+
+# persistent synthesis jobs: database, worker threads per provider, texts longer than JOB_BATCH_THRESHOLD characters
+# are batch jobs which may use at most JOB_BATCH_SHARE of a provider's workers, retries use exponential backoff,
+# finished jobs are deleted after JOB_RETENTION seconds, checked every JOB_SWEEP_INTERVAL seconds
+JOB_DB_PATH: str = _env("JOB_DB_PATH", os.path.join(CACHE_DIR, "jobs.sqlite3"))
+JOB_WORKERS: dict[str, int] = {
+    provider: int(count)
+    for provider, count in (
+        item.split("=") for item in _env("JOB_WORKERS", "edge-tts=4,elevenlabs=2,ttsmaker=2").split(",") if item
+    )
+}
+JOB_BATCH_THRESHOLD: int = int(_env("JOB_BATCH_THRESHOLD", "2000"))
+JOB_BATCH_SHARE: float = float(_env("JOB_BATCH_SHARE", "0.5"))
+JOB_MAX_ATTEMPTS: int = int(_env("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF: float = float(_env("JOB_RETRY_BACKOFF", "2.0"))
+JOB_RETENTION: float = float(_env("JOB_RETENTION", str(7 * 24 * 3600)))
+JOB_SWEEP_INTERVAL: float = float(_env("JOB_SWEEP_INTERVAL", "3600"))
+
+# multi-process serving: number of worker processes behind the public port, state shared between them (catalog
+# snapshots kept for CATALOG_TTL seconds, audio store index, rate limits) lives in SHARED_DB_PATH, workers check
+# whether another worker replaced a snapshot at most every SNAPSHOT_CHECK_INTERVAL seconds
+WORKERS: int = int(_env("WORKERS", "1"))
+HOST: str = _env("HOST", "127.0.0.1")
+PORT: int = int(_env("PORT", "7860"))
+SHARED_DB_PATH: str = _env("SHARED_DB_PATH", os.path.join(CACHE_DIR, "shared.sqlite3"))
+CATALOG_TTL: int = int(_env("CATALOG_TTL", "86400"))
+SNAPSHOT_CHECK_INTERVAL: float = float(_env("SNAPSHOT_CHECK_INTERVAL", "5"))
+
+# upstream requests per second allowed per provider, across all worker processes; providers not listed are unlimited
+RATE_LIMITS: dict[str, float] = {
+    provider: float(rate)
+    for provider, rate in (
+        item.split("=") for item in _env("RATE_LIMITS", "elevenlabs=2,ttsmaker=2").split(",") if item
+    )
+}
+
+# seconds a cached token status is served before it is refreshed in the background
+TOKEN_STATUS_TTL: int = int(_env("TOKEN_STATUS_TTL", "60"))
+# token statuses kept in memory per worker, the least recently read ones are dropped beyond it
+TOKEN_STATUS_MAX_ENTRIES: int = int(_env("TOKEN_STATUS_MAX_ENTRIES", "1024"))
+
+# text normalization before synthesis: Unicode normalization form (empty to disable), whitespace collapsing,
+# replacement of typographic quotes by plain ones and collapsing of repeated exclamation and question marks
+TEXT_UNICODE_FORM: str = _env("TEXT_UNICODE_FORM", "NFC")
+TEXT_COLLAPSE_WHITESPACE: bool = _env("TEXT_COLLAPSE_WHITESPACE", "1") == "1"
+TEXT_PLAIN_QUOTES: bool = _env("TEXT_PLAIN_QUOTES", "1") == "1"
+TEXT_COLLAPSE_PUNCTUATION: bool = _env("TEXT_COLLAPSE_PUNCTUATION", "1") == "1"
+
+# incremental synthesis: sentences of one text synthesized concurrently by edge-tts
+SEGMENT_CONCURRENCY: int = int(_env("SEGMENT_CONCURRENCY", "4"))
+
+# edge-tts script mode: lines synthesized concurrently, default seconds of silence between two lines
+SCRIPT_CONCURRENCY: int = int(_env("SCRIPT_CONCURRENCY", "16"))
+SCRIPT_GAP: float = float(_env("SCRIPT_GAP", "0.4"))
+
+# structured request logs: directory of the JSON lines files, share of successful requests written, requests slower
+# than REQUEST_LOG_SLOW_MS milliseconds and failed requests are always written, synthesized texts and settings are only
+# written with REQUEST_LOG_TEXT
+REQUEST_LOG_DIR: str = _env("REQUEST_LOG_DIR", os.path.join(Path().resolve(), "logs"))
+REQUEST_LOG_SAMPLE_RATE: float = float(_env("REQUEST_LOG_SAMPLE_RATE", "1.0"))
+REQUEST_LOG_SLOW_MS: float = float(_env("REQUEST_LOG_SLOW_MS", "5000"))
+REQUEST_LOG_TEXT: bool = _env("REQUEST_LOG_TEXT", "0") == "1"
+
+# circuit breakers: consecutive failures or slow calls opening a provider's breaker, seconds before it is probed
+# again, latency SLO of catalog and status calls, synthesis calls get one more second per BREAKER_SLOW_CHARS_PER_SECOND
+# characters
+BREAKER_FAILURES: int = int(_env("BREAKER_FAILURES", "5"))
+BREAKER_RESET_TIMEOUT: float = float(_env("BREAKER_RESET_TIMEOUT", "30"))
+BREAKER_SLOW_SECONDS: float = float(_env("BREAKER_SLOW_SECONDS", "10"))
+BREAKER_SLOW_CHARS_PER_SECOND: float = float(_env("BREAKER_SLOW_CHARS_PER_SECOND", "20"))
+
+# adaptive deadlines of the provider calls: DEADLINE_FACTOR times the duration predicted from the last DEADLINE_WINDOW
+# calls of the same operation, scaled by the DEADLINE_PERCENTILE of the observed to predicted ratio, within
+# DEADLINE_MIN-DEADLINE_MAX seconds. Until DEADLINE_MIN_SAMPLES calls are known, the deadline is DEADLINE_DEFAULT
+# seconds plus one second per DEADLINE_DEFAULT_CHARS_PER_SECOND characters of text
+DEADLINE_WINDOW: int = int(_env("DEADLINE_WINDOW", "200"))
+DEADLINE_MIN_SAMPLES: int = int(_env("DEADLINE_MIN_SAMPLES", "10"))
+DEADLINE_PERCENTILE: float = float(_env("DEADLINE_PERCENTILE", "0.99"))
+DEADLINE_FACTOR: float = float(_env("DEADLINE_FACTOR", "2"))
+DEADLINE_MIN: float = float(_env("DEADLINE_MIN", "1"))
+DEADLINE_MAX: float = float(_env("DEADLINE_MAX", "600"))
+DEADLINE_DEFAULT: float = float(_env("DEADLINE_DEFAULT", "15"))
+DEADLINE_DEFAULT_CHARS_PER_SECOND: float = float(_env("DEADLINE_DEFAULT_CHARS_PER_SECOND", "10"))
+
+# seconds between checks whether the client of a running synthesis request is still connected
+CANCEL_POLL_INTERVAL: float = float(_env("CANCEL_POLL_INTERVAL", "0.5"))
+
+# Gradio concurrency lanes: catalog, voice info and token events share the METADATA_CONCURRENCY lane so they never wait
+# behind synthesis, synthesis events of each provider share a lane of SYNTHESIS_CONCURRENCY events (providers not listed
+# get SYNTHESIS_CONCURRENCY_DEFAULT), job submission and following share the JOB_CONCURRENCY lane
+METADATA_CONCURRENCY: int = int(_env("METADATA_CONCURRENCY", "32"))
+SYNTHESIS_CONCURRENCY: dict[str, int] = {
+    provider: int(limit)
+    for provider, limit in (
+        item.split("=")
+        for item in _env("SYNTHESIS_CONCURRENCY", "edge-tts=8,elevenlabs=4,ttsmaker=4").split(",")
+        if item
+    )
+}
+SYNTHESIS_CONCURRENCY_DEFAULT: int = int(_env("SYNTHESIS_CONCURRENCY_DEFAULT", "4"))
+JOB_CONCURRENCY: int = int(_env("JOB_CONCURRENCY", "16"))
+
+# opt-in profiling: share of requests profiled, header asking to profile a request (empty to ignore headers), output
+# directory, stack sampling interval in seconds, frames kept per allocation and lines of the logged summary
+PROFILE_SAMPLE_RATE: float = float(_env("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER: str = _env("PROFILE_HEADER", "x-free-tts-profile")
+PROFILE_DIR: str = _env("PROFILE_DIR", os.path.join(Path().resolve(), "profiles"))
+PROFILE_INTERVAL: float = float(_env("PROFILE_INTERVAL", "0.005"))
+PROFILE_TRACEBACK: int = int(_env("PROFILE_TRACEBACK", "10"))
+PROFILE_TOP: int = int(_env("PROFILE_TOP", "15"))
+
+# cache warming: the WARMUP_TOP_N most requested prompts, mined from the request log (needs REQUEST_LOG_TEXT) or read
+# from the WARMUP_PROMPTS JSON lines file, are synthesized into the cache at startup and/or every day at WARMUP_HOUR
+# (local time, empty to disable). Each run spends at most WARMUP_BUDGETS characters per provider, providers not listed
+# are not warmed, ElevenLabs needs a token of its own
+WARMUP_TOP_N: int = int(_env("WARMUP_TOP_N", "300"))
+WARMUP_PROMPTS: str = _env("WARMUP_PROMPTS", "")
+WARMUP_BUDGETS: dict[str, int] = {
+    provider: int(budget)
+    for provider, budget in (item.split("=") for item in _env("WARMUP_BUDGETS", "edge-tts=200000").split(",") if item)
+}
+WARMUP_ON_START: bool = _env("WARMUP_ON_START", "1") == "1"
+WARMUP_HOUR: str = _env("WARMUP_HOUR", "")
+WARMUP_ELEVENLABS_TOKEN: str = _env("WARMUP_ELEVENLABS_TOKEN", "")
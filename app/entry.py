@@ -1,24 +1,80 @@
 """
 Project entry file
 """
+import argparse
 import os
 from pathlib import Path
 
+import config
+from api import SampleCache
+from logic.job_queue import JobQueue
+from logic.providers import register_providers
+from logic.warmup import CacheWarmer
 from loguru import logger
-from web import ui
+from web import register_audio_routes, register_job_routes, register_metrics_routes, register_voice_routes, ui
+from workers import run_workers
 
+logger.configure(extra={"request_id": "-"})
 logger.add(
     sink=os.path.join(Path().resolve(), "logs", "{time:YYYY-MM-DD}.log"),
-    format="{time:YYYY-MM-DD HH:mm::ss} | {level} | {name} | {file.path}:{line} | {function} | {message}",
+    format="{time:YYYY-MM-DD HH:mm::ss} | {level} | {extra[request_id]} | {name} | {file.path}:{line} | {function} | "
+    "{message}",
     encoding="utf-8",
     enqueue=True,
     rotation="00:00",
     retention="1 week",
 )
 
-if __name__ == "__main__":
+
+def start(host: str, port: int, worker: int | None = None) -> None:
+    """
+    Start serving the web UI from this process, without blocking.
+
+    :param host: host to listen on
+    :param port: port to listen on
+    :param worker: index of the worker when running behind `run_workers`
+    """
+    register_providers()
+    if not worker:
+        SampleCache.prefetch_popular()
+        CacheWarmer.start()
+    JobQueue.start(recover=worker is None)
     ui.queue().launch(
-        inbrowser=True,
+        server_name=host,
+        server_port=port,
+        inbrowser=worker is None,
         show_api=False,
         share=False,
+        prevent_thread_lock=True,
+        # threads of the synchronous handlers, metadata events must always find one
+        max_threads=config.METADATA_CONCURRENCY + config.JOB_CONCURRENCY + sum(config.SYNTHESIS_CONCURRENCY.values()),
     )
+    register_audio_routes(ui.server_app)
+    register_job_routes(ui.server_app)
+    register_metrics_routes(ui.server_app)
+    register_voice_routes(ui.server_app)
+
+
+def serve(host: str, port: int, worker: int | None = None) -> None:
+    """
+    Serve the web UI from this process.
+
+    :param host: host to listen on
+    :param port: port to listen on
+    :param worker: index of the worker when running behind `run_workers`
+    """
+    start(host, port, worker)
+    ui.block_thread()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=config.WORKERS, help="number of worker processes")
+    parser.add_argument("--host", default=config.HOST, help="host to listen on")
+    parser.add_argument("--port", type=int, default=config.PORT, help="port to listen on")
+    parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker is None and args.workers > 1:
+        run_workers(args.workers, args.host, args.port)
+    else:
+        serve(args.host, args.port, args.worker)
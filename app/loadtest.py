@@ -0,0 +1,384 @@
+"""
+Load test of the web UI: simulated users drive the Gradio events against mocked providers
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Iterator
+
+# the mocked run keeps its caches, jobs and request logs away from the real ones
+TEMP_DIR: str | None = None
+if "FREE_TTS_CACHE_DIR" not in os.environ:
+    TEMP_DIR = os.environ["FREE_TTS_CACHE_DIR"] = tempfile.mkdtemp(prefix="free-tts-loadtest-")
+os.environ.setdefault("FREE_TTS_REQUEST_LOG_DIR", os.path.join(os.environ["FREE_TTS_CACHE_DIR"], "logs"))
+os.environ.setdefault("FREE_TTS_WARMUP_ON_START", "0")
+
+# pylint: disable=C0413
+import config  # noqa: E402
+import edge_tts  # noqa: E402
+import gradio_client.client  # noqa: E402
+import requests  # noqa: E402
+from gradio_client import Client  # noqa: E402
+from gradio_client.utils import JobStatus, Status, StatusUpdate  # noqa: E402
+from loguru import logger  # noqa: E402
+
+# one silent MPEG-1 Layer III frame, 128 kbps, 44.1 kHz, 26 ms
+SILENT_FRAME: bytes = bytes.fromhex("fffb9064") + bytes(413)
+
+PROMPTS: list[str] = [
+    "Hello world.",
+    "Welcome back! Your order has shipped and should arrive on Tuesday.",
+    "The quick brown fox jumps over the lazy dog.",
+    "Please hold, your call is important to us. A representative will be with you shortly.",
+    "In the beginning the universe was created. This has made a lot of people very angry and been widely regarded "
+    "as a bad move. Many were increasingly of the opinion that they had all made a big mistake in coming down from "
+    "the trees in the first place.",
+]
+
+
+@dataclass
+class MockProviders:  # pylint: disable=R0902
+    """
+    Providers answering locally, with a fixed latency plus a synthesis time growing with the text length.
+    """
+
+    latency: float = 0.2
+    characters_per_second: float = 200.0
+    locales: int = 5
+    voices_per_locale: int = 10
+    edge_voices: list[dict[str, Any]] = field(default_factory=list)
+    elevenlabs_voices: list[dict[str, Any]] = field(default_factory=list)
+    ttsmaker_voices: list[dict[str, Any]] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        for i in range(self.locales):
+            locale: str = f"xx-L{i}"
+            for j in range(self.voices_per_locale):
+                self.edge_voices.append(
+                    {
+                        "ShortName": f"{locale}-Voice{j}Neural",
+                        "FriendlyName": f"Mock Voice {j} ({locale})",
+                        "Locale": locale,
+                        "Gender": "Female" if j % 2 else "Male",
+                        "VoiceTag": {"ContentCategories": ["General"], "VoicePersonalities": ["Friendly"]},
+                    }
+                )
+                self.ttsmaker_voices.append(
+                    {
+                        "id": i * 1000 + j,
+                        "name": f"Mock {j}",
+                        "language": locale,
+                        "gender": 1 + j % 2,
+                        "is_need_queue": False,
+                        "text_characters_limit": 5000,
+                        "audio_sample_file_url": f"https://mock.ttsmaker/{i}/{j}.mp3",
+                    }
+                )
+        self.elevenlabs_voices = [
+            {
+                "voice_id": f"mock{j}",
+                "name": f"Mock {j}",
+                "gender": "female",
+                "accent": "american",
+                "age": "young",
+                "description": "calm",
+                "use_case": "narration",
+                "preview_url": f"https://mock.elevenlabs/{j}.mp3",
+            }
+            for j in range(self.voices_per_locale)
+        ]
+
+    def synthesis_time(self, text: str) -> float:
+        """
+        Time a mocked provider takes to synthesize a text.
+        """
+        return self.latency + len(text) / self.characters_per_second
+
+    @staticmethod
+    def audio(text: str) -> bytes:
+        """
+        Silent MP3 about as long as the text would take to read.
+        """
+        return SILENT_FRAME * max(1, len(text) * 3)
+
+    def install(self) -> None:
+        """
+        Replace the network calls of the provider APIs, the rest of the request path runs as usual.
+        """
+        # pylint: disable=C0415,W0212
+        from api import EdgeTTS, ElevenLabs, SampleCache, TTSMaker
+
+        mock = self
+
+        class Communicate:  # pylint: disable=R0903
+            """
+            Mocked edge-tts stream.
+            """
+
+            def __init__(self, text: str, _: str) -> None:
+                self.text: str = text
+
+            async def stream(self) -> AsyncIterator[dict[str, Any]]:
+                """
+                Yield the audio in chunks once synthesized.
+                """
+                await asyncio.sleep(mock.synthesis_time(self.text))
+                data: bytes = mock.audio(self.text)
+                for offset in range(0, len(data), 4096):
+                    yield {"type": "audio", "data": data[offset : offset + 4096]}
+
+        def stream(_: str, text: str, *__: Any) -> Iterator[bytes]:
+            time.sleep(mock.synthesis_time(text))
+            data: bytes = mock.audio(text)
+            for offset in range(0, len(data), 8192):
+                yield data[offset : offset + 8192]
+
+        def ttsmaker_request(_: str, url: str, **kwargs: Any) -> requests.Response:
+            body: dict[str, Any] = {"status": "success"}
+            if url.endswith("/get-voice-list"):
+                time.sleep(mock.latency)
+                body["support_language_list"] = sorted({voice["language"] for voice in mock.ttsmaker_voices})
+                body["voices_detailed_list"] = mock.ttsmaker_voices
+            elif url.endswith("/create-tts-order"):
+                text: str = kwargs["json"]["text"]
+                time.sleep(mock.synthesis_time(text))
+                path: str = os.path.join(config.CACHE_DIR, f"ttsmaker-{abs(hash(text))}.mp3")
+                with open(path, "wb") as file:
+                    file.write(mock.audio(text))
+                body["audio_file_url"] = path
+            elif url.endswith("/get-token-status"):
+                time.sleep(mock.latency)
+                body["token_status"] = {
+                    "current_cycle_max_characters": 10**9,
+                    "current_cycle_characters_used": 0,
+                    "current_cycle_characters_available": 10**9,
+                    "remaining_days_to_reset_quota": 30,
+                }
+            res = requests.Response()
+            res.status_code = 200
+            res._content = json.dumps(body).encode()
+            return res
+
+        def fetch(voices: Any) -> Callable[[], bytes]:
+            def run(*_: Any) -> bytes:
+                time.sleep(mock.latency)
+                return json.dumps(voices).encode()
+
+            return run
+
+        edge_tts.Communicate = Communicate
+        ElevenLabs._stream = staticmethod(stream)
+        EdgeTTS._fetch_voice_list = staticmethod(fetch(self.edge_voices))
+        EdgeTTS.breaker.probe = EdgeTTS._fetch_voice_list
+        ElevenLabs._fetch_voice_list = staticmethod(fetch(self.elevenlabs_voices))
+        TTSMaker._request = staticmethod(ttsmaker_request)
+        sample: Path = Path(config.CACHE_DIR) / "sample.mp3"
+        sample.write_bytes(self.audio(PROMPTS[0]))
+        SampleCache._fetch = staticmethod(lambda _: sample)
+
+
+class TimedJobStatus(JobStatus):
+    """
+    Status of a client job, remembering when the server queued it (its first estimation message) and when it started
+    processing it, so the queue wait leaves out the client's connection setup.
+    """
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name == "latest_status" and isinstance(value, StatusUpdate):
+            if value.code == Status.IN_QUEUE and "queued" not in self.__dict__:
+                object.__setattr__(self, "queued", time.perf_counter())
+            elif value.code in (Status.PROCESSING, Status.ITERATING) and "started" not in self.__dict__:
+                object.__setattr__(self, "started", time.perf_counter())
+        super().__setattr__(name, value)
+
+
+gradio_client.client.JobStatus = TimedJobStatus
+
+
+@dataclass
+class Sample:
+    """
+    Timings of one event.
+    """
+
+    event: str
+    queue_wait: float
+    handler: float
+    error: bool
+
+
+class User:
+    """
+    A simulated user going through a tab: language and voice dropdowns, voice selection, then synthesis.
+    """
+
+    def __init__(self, url: str, mock: MockProviders, events: dict[str, int], args: argparse.Namespace) -> None:
+        self.client = Client(url, verbose=False)
+        self.mock: MockProviders = mock
+        self.events: dict[str, int] = events
+        self.args: argparse.Namespace = args
+        self.random = random.Random()
+
+    def call(self, name: str, *inputs: Any) -> Sample:
+        """
+        Trigger an event and wait for its result.
+
+        :param name: name of the event handler
+        :param inputs: values of the event inputs
+        :return: timings of the event, waiting in the queue and running
+        """
+        job = self.client.submit(*inputs, fn_index=self.events[name])
+        try:
+            job.result()
+            error = False
+        except Exception as e:  # pylint: disable=W0718
+            logger.debug(f"{name} failed: {e}")
+            error = True
+        end: float = time.perf_counter()
+        status: dict[str, Any] = job.communicator.job.__dict__
+        started: float = status.get("started", end)
+        return Sample(name, started - status.get("queued", started), end - started, error)
+
+    def think(self) -> None:
+        """
+        Pause like a user between two interactions.
+        """
+        if self.args.think_time > 0:
+            time.sleep(self.random.expovariate(1 / self.args.think_time))
+
+    def session(self, provider: str, text: str) -> Iterator[Sample]:
+        """
+        Go through the tab of a provider once.
+
+        :param provider: provider name
+        :param text: text to synthesize
+        :return: timings of each event
+        """
+        if provider == "edge-tts":
+            voice: dict[str, Any] = self.random.choice(self.mock.edge_voices)
+            yield self.call("get_edgetts_language_code")
+            yield self.call("get_edgetts_voices", voice["Locale"])
+            yield self.call("get_edgetts_single_voice_info", voice["ShortName"])
+            self.think()
+            yield self.call("get_edgetts_audio", text, voice["ShortName"], "mp3", False, 0)
+        elif provider == "elevenlabs":
+            voice = self.random.choice(self.mock.elevenlabs_voices)
+            yield self.call("get_elevenlabs_voices")
+            yield self.call("get_elevenlabs_single_voice_info", voice["voice_id"])
+            self.think()
+            yield self.call(
+                "get_elevenlabs_audio",
+                "mock-token",
+                text,
+                voice["voice_id"],
+                "eleven_multilingual_v2",
+                0.5,
+                0.75,
+                0.0,
+                True,
+                "mp3",
+                False,
+                0,
+            )
+        else:
+            voice = self.random.choice(self.mock.ttsmaker_voices)
+            url, token, limit = "mock.ttsmaker", "mock-token", voice["text_characters_limit"]
+            yield self.call("get_ttsmaker_languages", url, token)
+            yield self.call("get_ttsmaker_voices", url, token, voice["language"])
+            yield self.call("get_ttsmaker_single_voice_info", url, token, voice["id"], "")
+            yield self.call("refresh_characters_limit", limit, text)
+            self.think()
+            yield self.call("create_tts_order", url, token, text, limit, voice["id"], "mp3", 1.0, 0.0, 0)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    return values[min(len(values) - 1, int(len(values) * q / 100))] if values else 0.0
+
+
+def report(samples: list[Sample], elapsed: float) -> None:
+    """
+    Print queue wait and handler time percentiles, error rate and throughput per event.
+    """
+    print(f"{len(samples)} events in {elapsed:.1f}s, {len(samples) / elapsed:.1f} events/s")
+    print(f"{'event':<34}{'n':>6}{'err%':>7}{'rate/s':>8}  queue p50/p95/p99 ms      handler p50/p95/p99 ms")
+    for name in sorted({sample.event for sample in samples}):
+        group: list[Sample] = [sample for sample in samples if sample.event == name]
+        waits: list[float] = sorted(sample.queue_wait * 1000 for sample in group)
+        handlers: list[float] = sorted(sample.handler * 1000 for sample in group)
+        errors: int = sum(sample.error for sample in group)
+        print(
+            f"{name:<34}{len(group):>6}{errors / len(group):>7.1%}{len(group) / elapsed:>8.2f}  "
+            + "/".join(f"{percentile(waits, q):.0f}" for q in (50, 95, 99)).ljust(26)
+            + "/".join(f"{percentile(handlers, q):.0f}" for q in (50, 95, 99))
+        )
+
+
+def main() -> None:
+    """
+    Start the app with mocked providers and run the simulated users against it.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean pause of a user before synthesizing")
+    parser.add_argument("--mix", default="edge-tts=3,elevenlabs=1,ttsmaker=1", help="weights of the providers")
+    parser.add_argument("--prompts", help="file of prompts, one per line, defaults to a built-in mix of lengths")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds each mocked provider call takes")
+    parser.add_argument("--chars-per-second", type=float, default=200, help="mocked synthesis speed")
+    parser.add_argument("--port", type=int, default=7870, help="port of the app under test")
+    args = parser.parse_args()
+
+    mix: dict[str, float] = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    prompts: list[str] = PROMPTS
+    if args.prompts:
+        with open(args.prompts, encoding="utf-8") as file:
+            prompts = [line.strip() for line in file if line.strip()]
+
+    mock = MockProviders(latency=args.latency, characters_per_second=args.chars_per_second)
+    mock.install()
+    import entry  # pylint: disable=C0415
+
+    entry.start("127.0.0.1", args.port)
+    events: dict[str, int] = {}
+    for index, block_fn in enumerate(entry.ui.fns):
+        events.setdefault(getattr(block_fn.fn, "__name__", ""), index)
+
+    samples: list[Sample] = []
+    lock = threading.Lock()
+    deadline: float = time.perf_counter() + args.duration
+
+    def run_user() -> None:
+        user = User(f"http://127.0.0.1:{args.port}/", mock, events, args)
+        while time.perf_counter() < deadline:
+            provider: str = user.random.choices(list(mix), weights=list(mix.values()))[0]
+            for sample in user.session(provider, user.random.choice(prompts)):
+                with lock:
+                    samples.append(sample)
+            user.think()
+
+    start: float = time.perf_counter()
+    threads: list[threading.Thread] = [threading.Thread(target=run_user, daemon=True) for _ in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(samples, time.perf_counter() - start)
+    entry.ui.close()
+    if TEMP_DIR is not None:
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
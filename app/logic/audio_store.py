@@ -0,0 +1,180 @@
+"""
+On-disk store of synthesized audio
+"""
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+
+import config
+from api.shared_store import SharedStore
+from loguru import logger
+
+
+class AudioStore:
+    """
+    Write each synthesized result once to disk and serve it from there.
+
+    Files are named after the SHA-256 of their content, so identical results share one file. The store keeps an LRU
+    index of file sizes in the shared database, so every worker process sees the same index, and evicts the least
+    recently used files once `AUDIO_STORE_MAX_BYTES` is exceeded, except pinned files such as job results. Reads go
+    through memory maps, so serving a range of a long file never copies the whole file into the worker's memory.
+    """
+
+    directory: Path = Path(config.AUDIO_STORE_DIR)
+    max_bytes: int = config.AUDIO_STORE_MAX_BYTES
+    _ready: bool = False
+
+    @classmethod
+    def _connect(cls) -> sqlite3.Connection:
+        """
+        Get the connection holding the LRU index, shared by every worker process, seeding it from the files on disk.
+        """
+        connection: sqlite3.Connection = SharedStore.connect()
+        if not cls._ready:
+            cls.directory.mkdir(parents=True, exist_ok=True)
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS audio_index (
+                    name TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    used REAL NOT NULL
+                )"""
+            )
+            if "pins" not in {column[1] for column in connection.execute("PRAGMA table_info(audio_index)")}:
+                connection.execute("ALTER TABLE audio_index ADD COLUMN pins INTEGER NOT NULL DEFAULT 0")
+            connection.execute("CREATE INDEX IF NOT EXISTS audio_index_used ON audio_index (used)")
+            if connection.execute("SELECT 1 FROM audio_index LIMIT 1").fetchone() is None:
+                entries: list[os.DirEntry] = [
+                    entry for entry in os.scandir(cls.directory) if entry.is_file() and not entry.name.endswith(".tmp")
+                ]
+                connection.executemany(
+                    "INSERT OR IGNORE INTO audio_index (name, size, used) VALUES (?, ?, ?)",
+                    [(entry.name, entry.stat().st_size, entry.stat().st_atime) for entry in entries],
+                )
+            cls._ready = True
+        return connection
+
+    @classmethod
+    def path(cls, name: str) -> Path:
+        """
+        Get the path of a stored file, marking it as recently used.
+
+        :param name: file name
+        :return: file path
+        """
+        if Path(name).name != name:
+            raise RuntimeError(f"Invalid audio name: {name}")
+        cls._connect().execute("UPDATE audio_index SET used = ? WHERE name = ?", (time.time(), name))
+        return cls.directory / name
+
+    @classmethod
+    def url(cls, location: str) -> str:
+        """
+        Get the public URL of a result: stored files are served by `/audio/{name}`, remote URLs are kept.
+
+        :param location: file path or URL
+        :return: URL
+        """
+        path: Path = Path(location)
+        if path.parent.resolve() == cls.directory.resolve():
+            return f"/audio/{path.name}"
+        return location
+
+    @classmethod
+    def pin(cls, location: str, count: int = 1) -> None:
+        """
+        Keep a stored file from being evicted until it is unpinned as many times, other locations are ignored.
+
+        :param location: file path or URL
+        :param count: 1 to pin, -1 to unpin
+        """
+        path: Path = Path(location)
+        if path.parent.resolve() == cls.directory.resolve():
+            cls._connect().execute("UPDATE audio_index SET pins = MAX(pins + ?, 0) WHERE name = ?", (count, path.name))
+
+    @classmethod
+    def put(cls, audio: bytes | bytearray | memoryview, audio_format: str) -> Path:
+        """
+        Write audio to the store, once per content.
+
+        :param audio: audio data
+        :param audio_format: format of the data, used as file extension
+        :return: file path
+        """
+        name: str = f"{hashlib.sha256(audio).hexdigest()}.{audio_format}"
+        path: Path = cls.path(name)
+        if not path.exists():
+            tmp: Path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            with open(tmp, "wb") as file:
+                file.write(audio)
+            os.replace(tmp, path)
+            cls.add(path)
+        return path
+
+    @classmethod
+    def add(cls, path: Path) -> None:
+        """
+        Register a file written into the store directory by someone else, e.g. a transcoded variant.
+
+        :param path: file path
+        """
+        size: int = path.stat().st_size
+        connection: sqlite3.Connection = cls._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO audio_index (name, size, used) VALUES (?, ?, ?)", (path.name, size, time.time())
+            )
+            total: int = connection.execute("SELECT COALESCE(SUM(size), 0) FROM audio_index").fetchone()[0]
+            evicted: list[str] = []
+            for name, old_size in connection.execute(
+                "SELECT name, size FROM audio_index WHERE name != ? AND pins = 0 ORDER BY used", (path.name,)
+            ):
+                if total <= cls.max_bytes:
+                    break
+                total -= old_size
+                evicted.append(name)
+            connection.executemany("DELETE FROM audio_index WHERE name = ?", [(name,) for name in evicted])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        for name in evicted:
+            (cls.directory / name).unlink(missing_ok=True)
+            logger.debug(f"Evicted {name} from the audio store")
+
+    @classmethod
+    def size(cls, name: str) -> int:
+        """
+        Get the size of a stored file.
+
+        :param name: file name
+        :return: size in bytes
+        """
+        return cls.path(name).stat().st_size
+
+    @classmethod
+    def iter_range(
+        cls, name: str, start: int = 0, end: int | None = None, chunk_size: int = 64 * 1024
+    ) -> Iterator[bytes]:
+        """
+        Read a byte range of a stored file through a memory map.
+
+        :param name: file name
+        :param start: first byte
+        :param end: last byte (inclusive), defaults to the end of the file
+        :param chunk_size: size of the yielded chunks
+        :return: chunks of the range
+        """
+        path: Path = cls.path(name)
+        if path.stat().st_size == 0:
+            return
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            stop: int = len(mapped) if end is None else min(end + 1, len(mapped))
+            for offset in range(start, stop, chunk_size):
+                yield mapped[offset : min(offset + chunk_size, stop)]
@@ -0,0 +1,72 @@
+"""
+Propagate Gradio event cancellation and client disconnects to the provider calls
+"""
+
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import config
+from api.cancellation import CancelToken, cancel_scope
+from gradio.context import LocalContext
+from loguru import logger
+
+from .profiler import profile_thread
+
+# synthesis threads, enough for every synthesis lane to be full, so a saturated provider never holds threads the
+# others wait for (the default executor of the event loop only has a few)
+SYNTHESIS_EXECUTOR = ThreadPoolExecutor(
+    max_workers=sum(config.SYNTHESIS_CONCURRENCY.values()) + config.SYNTHESIS_CONCURRENCY_DEFAULT,
+    thread_name_prefix="synthesis",
+)
+
+
+def _event_alive() -> bool:
+    """
+    Whether the client of the Gradio event running in this context is still connected.
+
+    :return: False once Gradio marked the event as abandoned, True outside of a queued event
+    """
+    blocks = LocalContext.blocks.get()
+    event_id: str | None = LocalContext.event_id.get()
+    if blocks is None or event_id is None or blocks._queue is None:  # pylint: disable=W0212
+        return True
+    for job in blocks._queue.active_jobs:  # pylint: disable=W0212
+        for event in job or ():
+            if event._id == event_id:  # pylint: disable=W0212
+                return event.alive
+    return True
+
+
+async def run_cancellable(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking synthesis function in a worker thread, cancelling its provider calls when the Gradio event is
+    cancelled (e.g. by the Clear button) or its client disconnects.
+
+    :param func: blocking function
+    :return: result of the function
+    """
+    token = CancelToken()
+
+    def run() -> Any:
+        with profile_thread(), cancel_scope(token):
+            return func(*args, **kwargs)
+
+    task: asyncio.Future = asyncio.get_running_loop().run_in_executor(
+        SYNTHESIS_EXECUTOR, contextvars.copy_context().run, run
+    )
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=config.CANCEL_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if not _event_alive():
+                logger.info("Client disconnected, cancelling the request")
+                token.cancel()
+                return await task
+    except asyncio.CancelledError:
+        token.cancel()
+        # the thread finishes on its own with `RequestCancelled`, nobody awaits it anymore
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        raise
@@ -0,0 +1,56 @@
+"""
+Cache of rendered Gradio dropdowns, keyed by the catalog version they were built from
+"""
+
+import threading
+from typing import Callable, Hashable
+
+import gradio as gr
+
+
+class DropdownCache:
+    """
+    Rendered dropdown components per (provider, key, catalog version).
+
+    Gradio only reads the constructor arguments of a returned component, so one instance can be served to every
+    focus event until the provider reloads its catalog and bumps the version.
+    """
+
+    _lock = threading.Lock()
+    _cache: dict[tuple[str, Hashable, int], gr.Dropdown] = {}
+
+    @classmethod
+    def get(
+        cls,
+        provider: str,
+        key: Hashable,
+        version: Callable[[], int],
+        build: Callable[[], list],
+    ) -> gr.Dropdown:
+        """
+        Get a cached dropdown, building it on a miss.
+
+        :param provider: provider name
+        :param key: what the choices depend on, e.g. the selected language
+        :param version: returns the current catalog version of the provider
+        :param build: returns the dropdown choices, may load the catalog
+        :return: a gradio dropdown component
+        """
+        dropdown: gr.Dropdown | None = cls._cache.get((provider, key, version()))
+        if dropdown is not None:
+            return dropdown
+        dropdown = gr.Dropdown(choices=build())
+        with cls._lock:
+            # the build may have loaded the catalog, so key on the version it was built from
+            cls._cache[(provider, key, version())] = dropdown
+        return dropdown
+
+    @classmethod
+    def invalidate(cls, provider: str) -> None:
+        """
+        Drop every cached dropdown of a provider.
+
+        :param provider: provider name
+        """
+        with cls._lock:
+            cls._cache = {cache_key: value for cache_key, value in cls._cache.items() if cache_key[0] != provider}
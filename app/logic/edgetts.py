@@ -2,27 +2,20 @@
 Some logic funtions needed by Gradio components
 """
 
-import asyncio
-from typing import Any
-
+import config
 import gradio as gr
-import numpy as np
 from api import EdgeTTS
+from api.cancellation import run_async
+from api.voice import EdgeCatalog
 from loguru import logger
 
-
-def pad_buffer(audio: bytes) -> bytes:
-    """
-    Pad buffer to multiple of 2 bytes
-
-    :param audio: original binary data of audio
-    :return: binary data of audio after padding
-    """
-    buffer_size: int = len(audio)
-    element_size: int = np.dtype(np.int16).itemsize
-    if buffer_size % element_size != 0:
-        audio = audio + b"\0" * (element_size - (buffer_size % element_size))
-    return audio
+from .cancellation import run_cancellable
+from .dropdown_cache import DropdownCache
+from .job_queue import JobQueue
+from .request_log import prompt_fields, request_log, stage
+from .segment_cache import SegmentCache
+from .text_normalizer import normalize_text
+from .transcoder import Transcoder
 
 
 def get_edgetts_language_code() -> gr.Dropdown:
@@ -32,8 +25,8 @@ def get_edgetts_language_code() -> gr.Dropdown:
     :return: a gradio dropdown component
     """
     try:
-        language_list: list[str] = EdgeTTS.get_language_code()
-        return gr.Dropdown(choices=language_list)
+        with request_log("edge-tts", "languages"), stage("catalog"):
+            return DropdownCache.get("edge-tts", None, lambda: EdgeTTS.catalog_version, EdgeTTS.get_language_code)
     except RuntimeError as e:
         raise gr.Error(e)
 
@@ -50,8 +43,10 @@ def get_edgetts_voices(lang_code: str) -> gr.Dropdown:
         raise gr.Error("Language code is empty!")
 
     try:
-        voices_list: list[tuple[str, str]] = EdgeTTS.get_voices(lang_code)
-        return gr.Dropdown(choices=voices_list)
+        with request_log("edge-tts", "voices", language=lang_code), stage("catalog"):
+            return DropdownCache.get(
+                "edge-tts", lang_code, lambda: EdgeTTS.catalog_version, lambda: EdgeTTS.get_voices(lang_code)
+            )
     except RuntimeError as e:
         raise gr.Error(e)
 
@@ -68,7 +63,8 @@ def get_edgetts_single_voice_info(short_name: str) -> tuple[gr.Textbox, gr.Textb
         raise gr.Error("Voice is not selected!")
 
     try:
-        gender, categories, personalities = EdgeTTS.get_voice_info(short_name)
+        with request_log("edge-tts", "voice_info", voice=short_name), stage("catalog"):
+            gender, categories, personalities = EdgeTTS.get_voice_info(short_name)
         return (
             gr.Textbox(value=gender, visible=True),
             gr.Textbox(value=categories, visible=True),
@@ -78,13 +74,188 @@ def get_edgetts_single_voice_info(short_name: str) -> tuple[gr.Textbox, gr.Textb
         raise gr.Error(e)
 
 
-def get_edgetts_audio(text: str, voice: str) -> tuple[int, Any]:
+def synthesize_edgetts(
+    text: str, voice: str, audio_format: str = "mp3", incremental: bool = False, pause: float = 0
+) -> str:
+    """
+    Synthesize text with edge-tts and store the result, also the runner of edge-tts jobs
+
+    :param text: content text
+    :param voice: voice speaker name
+    :param audio_format: mp3/ogg/aac/opus/wav, edge-tts only produces mp3, other formats are transcoded
+    :param incremental: synthesize sentence by sentence, reusing cached sentences
+    :param pause: seconds of silence between paragraphs
+    :return: audio file path
+    """
+    text = normalize_text(text, "edge-tts")
+    with request_log(
+        "edge-tts",
+        "synthesize",
+        voice=voice,
+        characters=len(text),
+        incremental=incremental,
+        pause=pause,
+        **prompt_fields(text),
+    ):
+
+        def synthesize(texts: list[str]) -> list[bytes]:
+            with stage("upstream"):
+                return run_async(generate_edgetts_segments(texts, voice))
+
+        if incremental:
+            audio_data: bytes = SegmentCache.render("edge-tts", voice, text, synthesize, pause)
+        else:
+            audio_data = SegmentCache.fetch("edge-tts", voice, text, synthesize, pause)
+        return Transcoder.deliver(audio_data, "mp3", audio_format)
+
+
+async def generate_edgetts_segments(sentences: list[str], voice: str) -> list[bytes]:
+    """
+    Synthesize several texts concurrently on one event loop
+
+    :param sentences: texts to synthesize
+    :param voice: voice speaker name
+    :return: audio data of each text, in order
+    """
+    return await EdgeTTS.generate_script([(voice, sentence) for sentence in sentences], config.SEGMENT_CONCURRENCY)
+
+
+def parse_edgetts_script(speakers: str, script: str) -> list[tuple[str, str]]:
+    """
+    Parse a script read by several edge-tts voices
+
+    :param speakers: one "speaker: voice short name" per line
+    :param script: one "speaker: text" per line, a line not starting with a known speaker continues the previous one
+    :return: voice short name and text of each line, in order
+    """
+    voices: dict[str, str] = {}
+    for number, line in enumerate(speakers.splitlines(), 1):
+        if not line.strip():
+            continue
+        speaker, separator, voice = line.partition(":")
+        if not separator or not speaker.strip() or not voice.strip():
+            raise RuntimeError(f'Speaker line {number} is not "speaker: voice": {line}')
+        voices[speaker.strip().casefold()] = voice.strip()
+    catalog: EdgeCatalog = EdgeTTS.get_catalog()
+    unknown: list[str] = sorted({voice for voice in voices.values() if voice not in catalog.voices})
+    if unknown:
+        raise RuntimeError(f"Unknown edge-tts voices: {', '.join(unknown)}")
+
+    lines: list[tuple[str, str]] = []
+    for number, line in enumerate(script.splitlines(), 1):
+        if not line.strip():
+            continue
+        speaker, separator, text = line.partition(":")
+        if separator and speaker.strip().casefold() in voices:
+            lines.append((voices[speaker.strip().casefold()], text.strip()))
+        elif lines:
+            lines[-1] = (lines[-1][0], f"{lines[-1][1]} {line.strip()}")
+        else:
+            raise RuntimeError(f"Script line {number} does not start with a speaker: {line}")
+    return [(voice, text) for voice, text in lines if text]
+
+
+def synthesize_edgetts_script(
+    speakers: str, script: str, gap: float = config.SCRIPT_GAP, audio_format: str = "mp3"
+) -> str:
+    """
+    Synthesize a script read by several edge-tts voices into a single audio file, all lines concurrently
+
+    :param speakers: one "speaker: voice short name" per line
+    :param script: one "speaker: text" per line
+    :param gap: seconds of silence between two lines
+    :param audio_format: mp3/ogg/aac/opus/wav, edge-tts only produces mp3, other formats are transcoded
+    :return: audio file path
+    """
+    with stage("validation"):
+        lines: list[tuple[str, str]] = [
+            (voice, normalize_text(text, "edge-tts")) for voice, text in parse_edgetts_script(speakers, script)
+        ]
+        if not lines:
+            raise RuntimeError("Script has no lines")
+    with request_log(
+        "edge-tts",
+        "script",
+        lines=len(lines),
+        voices=len({voice for voice, _ in lines}),
+        characters=sum(len(text) for _, text in lines),
+    ):
+
+        def synthesize(missing: list[tuple[str, str]]) -> list[bytes]:
+            with stage("upstream"):
+                return run_async(EdgeTTS.generate_script(missing))
+
+        audio_data: bytes = SegmentCache.render_script("edge-tts", lines, synthesize, gap)
+        return Transcoder.deliver(audio_data, "mp3", audio_format)
+
+
+async def get_edgetts_audio(
+    text: str, voice: str, audio_format: str = "mp3", incremental: bool = False, pause: float = 0
+) -> str:
     """
     Get audio result from edge-tts
 
     :param text: content text
     :param voice: voice speaker name
-    :return: sample rate, audio data
+    :param audio_format: mp3/ogg/aac/opus/wav, edge-tts only produces mp3, other formats are transcoded
+    :param incremental: synthesize sentence by sentence, reusing cached sentences
+    :param pause: seconds of silence between paragraphs
+    :return: audio file path
+    """
+    with request_log("edge-tts", "synthesize", audio_format=audio_format):
+        with stage("validation"):
+            if not text:
+                logger.error("Audio content text is empty!")
+                raise gr.Error("Audio content text is empty!")
+            if not voice:
+                logger.error("Voice speaker is not selected!")
+                raise gr.Error("Voice speaker is not selected!")
+
+        try:
+            return await run_cancellable(synthesize_edgetts, text, voice, audio_format, incremental, pause)
+        except RuntimeError as e:
+            raise gr.Error(e)
+
+
+async def get_edgetts_script_audio(
+    speakers: str, script: str, gap: float = config.SCRIPT_GAP, audio_format: str = "mp3"
+) -> str:
+    """
+    Get audio result of a script read by several edge-tts voices
+
+    :param speakers: one "speaker: voice short name" per line
+    :param script: one "speaker: text" per line
+    :param gap: seconds of silence between two lines
+    :param audio_format: output audio format
+    :return: audio file path
+    """
+    with request_log("edge-tts", "script", audio_format=audio_format):
+        with stage("validation"):
+            if not speakers:
+                logger.error("Speakers are empty!")
+                raise gr.Error("Speakers are empty!")
+            if not script:
+                logger.error("Script is empty!")
+                raise gr.Error("Script is empty!")
+
+        try:
+            return await run_cancellable(synthesize_edgetts_script, speakers, script, gap, audio_format)
+        except RuntimeError as e:
+            raise gr.Error(e)
+
+
+def submit_edgetts_job(
+    text: str, voice: str, audio_format: str = "mp3", incremental: bool = False, pause: float = 0
+) -> str:
+    """
+    Queue an edge-tts job instead of synthesizing in the event handler
+
+    :param text: content text
+    :param voice: voice speaker name
+    :param audio_format: output audio format
+    :param incremental: synthesize sentence by sentence, reusing cached sentences
+    :param pause: seconds of silence between paragraphs
+    :return: job id
     """
     if not text:
         logger.error("Audio content text is empty!")
@@ -93,8 +264,10 @@ def get_edgetts_audio(text: str, voice: str) -> tuple[int, Any]:
         logger.error("Voice speaker is not selected!")
         raise gr.Error("Voice speaker is not selected!")
 
-    audio_data: bytes = asyncio.run(EdgeTTS.generate_audio(text, voice))
-    return 44100, np.frombuffer(pad_buffer(audio_data), dtype=np.int16)
+    return JobQueue.submit(
+        "edge-tts",
+        {"text": text, "voice": voice, "audio_format": audio_format, "incremental": incremental, "pause": pause},
+    )
 
 
 def clear_edgetts_info() -> tuple[gr.Textbox, gr.Textbox, gr.Textbox]:
@@ -102,6 +275,7 @@ def clear_edgetts_info() -> tuple[gr.Textbox, gr.Textbox, gr.Textbox]:
     Clear all stored edge-tts information.
     """
     if EdgeTTS.clear_info():
+        DropdownCache.invalidate("edge-tts")
         logger.warning("Clear all edge-tts information")
         gr.Warning("Clear all edge-tts information")
         return gr.Textbox(visible=False), gr.Textbox(visible=False), gr.Textbox(visible=False)
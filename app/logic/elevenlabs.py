@@ -3,26 +3,23 @@ Some logic funtions needed by Gradio components
 """
 
 import datetime
-from typing import Any
+import time
+from typing import Any, Iterator
 
+import config
 import gradio as gr
-import numpy as np
-from api import ElevenLabs
+from api import ElevenLabs, SampleCache
+from elevenlabs.api.error import APIError, AuthorizationError, RateLimitError
 from loguru import logger
 
-
-def pad_buffer(audio: bytes) -> bytes:
-    """
-    Pad buffer to multiple of 2 bytes
-
-    :param audio: original binary data of audio
-    :return: binary data of audio after padding
-    """
-    buffer_size: int = len(audio)
-    element_size: int = np.dtype(np.int16).itemsize
-    if buffer_size % element_size != 0:
-        audio = audio + b"\0" * (element_size - (buffer_size % element_size))
-    return audio
+from .cancellation import run_cancellable
+from .dropdown_cache import DropdownCache
+from .job_queue import JobQueue
+from .request_log import RequestLog, prompt_fields, request_log, stage
+from .segment_cache import SegmentCache
+from .text_normalizer import normalize_text
+from .token_status import Quota, TokenStatusCache
+from .transcoder import NATIVE_FORMATS, Transcoder, pcm_to_wav
 
 
 def get_elevenlabs_voices() -> gr.Dropdown:
@@ -31,8 +28,8 @@ def get_elevenlabs_voices() -> gr.Dropdown:
 
     :return: a gradio dropdown component
     """
-    voices_list: list[tuple[str, str]] = ElevenLabs.get_voices()
-    return gr.Dropdown(choices=voices_list)
+    with request_log("elevenlabs", "voices"), stage("catalog"):
+        return DropdownCache.get("elevenlabs", None, lambda: ElevenLabs.catalog_version, ElevenLabs.get_voices)
 
 
 def get_elevenlabs_single_voice_info(
@@ -49,14 +46,15 @@ def get_elevenlabs_single_voice_info(
         raise gr.Error("Voice is not selected!")
 
     try:
-        gender, accent, age, desc, use_case, url = ElevenLabs.get_detailed_voice_info(voice_id)
+        with request_log("elevenlabs", "voice_info", voice=voice_id), stage("catalog"):
+            gender, accent, age, desc, use_case, url = ElevenLabs.get_detailed_voice_info(voice_id)
         return (
             gr.Textbox(value=gender, visible=True),
             gr.Textbox(value=accent, visible=True),
             gr.Textbox(value=age, visible=True),
             gr.Textbox(value=desc, visible=True),
             gr.Textbox(value=use_case, visible=True),
-            gr.Audio(value=url, visible=True),
+            gr.Audio(value=SampleCache.get(url), visible=True),
         )
     except RuntimeError as e:
         raise gr.Error(e)
@@ -73,18 +71,129 @@ def get_elevenlabs_token_status(token: str) -> tuple[gr.Textbox, gr.Textbox, gr.
         logger.error("API token is empty!")
         raise gr.Error("API token is empty!")
 
-    count, limit, unix_timestamp = ElevenLabs.get_token_stauts(token)
-    left: int = limit - count
-    reset_time: str = datetime.datetime.utcfromtimestamp(unix_timestamp).strftime("%Y-%m-%d %H:%M:%S")
+    quota: Quota = TokenStatusCache.get("elevenlabs", token)
+    reset_time: str = datetime.datetime.utcfromtimestamp(quota.reset_at).strftime("%Y-%m-%d %H:%M:%S")
     return (
-        gr.Textbox(value=count),
-        gr.Textbox(value=left),
-        gr.Textbox(value=limit),
+        gr.Textbox(value=quota.used),
+        gr.Textbox(value=quota.available),
+        gr.Textbox(value=quota.limit),
         gr.Textbox(value=reset_time),
     )
 
 
-def get_elevenlabs_audio(  # pylint: disable=R0913
+def fetch_elevenlabs_quota(token: str) -> Quota:
+    """
+    Fetch the quota of an ElevenLabs token
+
+    :param token: API token
+    :return: quota
+    """
+    count, limit, unix_timestamp = ElevenLabs.get_token_stauts(token)
+    return Quota(used=count, limit=limit, reset_at=unix_timestamp, fetched_at=time.time())
+
+
+def synthesize_elevenlabs(  # pylint: disable=R0913
+    token: str,
+    text: str,
+    voice_id: str,
+    model: str,
+    stability: float,
+    similarity: float,
+    style: float,
+    speaker_boost: bool,
+    audio_format: str = "mp3",
+    incremental: bool = False,
+    pause: float = 0,
+) -> str:
+    """
+    Synthesize text with ElevenLabs and store the result, also the runner of ElevenLabs jobs
+
+    :param token: API token
+    :param text: text content
+    :param voice_id: voice speaker id
+    :param model: model name
+    :param stability: stability value
+    :param similarity: similarity value
+    :param style: style value
+    :param speaker_boost: use speaker boost value
+    :param audio_format: mp3/ogg/aac/opus/wav, wav is built from raw PCM when the plan allows it, other formats
+                         are transcoded from mp3
+    :param incremental: synthesize sentence by sentence in mp3, reusing cached sentences
+    :param pause: seconds of silence between paragraphs, in mp3
+    :return: audio file path
+    """
+    text = normalize_text(text, "elevenlabs")
+    settings: dict[str, Any] = {
+        "model": model,
+        "stability": float(stability),
+        "similarity": float(similarity),
+        "style": float(style),
+        "speaker_boost": bool(speaker_boost),
+    }
+    with request_log(
+        "elevenlabs",
+        "synthesize",
+        voice=voice_id,
+        model=model,
+        characters=len(text),
+        incremental=incremental,
+        pause=pause,
+        **prompt_fields(text, **settings),
+    ):
+
+        def synthesize(texts: list[str], output_format: str = "mp3_44100_128") -> list[bytes]:
+            segments: list[bytes] = []
+            for part in texts:
+                with stage("upstream"):
+                    segments.append(
+                        ElevenLabs.generate_audio(
+                            token, part, voice_id, model, stability, similarity, style, speaker_boost, output_format
+                        )
+                    )
+                # a call sharing another caller's in-flight request is only billed once
+                if ElevenLabs.coalescer.led():
+                    TokenStatusCache.consume("elevenlabs", len(part), token)
+            return segments
+
+        # segments and pauses are spliced as mp3 frames, wav is then transcoded from mp3 instead of built from PCM
+        native_format: str = (
+            audio_format
+            if audio_format in NATIVE_FORMATS["elevenlabs"] and not incremental and not pause > 0
+            else "mp3"
+        )
+        audio_data: bytes | None = None
+        if native_format == "wav":
+            try:
+                pcm: bytes = synthesize([text], "pcm_44100")[0]
+                with stage("transcode"):
+                    audio_data = pcm_to_wav(pcm, 44100)
+            except (AuthorizationError, RateLimitError):
+                raise
+            except APIError as e:
+                # raw PCM needs a paid plan, other accounts get wav transcoded from mp3
+                logger.warning(f"ElevenLabs rejected pcm_44100, falling back to mp3: {e}")
+                native_format = "mp3"
+        if audio_data is None and incremental:
+            audio_data = SegmentCache.render("elevenlabs", voice_id, text, synthesize, pause, **settings)
+        elif audio_data is None:
+            audio_data = SegmentCache.fetch("elevenlabs", voice_id, text, synthesize, pause, **settings)
+        return Transcoder.deliver(audio_data, native_format, audio_format)
+
+
+def warm_elevenlabs(  # pylint: disable=R0913
+    voice: str, text: str, model: str, stability: float, similarity: float, style: float, speaker_boost: bool
+) -> str:
+    """
+    Synthesize a prompt into the cache with the warm-up token
+
+    :return: audio file path
+    """
+    return synthesize_elevenlabs(
+        config.WARMUP_ELEVENLABS_TOKEN, text, voice, model, stability, similarity, style, speaker_boost
+    )
+
+
+async def get_elevenlabs_audio(  # pylint: disable=R0913
     token: str,
     text: str,
     voice_id: str,
@@ -93,7 +202,10 @@ def get_elevenlabs_audio(  # pylint: disable=R0913
     similarity: float,
     style: float,
     speaker_boost: bool,
-) -> tuple[int, Any]:
+    audio_format: str = "mp3",
+    incremental: bool = False,
+    pause: float = 0,
+) -> str:
     """
     Get audio data
 
@@ -105,7 +217,70 @@ def get_elevenlabs_audio(  # pylint: disable=R0913
     :param similarity: similarity value
     :param style: style value
     :param speaker_boost: use speaker boost value
-    :return: sample rate, audio data
+    :param audio_format: mp3/ogg/aac/opus/wav, wav is built from raw PCM, other formats are transcoded from mp3
+    :param incremental: synthesize sentence by sentence in mp3, reusing cached sentences
+    :param pause: seconds of silence between paragraphs, in mp3
+    :return: audio file path
+    """
+    with request_log("elevenlabs", "synthesize", audio_format=audio_format):
+        with stage("validation"):
+            if not token:
+                logger.error("Token is empty!")
+                raise gr.Error("Token is empty!")
+            if not text:
+                logger.error("Text content is empty!")
+                raise gr.Error("Text content is empty!")
+            if not voice_id:
+                logger.error("Voice speaker is not selected!")
+                raise gr.Error("Voice speaker is not selected!")
+
+        try:
+            return await run_cancellable(
+                synthesize_elevenlabs,
+                token,
+                text,
+                voice_id,
+                model,
+                stability,
+                similarity,
+                style,
+                speaker_boost,
+                audio_format,
+                incremental,
+                pause,
+            )
+        except RuntimeError as e:
+            raise gr.Error(e)
+
+
+def submit_elevenlabs_job(  # pylint: disable=R0913
+    token: str,
+    text: str,
+    voice_id: str,
+    model: str,
+    stability: float,
+    similarity: float,
+    style: float,
+    speaker_boost: bool,
+    audio_format: str = "mp3",
+    incremental: bool = False,
+    pause: float = 0,
+) -> str:
+    """
+    Queue an ElevenLabs job instead of synthesizing in the event handler
+
+    :param token: API token, kept in memory until the job finishes
+    :param text: text content
+    :param voice_id: voice speaker id
+    :param model: model name
+    :param stability: stability value
+    :param similarity: similarity value
+    :param style: style value
+    :param speaker_boost: use speaker boost value
+    :param audio_format: output audio format
+    :param incremental: synthesize sentence by sentence in mp3, reusing cached sentences
+    :param pause: seconds of silence between paragraphs, in mp3
+    :return: job id
     """
     if not token:
         logger.error("Token is empty!")
@@ -117,17 +292,89 @@ def get_elevenlabs_audio(  # pylint: disable=R0913
         logger.error("Voice speaker is not selected!")
         raise gr.Error("Voice speaker is not selected!")
 
-    audio_data: bytes = ElevenLabs.generate_audio(
-        token,
-        text,
-        voice_id,
-        model,
-        stability,
-        similarity,
-        style,
-        speaker_boost,
+    return JobQueue.submit(
+        "elevenlabs",
+        {
+            "token": token,
+            "text": text,
+            "voice_id": voice_id,
+            "model": model,
+            "stability": stability,
+            "similarity": similarity,
+            "style": style,
+            "speaker_boost": speaker_boost,
+            "audio_format": audio_format,
+            "incremental": incremental,
+            "pause": pause,
+        },
     )
-    return 44100, np.frombuffer(pad_buffer(audio_data), dtype=np.int16)
+
+
+def stream_elevenlabs_audio(  # pylint: disable=R0913
+    token: str,
+    text: str,
+    voice_id: str,
+    model: str,
+    stability: float,
+    similarity: float,
+    style: float,
+    speaker_boost: bool,
+    latency: int,
+) -> Iterator[bytes]:
+    """
+    Stream audio data, playback starts with the first chunk
+
+    :param token: API token
+    :param text: text content
+    :param voice_id: voice speaker id
+    :param model: model name
+    :param stability: stability value
+    :param similarity: similarity value
+    :param style: style value
+    :param speaker_boost: use speaker boost value
+    :param latency: streaming latency optimization level
+    :return: mp3 chunks
+    """
+    if not token:
+        logger.error("Token is empty!")
+        raise gr.Error("Token is empty!")
+    if not text:
+        logger.error("Text content is empty!")
+        raise gr.Error("Text content is empty!")
+    if not voice_id:
+        logger.error("Voice speaker is not selected!")
+        raise gr.Error("Voice speaker is not selected!")
+
+    text = normalize_text(text, "elevenlabs")
+    if not text:
+        logger.error("Text content is empty!")
+        raise gr.Error("Text content is empty!")
+    # generators resume in whatever context the caller iterates them from, so the log is threaded explicitly
+    log = RequestLog("elevenlabs", "stream", voice=voice_id, model=model, characters=len(text), latency=latency)
+    try:
+        chunks: Iterator[bytes] = ElevenLabs.generate_audio_stream(
+            token,
+            text,
+            voice_id,
+            model,
+            stability,
+            similarity,
+            style,
+            speaker_boost,
+            latency,
+        )
+        while True:
+            with log.stage("upstream"):
+                chunk: bytes | None = next(chunks, None)
+            if chunk is None:
+                break
+            with log.stage("response"):
+                yield chunk
+    except BaseException as e:
+        log.finish(e)
+        raise
+    log.finish()
+    TokenStatusCache.consume("elevenlabs", len(text), token)
 
 
 def clear_elevenlabs_info() -> tuple[gr.Textbox, gr.Textbox, gr.Textbox, gr.Textbox, gr.Textbox, gr.Audio]:
@@ -135,6 +382,7 @@ def clear_elevenlabs_info() -> tuple[gr.Textbox, gr.Textbox, gr.Textbox, gr.Text
     Clear all stored ElevenLabs information.
     """
     if ElevenLabs.clear_info():
+        DropdownCache.invalidate("elevenlabs")
         logger.warning("Clear all stored ElevenLabs information")
         gr.Warning("Clear all stored ElevenLabs information")
         return (
@@ -0,0 +1,403 @@
+"""
+Persistent priority queue of synthesis jobs
+"""
+
+import asyncio
+import inspect
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+import aiohttp
+import config
+import requests
+from api.circuit_breaker import CircuitOpenError
+from api.deadlines import DeadlineExceeded
+from loguru import logger
+
+from .audio_store import AudioStore
+
+PRIORITIES: dict[str, int] = {"interactive": 0, "batch": 1}
+# one worker for batch jobs and one always free for interactive jobs
+MIN_WORKERS: int = 2
+# failures a later attempt may not hit: lost connections, timeouts and missed deadlines
+TRANSIENT_ERRORS: tuple[type[BaseException], ...] = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    aiohttp.ClientConnectionError,
+    asyncio.TimeoutError,
+    DeadlineExceeded,
+)
+
+
+def is_transient(error: BaseException | None) -> bool:
+    """
+    Whether a job failure is worth retrying, errors wrapped by the provider APIs are judged by their cause.
+
+    :param error: exception raised by a job runner
+    :return: True for network errors, timeouts, missed deadlines and server errors (5xx)
+    """
+    while error is not None:
+        if isinstance(error, CircuitOpenError):
+            return False
+        if isinstance(error, TRANSIENT_ERRORS):
+            return True
+        if isinstance(error, requests.exceptions.HTTPError):
+            return error.response is not None and error.response.status_code >= 500
+        error = error.__cause__
+    return False
+
+
+@dataclass(slots=True, frozen=True)
+class Job:  # pylint: disable=R0902
+    """
+    A synthesis job
+    """
+
+    id: str  # pylint: disable=C0103
+    provider: str
+    priority: str
+    status: str
+    progress: float
+    attempts: int
+    result: str | None
+    error: str | None
+
+    @property
+    def finished(self) -> bool:
+        """
+        Whether the job will not change anymore.
+        """
+        return self.status in ("done", "failed")
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue with a worker pool per provider.
+
+    Jobs survive restarts: anything still marked as running when the queue starts is queued again. Each provider
+    reserves part of its workers for interactive jobs, so short requests never wait behind book-length batch jobs.
+    Transient failures are retried with exponential backoff up to `JOB_MAX_ATTEMPTS` times, any other failure (invalid
+    input, rejected token, open circuit breaker) fails the job at once.
+
+    Secret arguments (API keys, tokens) are never written to the database: they stay in the memory of the process
+    which accepted the job, only that process claims the job, and they are dropped once the job finishes. Finished
+    jobs are deleted `JOB_RETENTION` seconds after their last update, their audio is pinned in the store until then.
+    """
+
+    db_path: Path = Path(config.JOB_DB_PATH)
+    runners: dict[str, Callable[..., str]] = {}
+    secrets: dict[str, tuple[str, ...]] = {}
+    owner: str = uuid.uuid4().hex
+    _held: dict[str, dict[str, Any]] = {}
+    _held_lock = threading.Lock()
+    _swept: float = 0.0
+    _local = threading.local()
+    _wakeup = threading.Condition()
+    _started: bool = False
+
+    @classmethod
+    def _connect(cls) -> sqlite3.Connection:
+        """
+        Get the database connection of the current thread.
+        """
+        connection: sqlite3.Connection | None = getattr(cls._local, "connection", None)
+        if connection is None:
+            cls.db_path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(cls.db_path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    not_before REAL NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )"""
+            )
+            if "owner" not in {column["name"] for column in connection.execute("PRAGMA table_info(jobs)")}:
+                connection.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (provider, status, priority, created)")
+            cls._local.connection = connection
+        return connection
+
+    @classmethod
+    def register(cls, provider: str, runner: Callable[..., str], secrets: tuple[str, ...] = ()) -> None:
+        """
+        Register the function running jobs of a provider, it is called with the job payload as keyword arguments.
+
+        :param provider: provider name
+        :param runner: function returning the result (file path or URL) of a job
+        :param secrets: payload keys kept in memory only, never stored in the database
+        """
+        cls.runners[provider] = runner
+        cls.secrets[provider] = secrets
+
+    @classmethod
+    def submit(cls, provider: str, payload: dict[str, Any], priority: str | None = None) -> str:
+        """
+        Add a job to the queue.
+
+        :param provider: provider name
+        :param payload: keyword arguments of the provider runner
+        :param priority: "interactive" or "batch", defaults to a class derived from the text length
+        :return: job id
+        """
+        if provider not in cls.runners:
+            raise RuntimeError(f"Unknown provider: {provider}")
+        if priority is None:
+            priority = "batch" if len(payload.get("text", "")) > config.JOB_BATCH_THRESHOLD else "interactive"
+        if priority not in PRIORITIES:
+            raise RuntimeError(f"Unknown priority: {priority}")
+        job_id: str = uuid.uuid4().hex
+        now: float = time.time()
+        held: dict[str, Any] = {key: payload[key] for key in cls.secrets[provider] if key in payload}
+        stored: dict[str, Any] = {key: value for key, value in payload.items() if key not in held}
+        if held:
+            with cls._held_lock:
+                cls._held[job_id] = held
+        cls._connect().execute(
+            """INSERT INTO jobs (id, provider, priority, status, payload, owner, created, updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                job_id,
+                provider,
+                PRIORITIES[priority],
+                "queued",
+                json.dumps(stored),
+                cls.owner if held else None,
+                now,
+                now,
+            ),
+        )
+        logger.info(f"Job {job_id} queued: {provider}, {priority}")
+        with cls._wakeup:
+            cls._wakeup.notify_all()
+        return job_id
+
+    @classmethod
+    def validate(cls, provider: str, payload: dict[str, Any]) -> None:
+        """
+        Check a payload received from outside against the signature of the provider runner: known arguments, all
+        required ones, and values of the annotated scalar type.
+
+        :param provider: provider name
+        :param payload: keyword arguments of the provider runner
+        """
+        signature: inspect.Signature = inspect.signature(cls.runners[provider])
+        try:
+            signature.bind(**payload)
+        except TypeError as e:
+            raise RuntimeError(f"Invalid {provider} payload: {e}") from e
+        for name, value in payload.items():
+            annotation: Any = signature.parameters[name].annotation
+            accepted: tuple[type, ...] = (int, float) if annotation is float else (annotation,)
+            if annotation in (str, int, float, bool) and (
+                not isinstance(value, accepted) or isinstance(value, bool) != (annotation is bool)
+            ):
+                raise RuntimeError(f"Invalid {provider} payload: {name} must be {annotation.__name__}")
+
+    @classmethod
+    def get(cls, job_id: str) -> Job:
+        """
+        Get the current state of a job.
+
+        :param job_id: job id
+        :return: job
+        """
+        row: sqlite3.Row | None = (
+            cls._connect()
+            .execute(
+                "SELECT id, provider, priority, status, progress, attempts, result, error FROM jobs WHERE id = ?",
+                (job_id,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            raise RuntimeError(f"Job not found: {job_id}")
+        names: dict[int, str] = {value: name for name, value in PRIORITIES.items()}
+        return Job(**{**dict(row), "priority": names[row["priority"]]})
+
+    @classmethod
+    def report_progress(cls, fraction: float) -> None:
+        """
+        Report the progress of the job running in the current thread, does nothing outside of jobs.
+
+        :param fraction: progress between 0 and 1
+        """
+        job_id: str | None = getattr(cls._local, "job_id", None)
+        if job_id is not None:
+            cls._connect().execute(
+                "UPDATE jobs SET progress = ?, updated = ? WHERE id = ?",
+                (min(max(fraction, 0.0), 1.0), time.time(), job_id),
+            )
+
+    @classmethod
+    def recover(cls) -> None:
+        """
+        Requeue jobs interrupted by a previous shutdown, failing those whose secrets were lost with their process.
+        """
+        connection: sqlite3.Connection = cls._connect()
+        connection.execute(
+            """UPDATE jobs SET status = 'failed', error = 'Credentials lost in a restart, submit the job again',
+            updated = ? WHERE owner != ? AND status IN ('queued', 'running')""",
+            (time.time(), cls.owner),
+        )
+        connection.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+        cls.sweep()
+
+    @classmethod
+    def sweep(cls) -> None:
+        """
+        Delete jobs finished more than `JOB_RETENTION` seconds ago.
+        """
+        cls._swept = time.time()
+        connection: sqlite3.Connection = cls._connect()
+        expired: list[sqlite3.Row] = connection.execute(
+            "SELECT id, result FROM jobs WHERE status IN ('done', 'failed') AND updated < ?",
+            (cls._swept - config.JOB_RETENTION,),
+        ).fetchall()
+        deleted: int = 0
+        for row in expired:
+            # another process may sweep the same job, only the one deleting it unpins its audio
+            if connection.execute("DELETE FROM jobs WHERE id = ?", (row["id"],)).rowcount:
+                deleted += 1
+                if row["result"]:
+                    AudioStore.pin(row["result"], -1)
+        if deleted:
+            logger.info(f"Deleted {deleted} finished jobs")
+
+    @classmethod
+    def start(cls, recover: bool = True) -> None:
+        """
+        Requeue interrupted jobs and start the worker threads.
+
+        :param recover: requeue interrupted jobs first, worker processes leave it to their supervisor
+        """
+        if cls._started:
+            return
+        cls._started = True
+        if recover:
+            cls.recover()
+        for provider, workers in config.JOB_WORKERS.items():
+            if workers < MIN_WORKERS:
+                logger.warning(f"{provider} needs {MIN_WORKERS} job workers to keep one for interactive jobs")
+                workers = MIN_WORKERS
+            # at least one worker for batch jobs and one kept for interactive jobs
+            max_batch: int = max(1, min(workers - 1, int(workers * config.JOB_BATCH_SHARE)))
+            for index in range(workers):
+                threading.Thread(
+                    target=cls._work, args=(provider, max_batch), name=f"job-{provider}-{index}", daemon=True
+                ).start()
+
+    @classmethod
+    def _claim(cls, provider: str, max_batch: int) -> sqlite3.Row | None:
+        """
+        Atomically pick the next ready job of a provider and mark it as running.
+        """
+        connection: sqlite3.Connection = cls._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            running_batch: int = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE provider = ? AND status = 'running' AND priority = ?",
+                (provider, PRIORITIES["batch"]),
+            ).fetchone()[0]
+            max_priority: int = PRIORITIES["batch"] if running_batch < max_batch else PRIORITIES["interactive"]
+            row: sqlite3.Row | None = connection.execute(
+                """SELECT id, payload FROM jobs
+                WHERE provider = ? AND status = 'queued' AND not_before <= ? AND priority <= ?
+                AND (owner IS NULL OR owner = ?)
+                ORDER BY priority, created LIMIT 1""",
+                (provider, time.time(), max_priority, cls.owner),
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, progress = 0, updated = ? "
+                    "WHERE id = ?",
+                    (time.time(), row["id"]),
+                )
+            connection.execute("COMMIT")
+            return row
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+
+    @classmethod
+    def _work(cls, provider: str, max_batch: int) -> None:
+        """
+        Worker loop of a provider.
+        """
+        while True:
+            try:
+                row: sqlite3.Row | None = cls._claim(provider, max_batch)
+            except sqlite3.Error as e:
+                logger.error(f"Fail to claim a {provider} job: {e}")
+                row = None
+            if row is None:
+                if time.time() - cls._swept > config.JOB_SWEEP_INTERVAL:
+                    cls.sweep()
+                with cls._wakeup:
+                    cls._wakeup.wait(timeout=1.0)
+                continue
+            cls._run(provider, row["id"], json.loads(row["payload"]))
+
+    @classmethod
+    def _run(cls, provider: str, job_id: str, payload: dict[str, Any]) -> None:
+        """
+        Run a claimed job and record its outcome.
+        """
+        connection: sqlite3.Connection = cls._connect()
+        cls._local.job_id = job_id
+        with cls._held_lock:
+            held: dict[str, Any] | None = cls._held.get(job_id)
+        try:
+            if held is None and cls.secrets[provider]:
+                raise RuntimeError("Credentials lost in a restart, submit the job again")
+            result: str = cls.runners[provider](**payload, **(held or {}))
+        except Exception as e:  # pylint: disable=W0718
+            attempts: int = connection.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            if attempts < config.JOB_MAX_ATTEMPTS and is_transient(e):
+                delay: float = config.JOB_RETRY_BACKOFF**attempts
+                logger.warning(f"Job {job_id} failed (attempt {attempts}), retry in {delay:.1f}s: {e}")
+                connection.execute(
+                    "UPDATE jobs SET status = 'queued', not_before = ?, error = ?, updated = ? WHERE id = ?",
+                    (time.time() + delay, str(e), time.time(), job_id),
+                )
+            else:
+                logger.error(f"Job {job_id} failed: {e}")
+                connection.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                    (str(e), time.time(), job_id),
+                )
+                cls._forget(job_id)
+        else:
+            logger.info(f"Job {job_id} done")
+            connection.execute(
+                "UPDATE jobs SET status = 'done', progress = 1, result = ?, error = NULL, updated = ? WHERE id = ?",
+                (result, time.time(), job_id),
+            )
+            AudioStore.pin(result)
+            cls._forget(job_id)
+        finally:
+            cls._local.job_id = None
+
+    @classmethod
+    def _forget(cls, job_id: str) -> None:
+        """
+        Drop the secrets of a finished job.
+        """
+        with cls._held_lock:
+            cls._held.pop(job_id, None)
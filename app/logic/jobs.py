@@ -0,0 +1,66 @@
+"""
+Some logic funtions needed by Gradio components
+"""
+
+import time
+from typing import Iterator
+
+import gradio as gr
+from loguru import logger
+
+from .job_queue import Job, JobQueue
+
+
+def describe_job(job: Job) -> str:
+    """
+    Render the state of a job as markdown
+
+    :param job: job
+    :return: markdown text
+    """
+    text: str = f"**{job.status}** · {job.provider} · {job.priority} · {job.progress:.0%} · attempt {job.attempts}"
+    if job.error:
+        text += f"\n\n{job.error}"
+    return text
+
+
+def get_job_status(job_id: str) -> tuple[gr.Markdown, gr.Audio]:
+    """
+    Get the current state of a job
+
+    :param job_id: job id
+    :return: status markdown, result audio once the job is done
+    """
+    if not job_id:
+        logger.error("Job id is empty!")
+        raise gr.Error("Job id is empty!")
+
+    try:
+        job: Job = JobQueue.get(job_id.strip())
+    except RuntimeError as e:
+        raise gr.Error(e)
+    return gr.Markdown(describe_job(job), visible=True), gr.Audio(value=job.result)
+
+
+def follow_job(job_id: str, interval: float = 0.5) -> Iterator[tuple[gr.Markdown, gr.Audio]]:
+    """
+    Stream the state of a job until it finishes
+
+    :param job_id: job id
+    :param interval: seconds between two polls
+    :return: status markdown, result audio once the job is done
+    """
+    if not job_id:
+        return
+    previous: Job | None = None
+    while True:
+        try:
+            job: Job = JobQueue.get(job_id.strip())
+        except RuntimeError as e:
+            raise gr.Error(e)
+        if job != previous:
+            yield gr.Markdown(describe_job(job), visible=True), gr.Audio(value=job.result)
+            previous = job
+        if job.finished:
+            return
+        time.sleep(interval)
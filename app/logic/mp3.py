@@ -0,0 +1,182 @@
+"""
+MP3 helpers working on whole frames, without decoding
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Iterator, Sequence
+
+# bitrates in kbit/s by bitrate index, MPEG-1 and MPEG-2/2.5 Layer III
+BITRATES: dict[bool, tuple[int, ...]] = {
+    True: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# sample rates in Hz by version bits then sample rate index, version 1 is reserved
+SAMPLE_RATES: dict[int, tuple[int, ...]] = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000),
+}
+
+
+@dataclass(slots=True, frozen=True)
+class FrameHeader:
+    """
+    Header of an MPEG Layer III frame, the only layer the providers produce.
+    """
+
+    raw: bytes
+    mpeg1: bool
+    crc: bool
+    bitrate: int
+    sample_rate: int
+    padding: bool
+    mono: bool
+
+    @property
+    def samples(self) -> int:
+        """
+        Samples per channel in the frame.
+        """
+        return 1152 if self.mpeg1 else 576
+
+    @property
+    def length(self) -> int:
+        """
+        Length of the frame in bytes, header included.
+        """
+        return (144 if self.mpeg1 else 72) * self.bitrate * 1000 // self.sample_rate + self.padding
+
+    @property
+    def side_info(self) -> int:
+        """
+        Length of the side information following the header and its CRC.
+        """
+        if self.mpeg1:
+            return 17 if self.mono else 32
+        return 9 if self.mono else 17
+
+
+def parse_header(data: bytes | memoryview, offset: int = 0) -> FrameHeader | None:
+    """
+    Parse the frame header at an offset.
+
+    :param data: MP3 content
+    :param offset: offset of the header
+    :return: header, None if there is no valid Layer III header at the offset
+    """
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[offset : offset + 4]
+    version: int = (b1 >> 3) & 3
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0 or version == 1 or (b1 >> 1) & 3 != 1:
+        return None
+    bitrate_index: int = b2 >> 4
+    sample_rate_index: int = (b2 >> 2) & 3
+    # free format bitrate and reserved values cannot be spliced
+    if bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    return FrameHeader(
+        raw=bytes(data[offset : offset + 4]),
+        mpeg1=version == 3,
+        crc=not b1 & 1,
+        bitrate=BITRATES[version == 3][bitrate_index],
+        sample_rate=SAMPLE_RATES[version][sample_rate_index],
+        padding=bool(b2 & 2),
+        mono=b3 >> 6 == 3,
+    )
+
+
+def strip_tags(data: bytes) -> memoryview:
+    """
+    Get the frames of an MP3 file, without its ID3v2 header, ID3v1 trailer or any garbage before the first frame.
+
+    :param data: MP3 file content
+    :return: view of the frames
+    """
+    start: int = 0
+    end: int = len(data)
+    if data[:3] == b"ID3" and end >= 10:
+        size: int = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+    if end - start >= 128 and data[end - 128 : end - 125] == b"TAG":
+        end -= 128
+    while start + 1 < end and not (data[start] == 0xFF and data[start + 1] & 0xE0 == 0xE0):
+        start += 1
+    return memoryview(data)[start:end]
+
+
+def frames(data: bytes | memoryview) -> Iterator[tuple[FrameHeader, memoryview]]:
+    """
+    Iterate over the frames of MP3 frames data, stopping at the first invalid or truncated frame.
+
+    :param data: frames, as returned by `strip_tags`
+    :return: header and view of each frame
+    """
+    view: memoryview = memoryview(data)
+    offset: int = 0
+    while (header := parse_header(view, offset)) is not None and offset + header.length <= len(view):
+        yield header, view[offset : offset + header.length]
+        offset += header.length
+
+
+def is_info_frame(header: FrameHeader, frame: memoryview) -> bool:
+    """
+    Whether a frame is a Xing/Info or VBRI tag, which describes the whole file it starts and carries no audio.
+
+    :param header: frame header
+    :param frame: frame content
+    :return: True for a tag frame
+    """
+    xing: int = 4 + (2 if header.crc else 0) + header.side_info
+    return frame[xing : xing + 4] in (b"Xing", b"Info") or frame[36:40] == b"VBRI"
+
+
+@lru_cache(maxsize=32)
+def silent_frame(raw_header: bytes) -> bytes:
+    """
+    Build a frame of silence matching a frame header: same version, bitrate, sample rate and channel mode, no CRC and
+    no padding. Zeroed side information means no main data and no bit reservoir use, so it decodes to silence on its
+    own anywhere in the stream.
+
+    :param raw_header: 4 bytes of a reference frame header
+    :return: silent frame
+    """
+    header: bytes = bytes((raw_header[0], raw_header[1] | 0x01, raw_header[2] & ~0x02, raw_header[3]))
+    reference: FrameHeader | None = parse_header(header)
+    if reference is None:
+        raise RuntimeError("Not an MP3 Layer III frame header")
+    return header + bytes(reference.length - 4)
+
+
+def silence(header: FrameHeader, seconds: float) -> bytes:
+    """
+    Get silent frames lasting about the given duration, to be spliced into a stream of the same format.
+
+    :param header: header of a frame of the stream
+    :param seconds: duration
+    :return: silent frames, rounded to whole frames
+    """
+    count: int = round(seconds * header.sample_rate / header.samples)
+    return silent_frame(header.raw) * count if count > 0 else b""
+
+
+def concat(segments: Iterable[bytes], gaps: Sequence[float] = ()) -> bytes:
+    """
+    Join MP3 files encoded with the same settings into one stream, cutting only at frame boundaries and copying frames
+    as they are. Xing/Info tags of the segments are dropped, since they would describe a single segment.
+
+    :param segments: MP3 file contents
+    :param gaps: seconds of silence to insert after each segment, silence matches the format of the segment before it
+    :return: joined MP3 stream
+    """
+    parts: list[bytes | memoryview] = []
+    for index, segment in enumerate(segments):
+        data: memoryview = strip_tags(segment)
+        first: tuple[FrameHeader, memoryview] | None = next(frames(data), None)
+        if first is not None and is_info_frame(*first):
+            data = data[len(first[1]) :]
+        parts.append(data)
+        if index < len(gaps) and gaps[index] > 0 and first is not None:
+            parts.append(silence(first[0], gaps[index]))
+    return b"".join(parts)
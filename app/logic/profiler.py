@@ -0,0 +1,212 @@
+"""
+Opt-in per-request profiling
+"""
+
+import asyncio
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from types import FrameType
+from typing import Any, Iterator
+
+import config
+from gradio.context import LocalContext
+from loguru import logger
+
+APP_DIR: str = str(Path(__file__).resolve().parent.parent)
+_LINE = re.compile(r":\d+\)$")
+
+
+def should_profile() -> bool:
+    """
+    Whether the request starting in this context is profiled: it sent the `PROFILE_HEADER` header, or it is sampled
+    with `PROFILE_SAMPLE_RATE`.
+
+    :return: True to profile the request
+    """
+    if config.PROFILE_SAMPLE_RATE > 0 and random.random() < config.PROFILE_SAMPLE_RATE:
+        return True
+    request = LocalContext.request.get()
+    if request is None or not config.PROFILE_HEADER:
+        return False
+    try:
+        return request.headers.get(config.PROFILE_HEADER, "0") not in ("", "0")
+    except AttributeError:
+        return False
+
+
+class Profile:  # pylint: disable=R0902
+    """
+    Wall-clock stack samples and allocations of one request.
+
+    A sampler thread records the stacks of the threads attached to the request every `PROFILE_INTERVAL` seconds,
+    including threads waiting on I/O, and tracemalloc records the allocations made while the request runs. On stop the
+    collapsed stacks (flame graph input) and the tracemalloc snapshot are written to `PROFILE_DIR`, and the top
+    `PROFILE_TOP` functions and allocation sites are logged.
+    """
+
+    _tracing: int = 0
+    _started_tracing: bool = False
+    _tracing_lock = threading.Lock()
+
+    def __init__(self, request_id: str, name: str) -> None:
+        self.request_id: str = request_id
+        self.name: str = name
+        self.threads: set[int] = set()
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.samples: int = 0
+        self._baseline: tracemalloc.Snapshot | None = None
+        self._done = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name=f"profile-{request_id}", daemon=True)
+
+    def attach(self) -> None:
+        """
+        Sample the current thread too, for work handed over to another thread.
+        """
+        self.threads.add(threading.get_ident())
+
+    def detach(self) -> None:
+        """
+        Stop sampling the current thread, before it goes back to a pool.
+        """
+        self.threads.discard(threading.get_ident())
+
+    def start(self) -> None:
+        """
+        Start tracing allocations and sampling the current thread, unless it runs an event loop shared with other
+        requests, async handlers hand their work over to attached threads instead.
+        """
+        with Profile._tracing_lock:
+            if Profile._tracing == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(config.PROFILE_TRACEBACK)
+                Profile._started_tracing = True
+            Profile._tracing += 1
+        self._baseline = tracemalloc.take_snapshot()
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.attach()
+        self._sampler.start()
+
+    @staticmethod
+    def _frame_name(frame: FrameType) -> str:
+        code = frame.f_code
+        filename: str = code.co_filename
+        if filename.startswith(APP_DIR):
+            filename = filename[len(APP_DIR) + 1 :]
+        return f"{code.co_name} ({filename}:{frame.f_lineno})"
+
+    def _sample(self) -> None:
+        while not self._done.wait(config.PROFILE_INTERVAL):
+            frames: dict[int, FrameType] = sys._current_frames()  # pylint: disable=W0212
+            for ident in list(self.threads):
+                frame: FrameType | None = frames.get(ident)
+                stack: list[str] = []
+                while frame is not None:
+                    stack.append(self._frame_name(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self) -> Path | None:
+        """
+        Stop profiling, write the profile and log its summary.
+
+        :return: path of the collapsed stacks, None if they could not be written
+        """
+        self._done.set()
+        self._sampler.join()
+        own_traces: list[tracemalloc.Filter] = [
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, threading.__file__),
+        ]
+        snapshot: tracemalloc.Snapshot = tracemalloc.take_snapshot().filter_traces(own_traces)
+        with Profile._tracing_lock:
+            Profile._tracing -= 1
+            if Profile._tracing == 0 and Profile._started_tracing:
+                tracemalloc.stop()
+                Profile._started_tracing = False
+        allocations: list[tracemalloc.StatisticDiff] = [
+            diff
+            for diff in snapshot.compare_to(self._baseline.filter_traces(own_traces), "lineno")
+            if diff.size_diff > 0
+        ][: config.PROFILE_TOP]
+
+        # share of samples spent in each function of the app, callees included
+        functions: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            for function in {_LINE.sub(")", frame) for frame in stack if " (/" not in frame and " (<" not in frame}:
+                functions[function] += count
+        summary: list[str] = [f"Profile of {self.name} {self.request_id}: {self.samples} samples"]
+        summary += [
+            f"  {count / max(self.samples, 1):6.1%}  {frame}"
+            for frame, count in functions.most_common(config.PROFILE_TOP)
+        ]
+        summary += [f"  {diff.size_diff / 1024:10.1f} KiB  {diff.traceback}" for diff in allocations]
+        logger.info("\n".join(summary))
+
+        directory = Path(config.PROFILE_DIR)
+        path: Path = directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}-{self.request_id}.stacks.txt"
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as file:
+                file.writelines(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.items())
+            snapshot.filter_traces([tracemalloc.Filter(True, f"{APP_DIR}/*")]).dump(
+                str(path.with_name(path.name.replace(".stacks.txt", ".tracemalloc")))
+            )
+        except OSError as e:
+            logger.error(f"Fail to write profile: {e}")
+            return None
+        return path
+
+
+_current: ContextVar[Profile | None] = ContextVar("profile", default=None)
+
+
+@contextmanager
+def profile_request(entry: dict[str, Any]) -> Iterator[Profile | None]:
+    """
+    Profile the request running in this context if it asked for it or is sampled, the path of the profile is added to
+    its request log entry.
+
+    :param entry: request log entry
+    :return: the profile, None when the request is not profiled
+    """
+    if not should_profile():
+        yield None
+        return
+    profile = Profile(entry["id"], f"{entry['provider']}.{entry['operation']}")
+    profile.start()
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        path: Path | None = profile.stop()
+        if path is not None:
+            entry["profile"] = str(path)
+
+
+@contextmanager
+def profile_thread() -> Iterator[None]:
+    """
+    Include the current thread in the profile of the request running in this context, if any.
+    """
+    profile: Profile | None = _current.get()
+    if profile is None:
+        yield
+        return
+    profile.attach()
+    try:
+        yield
+    finally:
+        profile.detach()
@@ -0,0 +1,27 @@
+"""
+Registration of the providers with the job queue, the cache warmer and the token status cache
+"""
+
+import config
+
+from .edgetts import synthesize_edgetts
+from .elevenlabs import fetch_elevenlabs_quota, synthesize_elevenlabs, warm_elevenlabs
+from .job_queue import JobQueue
+from .token_status import TokenStatusCache
+from .ttsmaker import fetch_ttsmaker_quota, synthesize_ttsmaker
+from .warmup import CacheWarmer
+
+
+def register_providers() -> None:
+    """
+    Register the job runners, warm-up functions and quota fetchers of every provider. Called once at startup, before
+    the job queue and the cache warmer start, so the configuration is read when the server starts.
+    """
+    JobQueue.register("edge-tts", synthesize_edgetts)
+    JobQueue.register("elevenlabs", synthesize_elevenlabs, secrets=("token",))
+    JobQueue.register("ttsmaker", synthesize_ttsmaker, secrets=("token",))
+    CacheWarmer.register("edge-tts", lambda voice, text: synthesize_edgetts(text, voice))
+    if config.WARMUP_ELEVENLABS_TOKEN:
+        CacheWarmer.register("elevenlabs", warm_elevenlabs)
+    TokenStatusCache.register("elevenlabs", fetch_elevenlabs_quota)
+    TokenStatusCache.register("ttsmaker", fetch_ttsmaker_quota)
@@ -0,0 +1,265 @@
+"""
+Structured request logs with per-stage timings
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator
+
+import config
+from api.timing import record_stages
+from loguru import logger
+
+from .profiler import profile_request
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+class RequestLog:
+    """
+    Timings and attributes of one request.
+
+    Recording only stores numbers in a dict on the request thread, the entry is serialized and written by
+    `RequestLogWriter` in its own thread. Entries are sampled with `REQUEST_LOG_SAMPLE_RATE`, failed requests and
+    requests slower than `REQUEST_LOG_SLOW_MS` are always written.
+    """
+
+    __slots__ = ("entry", "_start", "_open")
+
+    def __init__(self, provider: str, operation: str, **fields: Any) -> None:
+        self.entry: dict[str, Any] = {
+            "id": uuid.uuid4().hex[:16],
+            "time": time.time(),
+            "provider": provider,
+            "operation": operation,
+            **fields,
+            "stages": {},
+        }
+        self._start: float = time.perf_counter()
+        self._open: list[str] = []
+
+    @property
+    def id(self) -> str:  # pylint: disable=C0103
+        """
+        Correlation id of the request.
+        """
+        return self.entry["id"]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time a stage of the request, stages entered several times add up.
+
+        :param name: stage name, e.g. "validation", "catalog", "upstream", "decode" or "response"
+        """
+        self._open.append(name)
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._open.pop()
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name: str, duration: float) -> None:
+        """
+        Add the duration of a stage. A stage nested in another one, e.g. decoding during a catalog lookup, is taken
+        out of the outer stage, so the stages of an entry never overlap.
+
+        :param name: stage name
+        :param duration: milliseconds
+        """
+        stages: dict[str, float] = self.entry["stages"]
+        stages[name] = stages.get(name, 0.0) + duration
+        if self._open:
+            stages[self._open[-1]] = stages.get(self._open[-1], 0.0) - duration
+
+    def finish(self, error: BaseException | None = None) -> None:
+        """
+        Close the entry and hand it to the writer.
+
+        :param error: exception that ended the request, if any
+        """
+        self.entry["duration_ms"] = (time.perf_counter() - self._start) * 1000
+        self.entry["status"] = "ok" if error is None else "error"
+        if error is not None:
+            self.entry["error"] = f"{type(error).__name__}: {error}"
+        RequestLogWriter.submit(self.entry)
+
+
+_current: ContextVar[RequestLog | None] = ContextVar("request_log", default=None)
+
+
+@contextmanager
+def request_log(provider: str, operation: str, **fields: Any) -> Iterator[RequestLog]:
+    """
+    Log the request running in this context, nested calls join the outer request and add their fields to it.
+
+    :param provider: provider name
+    :param operation: operation name, e.g. "synthesize" or "voices"
+    :param fields: attributes of the request, e.g. voice or text length
+    :return: request log
+    """
+    current: RequestLog | None = _current.get()
+    if current is not None:
+        current.entry.update(fields)
+        yield current
+        return
+    log = RequestLog(provider, operation, **fields)
+    token = _current.set(log)
+    try:
+        with logger.contextualize(request_id=log.id), profile_request(log.entry), record_stages(log.record):
+            yield log
+    except BaseException as e:
+        log.finish(e)
+        raise
+    else:
+        log.finish()
+    finally:
+        _current.reset(token)
+
+
+def prompt_fields(text: str, **settings: Any) -> dict[str, Any]:
+    """
+    Fields recording what a synthesis request asked for, only when `REQUEST_LOG_TEXT` is enabled since texts may be
+    private. The cache warmer mines them to find the most requested prompts.
+
+    :param text: normalized text
+    :param settings: synthesis settings changing the audio, as used in the cache key
+    :return: fields to add to the request entry
+    """
+    if not config.REQUEST_LOG_TEXT:
+        return {}
+    return {"text": text, "settings": settings}
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a stage of the request running in this context, does nothing outside of a request.
+
+    :param name: stage name
+    """
+    current: RequestLog | None = _current.get()
+    if current is None:
+        yield
+        return
+    with current.stage(name):
+        yield
+
+
+class RequestLogWriter:
+    """
+    Background thread writing request entries as JSON lines, one file per day in `REQUEST_LOG_DIR`.
+    """
+
+    _queue: queue.SimpleQueue = queue.SimpleQueue()
+    _thread: threading.Thread | None = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def submit(cls, entry: dict[str, Any]) -> None:
+        """
+        Queue an entry if it is sampled.
+
+        :param entry: request entry
+        """
+        if (
+            entry["status"] == "ok"
+            and entry["duration_ms"] < config.REQUEST_LOG_SLOW_MS
+            and random.random() >= config.REQUEST_LOG_SAMPLE_RATE
+        ):
+            return
+        if cls._thread is None:
+            with cls._lock:
+                if cls._thread is None:
+                    cls._thread = threading.Thread(target=cls._run, name="request-log", daemon=True)
+                    cls._thread.start()
+        cls._queue.put(entry)
+
+    @staticmethod
+    def _dumps(entry: dict[str, Any]) -> bytes:
+        """
+        Serialize an entry, rounding timings to microseconds.
+        """
+        entry["duration_ms"] = round(entry["duration_ms"], 3)
+        entry["stages"] = {name: round(value, 3) for name, value in entry["stages"].items()}
+        if orjson is not None:
+            return orjson.dumps(entry, default=str)
+        return json.dumps(entry, ensure_ascii=False, default=str).encode()
+
+    @classmethod
+    def _run(cls) -> None:
+        """
+        Write queued entries, batching whatever is queued at once into a single write.
+        """
+        directory = Path(config.REQUEST_LOG_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        while True:
+            batch: list[dict[str, Any]] = [cls._queue.get()]
+            while not cls._queue.empty() and len(batch) < 1000:
+                batch.append(cls._queue.get_nowait())
+            path: Path = directory / f"requests-{datetime.now():%Y-%m-%d}.jsonl"
+            try:
+                with open(path, "ab") as file:
+                    file.write(b"".join(cls._dumps(entry) + b"\n" for entry in batch))
+            except (OSError, TypeError, ValueError) as e:
+                logger.error(f"Fail to write request log: {e}")
+
+
+def read_request_logs(directory: str | os.PathLike | None = None) -> Iterator[dict[str, Any]]:
+    """
+    Read every request entry written so far, oldest file first.
+
+    :param directory: log directory, defaults to `REQUEST_LOG_DIR`
+    :return: request entries
+    """
+    for path in sorted(Path(directory or config.REQUEST_LOG_DIR).glob("requests-*.jsonl")):
+        with open(path, "rb") as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def summarize_request_logs(entries: Iterator[dict[str, Any]]) -> dict[tuple[str, str, str], dict[str, float]]:
+    """
+    Compute latency percentiles per provider, operation and stage, "total" being the whole request.
+
+    :param entries: request entries
+    :return: count, p50, p95 and p99 in milliseconds of each (provider, operation, stage)
+    """
+    samples: dict[tuple[str, str, str], list[float]] = {}
+    for entry in entries:
+        key: tuple[str, str] = (entry.get("provider", ""), entry.get("operation", ""))
+        samples.setdefault((*key, "total"), []).append(entry.get("duration_ms", 0.0))
+        for name, value in entry.get("stages", {}).items():
+            samples.setdefault((*key, name), []).append(value)
+    summary: dict[tuple[str, str, str], dict[str, float]] = {}
+    for key, values in sorted(samples.items()):
+        values.sort()
+        summary[key] = {
+            "count": len(values),
+            **{f"p{q}": values[min(len(values) - 1, int(len(values) * q / 100))] for q in (50, 95, 99)},
+        }
+    return summary
+
+
+if __name__ == "__main__":
+    for (log_provider, log_operation, stage_name), stats in summarize_request_logs(read_request_logs()).items():
+        print(
+            f"{log_provider:<12} {log_operation:<12} {stage_name:<12} n={stats['count']:<6} "
+            f"p50={stats['p50']:.1f}ms p95={stats['p95']:.1f}ms p99={stats['p99']:.1f}ms"
+        )
@@ -0,0 +1,287 @@
+"""
+Sentence-level cache of synthesized audio
+"""
+
+import hashlib
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+import config
+from api.coalescer import normalize_key
+from api.shared_store import SharedStore
+from loguru import logger
+
+from . import mp3
+from .audio_store import AudioStore
+from .job_queue import JobQueue
+from .request_log import stage
+
+SENTENCE_END = re.compile(r"(?<=[.!?;。！？；…])\s+|\n+")
+
+
+def split_paragraphs(text: str) -> list[str]:
+    """
+    Split text into paragraphs, one per line.
+
+    :param text: text content
+    :return: non-empty paragraphs
+    """
+    return [paragraph for paragraph in (line.strip() for line in text.splitlines()) if paragraph]
+
+
+def split_sentences(text: str) -> list[str]:
+    """
+    Split text into sentences, line breaks always end a sentence.
+
+    :param text: text content
+    :return: non-empty sentences
+    """
+    return [sentence for sentence in (part.strip() for part in SENTENCE_END.split(text)) if sentence]
+
+
+class SegmentCache:
+    """
+    Cache MP3 audio per (provider, voice, settings, sentence), whole texts synthesized in one request are cached the
+    same way under the key of the whole text.
+
+    Rendering a text only synthesizes the sentences that are not cached yet, then joins cached and fresh segments
+    frame by frame, so re-rendering a long document after a one-line edit costs one sentence of synthesis. Segment
+    audio lives in the audio store and follows its eviction, the key to file mapping lives in the shared database.
+    Sentences are synthesized without their neighbours, so intonation across sentence boundaries may differ slightly
+    from a single request. Pauses between paragraphs are silent frames inserted at join time, so they are not part of
+    the cache keys and any pause reuses the same segments. Index rows of evicted segments are pruned at most every
+    `prune_interval` seconds.
+    """
+
+    prune_interval: float = 60.0
+    _ready: bool = False
+    _pruned: float = 0.0
+
+    @classmethod
+    def _connect(cls) -> sqlite3.Connection:
+        """
+        Get the connection holding the segment index.
+        """
+        connection: sqlite3.Connection = SharedStore.connect()
+        if not cls._ready:
+            connection.execute("CREATE TABLE IF NOT EXISTS segments (key TEXT PRIMARY KEY, name TEXT NOT NULL)")
+            cls._ready = True
+        return connection
+
+    @classmethod
+    def key(cls, provider: str, voice: str, sentence: str, **settings: Any) -> str:
+        """
+        Build the cache key of a sentence.
+
+        :param provider: provider name
+        :param voice: voice id or short name
+        :param sentence: sentence text
+        :param settings: synthesis settings changing the audio
+        :return: cache key
+        """
+        return hashlib.sha256(repr(normalize_key(provider, voice, sentence, **settings)).encode()).hexdigest()
+
+    @classmethod
+    def lookup(cls, key: str) -> Path | None:
+        """
+        Get the audio file of a cached sentence.
+
+        :param key: cache key
+        :return: file path, None if the sentence is not cached or its audio was evicted
+        """
+        row: tuple | None = cls._connect().execute("SELECT name FROM segments WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        path: Path = AudioStore.path(row[0])
+        if not path.exists():
+            cls._connect().execute("DELETE FROM segments WHERE key = ?", (key,))
+            return None
+        return path
+
+    @classmethod
+    def read(cls, key: str) -> bytes | None:
+        """
+        Read the audio of a cached sentence, a file evicted by another worker since the lookup counts as a miss.
+
+        :param key: cache key
+        :return: MP3 audio, None if the sentence is not cached or its audio was evicted
+        """
+        path: Path | None = cls.lookup(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            cls._connect().execute("DELETE FROM segments WHERE key = ?", (key,))
+            return None
+
+    @classmethod
+    def store(cls, key: str, audio: bytes) -> Path:
+        """
+        Cache the audio of a sentence.
+
+        :param key: cache key
+        :param audio: MP3 audio
+        :return: file path
+        """
+        path: Path = AudioStore.put(audio, "mp3")
+        connection: sqlite3.Connection = cls._connect()
+        connection.execute("INSERT OR REPLACE INTO segments (key, name) VALUES (?, ?)", (key, path.name))
+        if time.monotonic() - cls._pruned >= cls.prune_interval:
+            cls._pruned = time.monotonic()
+            pruned: int = connection.execute(
+                "DELETE FROM segments WHERE name NOT IN (SELECT name FROM audio_index)"
+            ).rowcount
+            if pruned:
+                logger.debug(f"Pruned {pruned} evicted segments from the segment index")
+        return path
+
+    @classmethod
+    def _join(
+        cls,
+        provider: str,
+        paragraphs: list[list[tuple[str, str]]],
+        synthesize: Callable[[list[tuple[str, str]]], list[bytes]],
+        pause: float,
+        batch: int,
+        **settings: Any,
+    ) -> tuple[bytes, int]:
+        """
+        Join the audio of (voice, text) segments from the cache, synthesizing the missing ones, with a pause after each
+        paragraph. Cached audio is read right away, so segments evicted meanwhile are synthesized again, and empty
+        segments are rejected before anything is sent upstream. Missing segments are synthesized `batch` at a time,
+        the progress of the running job is reported after each batch.
+
+        :return: MP3 audio, number of segments synthesized
+        """
+        segments: list[tuple[str, str]] = [segment for paragraph in paragraphs for segment in paragraph]
+        if not segments or not all(text for _, text in segments):
+            raise RuntimeError("Text content is empty after normalization!")
+        keys: list[str] = [cls.key(provider, voice, text, **settings) for voice, text in segments]
+        audios: dict[str, bytes] = {key: audio for key in set(keys) if (audio := cls.read(key)) is not None}
+        missing: dict[str, tuple[str, str]] = {
+            key: segment for key, segment in zip(keys, segments) if key not in audios
+        }
+        pending: list[str] = list(missing)
+        for start in range(0, len(pending), batch):
+            chunk: list[str] = pending[start : start + batch]
+            for key, audio in zip(chunk, synthesize([missing[key] for key in chunk])):
+                cls.store(key, audio)
+                audios[key] = audio
+            JobQueue.report_progress(len(audios) / len(set(keys)))
+        if len(keys) == 1:
+            return audios[keys[0]], len(missing)
+        gaps: list[float] = []
+        for number, paragraph in enumerate(paragraphs):
+            gaps += [0.0] * (len(paragraph) - 1) + [pause if number < len(paragraphs) - 1 else 0.0]
+        with stage("decode"):
+            return mp3.concat((audios[key] for key in keys), gaps), len(missing)
+
+    @classmethod
+    def fetch(
+        cls,
+        provider: str,
+        voice: str,
+        text: str,
+        synthesize: Callable[[list[str]], list[bytes]],
+        pause: float = 0,
+        **settings: Any,
+    ) -> bytes:
+        """
+        Get the audio of a whole text from the cache, synthesizing it in one request on a miss. With a pause, each
+        paragraph is cached and synthesized on its own, then the paragraphs are joined with `pause` seconds of silent
+        frames.
+
+        :param provider: provider name
+        :param voice: voice id or short name
+        :param text: text content
+        :param synthesize: function synthesizing a list of texts to MP3, results in the same order
+        :param pause: seconds of silence between paragraphs
+        :param settings: synthesis settings changing the audio
+        :return: MP3 audio
+        """
+        paragraphs: list[list[tuple[str, str]]] = (
+            [[(voice, paragraph)] for paragraph in split_paragraphs(text)] if pause > 0 else [[(voice, text)]]
+        )
+        audio, synthesized = cls._join(
+            provider,
+            paragraphs,
+            lambda segments: synthesize([text for _, text in segments]),
+            pause,
+            config.SEGMENT_CONCURRENCY,
+            **settings,
+        )
+        if not synthesized:
+            logger.debug(f"{provider}: served {len(text)} characters from the cache")
+        return audio
+
+    @classmethod
+    def render(
+        cls,
+        provider: str,
+        voice: str,
+        text: str,
+        synthesize: Callable[[list[str]], list[bytes]],
+        pause: float = 0,
+        **settings: Any,
+    ) -> bytes:
+        """
+        Render text from cached sentences, synthesizing the missing ones.
+
+        :param provider: provider name
+        :param voice: voice id or short name
+        :param text: text content
+        :param synthesize: function synthesizing a list of sentences to MP3, results in the same order
+        :param pause: seconds of silence between paragraphs
+        :param settings: synthesis settings changing the audio
+        :return: MP3 audio of the whole text
+        """
+        start: float = time.perf_counter()
+        paragraphs: list[list[tuple[str, str]]] = [
+            [(voice, sentence) for sentence in split_sentences(paragraph)] for paragraph in split_paragraphs(text)
+        ]
+        audio, synthesized = cls._join(
+            provider,
+            paragraphs,
+            lambda segments: synthesize([text for _, text in segments]),
+            pause,
+            config.SEGMENT_CONCURRENCY,
+            **settings,
+        )
+        logger.info(
+            f"{provider}: rendered {sum(map(len, paragraphs))} sentences, {synthesized} synthesized, "
+            f"{time.perf_counter() - start:.2f}s"
+        )
+        return audio
+
+    @classmethod
+    def render_script(
+        cls,
+        provider: str,
+        lines: list[tuple[str, str]],
+        synthesize: Callable[[list[tuple[str, str]]], list[bytes]],
+        gap: float = 0,
+        **settings: Any,
+    ) -> bytes:
+        """
+        Render a script read by several voices from cached lines, synthesizing the missing ones.
+
+        :param provider: provider name
+        :param lines: voice and text of each line, in order
+        :param synthesize: function synthesizing a list of (voice, text) lines to MP3, results in the same order
+        :param gap: seconds of silence between two lines
+        :param settings: synthesis settings changing the audio
+        :return: MP3 audio of the whole script
+        """
+        start: float = time.perf_counter()
+        audio, synthesized = cls._join(
+            provider, [[line] for line in lines], synthesize, gap, config.SCRIPT_CONCURRENCY, **settings
+        )
+        logger.info(
+            f"{provider}: rendered a script of {len(lines)} lines, {synthesized} synthesized, "
+            f"{time.perf_counter() - start:.2f}s"
+        )
+        return audio
@@ -0,0 +1,85 @@
+"""
+Some logic funtions needed by Gradio components
+"""
+
+import datetime
+
+import gradio as gr
+from api.circuit_breaker import CircuitBreaker
+from api.deadlines import DeadlineEstimator
+
+BREAKER_STATES: dict[str, int] = {"closed": 0, "half-open": 1, "open": 2}
+
+
+def describe_breakers() -> str:
+    """
+    Render the state of every provider circuit breaker as a markdown table
+
+    :return: markdown text
+    """
+    rows: list[str] = ["| Provider | State | Failures in a row | Opened | Last error |", "|---|---|---|---|---|"]
+    for breaker in CircuitBreaker.registry.values():
+        state = breaker.snapshot()
+        opened: str = (
+            datetime.datetime.fromtimestamp(state["opened_at"]).strftime("%Y-%m-%d %H:%M:%S")
+            if state["opened_at"]
+            else "never"
+        )
+        last_error: str = state["last_error"].replace("|", "\\|")
+        rows.append(f"| {state['name']} | **{state['state']}** | {state['failures']} | {opened} | {last_error} |")
+    return "\n".join(rows)
+
+
+def get_breaker_status() -> gr.Markdown:
+    """
+    Get the state of the provider circuit breakers
+
+    :return: markdown component
+    """
+    return gr.Markdown(describe_breakers())
+
+
+def render_metrics() -> str:
+    """
+    Render provider health in the Prometheus text format
+
+    :return: metrics text
+    """
+    lines: list[str] = [
+        "# HELP free_tts_breaker_state Circuit breaker state, 0: closed, 1: half-open, 2: open",
+        "# TYPE free_tts_breaker_state gauge",
+    ]
+    snapshots = [breaker.snapshot() for breaker in CircuitBreaker.registry.values()]
+    lines += [f'free_tts_breaker_state{{provider="{s["name"]}"}} {BREAKER_STATES[s["state"]]}' for s in snapshots]
+    lines += [
+        "# HELP free_tts_breaker_failures Consecutive failures counted by the circuit breaker",
+        "# TYPE free_tts_breaker_failures gauge",
+    ]
+    lines += [f'free_tts_breaker_failures{{provider="{s["name"]}"}} {s["failures"]}' for s in snapshots]
+    lines += [
+        "# HELP free_tts_breaker_opens_total Times the circuit breaker opened",
+        "# TYPE free_tts_breaker_opens_total counter",
+    ]
+    lines += [f'free_tts_breaker_opens_total{{provider="{s["name"]}"}} {s["opens"]}' for s in snapshots]
+    deadlines = [estimator.snapshot() for estimator in DeadlineEstimator.registry.values()]
+    labels: list[str] = [f'provider="{d["provider"]}",operation="{d["operation"]}"' for d in deadlines]
+    lines += [
+        "# HELP free_tts_deadline_latency_seconds Learned fixed latency of a provider operation",
+        "# TYPE free_tts_deadline_latency_seconds gauge",
+    ]
+    lines += [f"free_tts_deadline_latency_seconds{{{label}}} {d['latency']:.3f}" for label, d in zip(labels, deadlines)]
+    lines += [
+        "# HELP free_tts_deadline_chars_per_second Learned synthesis throughput of a provider operation",
+        "# TYPE free_tts_deadline_chars_per_second gauge",
+    ]
+    lines += [
+        f"free_tts_deadline_chars_per_second{{{label}}} {d['chars_per_second']:.1f}"
+        for label, d in zip(labels, deadlines)
+        if d["chars_per_second"] is not None
+    ]
+    lines += [
+        "# HELP free_tts_deadline_seconds Deadline of a call without text",
+        "# TYPE free_tts_deadline_seconds gauge",
+    ]
+    lines += [f"free_tts_deadline_seconds{{{label}}} {d['timeout']:.3f}" for label, d in zip(labels, deadlines)]
+    return "\n".join(lines) + "\n"
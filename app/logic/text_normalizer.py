@@ -0,0 +1,69 @@
+"""
+Text normalization applied before every provider call
+"""
+
+import re
+import unicodedata
+
+import config
+
+SMART_QUOTES: dict[int, str] = str.maketrans(
+    {
+        "‘": "'",
+        "’": "'",
+        "‚": "'",
+        "‛": "'",
+        "“": '"',
+        "”": '"',
+        "„": '"',
+        "‟": '"',
+        "′": "'",
+        "″": '"',
+    }
+)
+# characters edge-tts replaces with spaces before building its SSML
+EDGE_INCOMPATIBLE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+INLINE_SPACES = re.compile(r"[^\S\n]+")
+BLANK_LINES = re.compile(r"\n{3,}")
+# runs of the same mark are read like a single one, ellipses are left alone since they are read as a pause
+REPEATED_PUNCTUATION = re.compile(r"([!?！？])\1+")
+
+
+def normalize_text(text: str, provider: str) -> str:
+    """
+    Normalize text the way it is sent to a provider, so trivially different prompts share caches and quota counts.
+
+    Line breaks are kept (collapsed to at most one blank line) because TTSMaker inserts paragraph pauses on them, and
+    repeated exclamation and question marks are collapsed to one, so "Hello!!!" and "Hello!" share caches.
+
+    :param text: raw text
+    :param provider: provider name
+    :return: normalized text
+    """
+    if config.TEXT_UNICODE_FORM:
+        text = unicodedata.normalize(config.TEXT_UNICODE_FORM, text)
+    if config.TEXT_PLAIN_QUOTES:
+        text = text.translate(SMART_QUOTES)
+    if provider == "edge-tts":
+        text = EDGE_INCOMPATIBLE.sub(" ", text)
+    if config.TEXT_COLLAPSE_PUNCTUATION:
+        text = REPEATED_PUNCTUATION.sub(r"\1", text)
+    if config.TEXT_COLLAPSE_WHITESPACE:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        text = "\n".join(INLINE_SPACES.sub(" ", line).strip() for line in text.split("\n"))
+        text = BLANK_LINES.sub("\n\n", text).strip()
+    return text
+
+
+def count_characters(text: str, provider: str) -> int:
+    """
+    Count the characters a provider bills for a text.
+
+    ElevenLabs and TTSMaker bill every character of the submitted text, spaces and line breaks included, so the count
+    is the number of code points of the normalized text. edge-tts is free and only counted for display.
+
+    :param text: raw text
+    :param provider: provider name
+    :return: billed characters
+    """
+    return len(normalize_text(text, provider))
@@ -0,0 +1,187 @@
+"""
+Cached quota status of provider tokens
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Callable, Hashable
+
+import config
+from loguru import logger
+
+
+@dataclass(slots=True, frozen=True)
+class Quota:
+    """
+    Character quota of a token.
+    """
+
+    used: int
+    limit: int
+    reset_at: float
+    fetched_at: float
+
+    @property
+    def available(self) -> int:
+        """
+        Characters left until the quota resets.
+        """
+        return max(0, self.limit - self.used)
+
+
+def account_hash(account: tuple) -> str:
+    """
+    Hash the account arguments of a fetcher, so cached entries never hold a token.
+
+    :param account: account arguments, e.g. the token
+    :return: hex digest
+    """
+    return hashlib.sha256(repr(account).encode()).hexdigest()
+
+
+class TokenStatusCache:
+    """
+    In-process cache of token quotas.
+
+    Reads are served from memory, an entry older than `TOKEN_STATUS_TTL` is returned as is while a background thread
+    fetches a fresh one. Successful syntheses are counted locally, so the cached usage follows the real one between
+    fetches. Every entry is also dropped right after its quota resets, which is when local counting drifts the most,
+    so the next read fetches it again. Entries are keyed by a hash of the account and at most
+    `TOKEN_STATUS_MAX_ENTRIES` of them are kept, the least recently read ones are evicted first.
+    """
+
+    fetchers: dict[str, Callable[..., Quota]] = {}
+    _entries: OrderedDict[tuple[str, str], Quota] = OrderedDict()
+    _refreshing: set[tuple[str, str]] = set()
+    _lock = threading.Lock()
+    _wakeup = threading.Event()
+    _scheduler: threading.Thread | None = None
+
+    @classmethod
+    def register(cls, provider: str, fetcher: Callable[..., Quota]) -> None:
+        """
+        Register the function fetching quotas of a provider, it is called with the account arguments.
+
+        :param provider: provider name
+        :param fetcher: function returning the quota of an account
+        """
+        cls.fetchers[provider] = fetcher
+
+    @classmethod
+    def peek(cls, provider: str, *account: Hashable) -> Quota | None:
+        """
+        Get the cached quota of an account without any network access.
+
+        :param provider: provider name
+        :param account: account arguments of the fetcher, e.g. the token
+        :return: cached quota, None if it was never fetched
+        """
+        key: tuple[str, str] = (provider, account_hash(account))
+        with cls._lock:
+            quota: Quota | None = cls._entries.get(key)
+            if quota is not None:
+                cls._entries.move_to_end(key)
+        return quota
+
+    @classmethod
+    def get(cls, provider: str, *account: Hashable) -> Quota:
+        """
+        Get the quota of an account, fetching it only if it is not cached yet.
+
+        :param provider: provider name
+        :param account: account arguments of the fetcher, e.g. the token
+        :return: quota
+        """
+        quota: Quota | None = cls.peek(provider, *account)
+        if quota is None:
+            return cls.refresh(provider, *account)
+        if time.time() - quota.fetched_at > config.TOKEN_STATUS_TTL:
+            cls._refresh_in_background(provider, account)
+        return quota
+
+    @classmethod
+    def refresh(cls, provider: str, *account: Hashable) -> Quota:
+        """
+        Fetch the quota of an account and cache it.
+
+        :param provider: provider name
+        :param account: account arguments of the fetcher, e.g. the token
+        :return: quota
+        """
+        quota: Quota = cls.fetchers[provider](*account)
+        key: tuple[str, str] = (provider, account_hash(account))
+        with cls._lock:
+            cls._entries[key] = quota
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > config.TOKEN_STATUS_MAX_ENTRIES:
+                cls._entries.popitem(last=False)
+        cls._schedule()
+        return quota
+
+    @classmethod
+    def consume(cls, provider: str, characters: int, *account: Hashable) -> None:
+        """
+        Count characters billed by a successful synthesis.
+
+        :param provider: provider name
+        :param characters: billed characters
+        :param account: account arguments of the fetcher, e.g. the token
+        """
+        key: tuple[str, str] = (provider, account_hash(account))
+        with cls._lock:
+            quota: Quota | None = cls._entries.get(key)
+            if quota is not None:
+                cls._entries[key] = replace(quota, used=quota.used + characters)
+
+    @classmethod
+    def _refresh_in_background(cls, provider: str, account: tuple) -> None:
+        """
+        Refresh an entry in a thread, once at a time.
+        """
+        key: tuple[str, str] = (provider, account_hash(account))
+        with cls._lock:
+            if key in cls._refreshing:
+                return
+            cls._refreshing.add(key)
+
+        def run() -> None:
+            try:
+                cls.refresh(provider, *account)
+            except Exception as e:  # pylint: disable=W0718
+                logger.warning(f"{provider}: fail to refresh token status: {e}")
+            finally:
+                with cls._lock:
+                    cls._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"token-status-{provider}", daemon=True).start()
+
+    @classmethod
+    def _schedule(cls) -> None:
+        """
+        Start the thread dropping entries after their quota reset, or wake it up to reconsider the next reset.
+        """
+        with cls._lock:
+            if cls._scheduler is None:
+                cls._scheduler = threading.Thread(target=cls._run_scheduler, name="token-status", daemon=True)
+                cls._scheduler.start()
+        cls._wakeup.set()
+
+    @classmethod
+    def _run_scheduler(cls) -> None:
+        """
+        Drop every entry whose quota has reset since it was fetched, sleeping until the next reset.
+        """
+        while True:
+            cls._wakeup.clear()
+            now: float = time.time()
+            upcoming: list[float] = []
+            with cls._lock:
+                for key, quota in list(cls._entries.items()):
+                    if quota.fetched_at < quota.reset_at <= now:
+                        del cls._entries[key]
+                    elif quota.reset_at > now:
+                        upcoming.append(quota.reset_at)
+            cls._wakeup.wait(timeout=min(upcoming) - now + 1 if upcoming else None)
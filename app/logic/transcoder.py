@@ -0,0 +1,133 @@
+"""
+Audio format negotiation and transcoding
+"""
+
+import io
+import os
+import subprocess
+import threading
+import wave
+from pathlib import Path
+
+import config
+from api.coalescer import RequestCoalescer
+from loguru import logger
+
+from .audio_store import AudioStore
+from .request_log import stage
+
+AUDIO_FORMATS: list[str] = ["mp3", "ogg", "aac", "opus", "wav"]
+
+# formats each provider can return without transcoding
+NATIVE_FORMATS: dict[str, set[str]] = {
+    "edge-tts": {"mp3"},
+    "elevenlabs": {"mp3", "wav"},
+    "ttsmaker": set(AUDIO_FORMATS),
+}
+
+FFMPEG_ARGS: dict[str, list[str]] = {
+    "mp3": ["-c:a", "libmp3lame", "-q:a", "4", "-f", "mp3"],
+    "ogg": ["-c:a", "libvorbis", "-q:a", "4", "-f", "ogg"],
+    "aac": ["-c:a", "aac", "-b:a", "96k", "-f", "adts"],
+    "opus": ["-c:a", "libopus", "-b:a", "32k", "-f", "ogg"],
+    "wav": ["-c:a", "pcm_s16le", "-f", "wav"],
+}
+
+
+def run_ffmpeg(ffmpeg: str, src: str, dst: str, audio_format: str) -> str:
+    """
+    Transcode a file with ffmpeg.
+
+    :param ffmpeg: ffmpeg binary
+    :param src: source file path
+    :param dst: destination file path
+    :param audio_format: target format
+    :return: destination file path
+    """
+    tmp: str = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    subprocess.run(
+        [ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", src, *FFMPEG_ARGS[audio_format], tmp],
+        check=True,
+        capture_output=True,
+    )
+    os.replace(tmp, dst)
+    return dst
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int, channels: int = 1) -> bytes:
+    """
+    Wrap raw signed 16-bit PCM in a WAV container.
+
+    :param pcm: raw audio frames
+    :param sample_rate: sample rate in Hz
+    :param channels: number of channels
+    :return: WAV file content
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class Transcoder:
+    """
+    Convert stored audio to the formats a provider cannot produce natively.
+
+    Transcoded variants sit next to the original in the audio store with their own extension, so every variant is
+    produced once. ffmpeg already runs in its own process, the calling thread only waits for it, and a semaphore bounds
+    the CPU-bound work to `TRANSCODE_WORKERS` ffmpeg processes at once.
+    """
+
+    coalescer = RequestCoalescer("transcoder")
+    slots = threading.BoundedSemaphore(config.TRANSCODE_WORKERS)
+
+    @classmethod
+    def convert(cls, path: Path, audio_format: str) -> Path:
+        """
+        Get a variant of a cached file in another format, transcoding it on a miss.
+
+        :param path: original file path
+        :param audio_format: target format
+        :return: file path of the variant
+        """
+        if path.suffix == f".{audio_format}":
+            return path
+        if audio_format not in FFMPEG_ARGS:
+            raise RuntimeError(f"Unsupported audio format: {audio_format}")
+        target: Path = AudioStore.path(path.with_suffix(f".{audio_format}").name)
+        if target.exists():
+            return target
+        return cls.coalescer.call(target, cls._transcode, path, target, audio_format)
+
+    @classmethod
+    def _transcode(cls, path: Path, target: Path, audio_format: str) -> Path:
+        logger.debug(f"Transcode {path.name} to {audio_format}")
+        try:
+            with cls.slots:
+                run_ffmpeg(config.FFMPEG_BINARY, str(path), str(target), audio_format)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.error(f"Fail to transcode {path.name} to {audio_format}: {e}")
+            raise RuntimeError(f"Fail to transcode audio to {audio_format}") from e
+        AudioStore.add(target)
+        return target
+
+    @classmethod
+    def deliver(cls, audio: bytes | bytearray, native_format: str, audio_format: str) -> str:
+        """
+        Store synthesized audio and return the file to serve in the requested format, timed as the "response" and
+        "transcode" stages of the request.
+
+        :param audio: audio data returned by the provider
+        :param native_format: format of the audio data
+        :param audio_format: format requested by the user
+        :return: file path
+        """
+        if audio_format not in AUDIO_FORMATS:
+            raise RuntimeError(f"Unsupported audio format: {audio_format}")
+        with stage("response"):
+            path: Path = AudioStore.put(audio, native_format)
+        with stage("transcode"):
+            return str(cls.convert(path, audio_format))
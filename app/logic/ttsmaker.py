@@ -1,10 +1,21 @@
 """
 Some logic funtions needed by Gradio components
 """
+import time
+
 import gradio as gr
-from api import TTSMaker
+from api import SampleCache, TTSMaker
+from api.ttsmaker import TokenStatus
 from loguru import logger
 
+from .cancellation import run_cancellable
+from .dropdown_cache import DropdownCache
+from .job_queue import JobQueue
+from .request_log import request_log, stage
+from .text_normalizer import count_characters, normalize_text
+from .token_status import Quota, TokenStatusCache
+from .transcoder import NATIVE_FORMATS
+
 
 def get_ttsmaker_languages(url: str, token: str) -> gr.Dropdown:
     """
@@ -22,8 +33,10 @@ def get_ttsmaker_languages(url: str, token: str) -> gr.Dropdown:
         raise gr.Error("Token of TTSMaker API is empty!")
 
     try:
-        languages_list: list[str] = TTSMaker.get_languages(url, token)
-        return gr.Dropdown(choices=languages_list)
+        with request_log("ttsmaker", "languages"), stage("catalog"):
+            return DropdownCache.get(
+                "ttsmaker", None, lambda: TTSMaker.catalog_version, lambda: TTSMaker.get_languages(url, token)
+            )
     except RuntimeError as e:
         raise gr.Error(e)
 
@@ -48,8 +61,13 @@ def get_ttsmaker_voices(url: str, token: str, language: str) -> gr.Dropdown:
         raise gr.Error("Language is not selected!")
 
     try:
-        voices_list: list[tuple[str, int]] = TTSMaker.get_voices(url, token, language)
-        return gr.Dropdown(choices=voices_list)
+        with request_log("ttsmaker", "voices", language=language), stage("catalog"):
+            return DropdownCache.get(
+                "ttsmaker",
+                language,
+                lambda: TTSMaker.catalog_version,
+                lambda: TTSMaker.get_voices(url, token, language),
+            )
     except RuntimeError as e:
         raise gr.Error(e)
 
@@ -74,12 +92,13 @@ def get_ttsmaker_single_voice_info(
         raise gr.Error("Token of TTSMaker API is empty!")
 
     try:
-        gender, queue, limit, sample_url = TTSMaker.get_detailed_voice_info(url, token, voice_id)
+        with request_log("ttsmaker", "voice_info", voice=voice_id), stage("catalog"):
+            gender, queue, limit, sample_url = TTSMaker.get_detailed_voice_info(url, token, voice_id)
         return (
             gr.Textbox(value=gender, visible=True),
             gr.Textbox(value=queue, visible=True),
             gr.Textbox(value=limit, visible=True),
-            gr.Audio(value=sample_url, visible=True),
+            gr.Audio(value=SampleCache.get(sample_url), visible=True),
             refresh_characters_limit(limit, text),
         )
     except RuntimeError as e:
@@ -94,14 +113,60 @@ def refresh_characters_limit(limit: int, text: str) -> gr.Markdown:
     :param text: current text content
     :return: Markdown component
     """
-    left: int = limit - len(text) if (limit - len(text)) >= 0 else 0
+    count: int = count_characters(text, "ttsmaker")
+    left: int = max(0, limit - count)
     return gr.Markdown(
-        f"Maximum {limit} input characters, {len(text)} characters already entered, {left} characters remaining.",
+        f"Maximum {limit} input characters, {count} characters already entered, {left} characters remaining.",
         visible=True,
     )
 
 
-def create_tts_order(  # pylint: disable=R0913
+def synthesize_ttsmaker(  # pylint: disable=R0913
+    url: str,
+    token: str,
+    text: str,
+    voice_id: int,
+    audio_format: str = "mp3",
+    audio_speed: float = 1.0,
+    audio_volume: float = 0.0,
+    text_paragraph_pause_time: int = 0,
+) -> str:
+    """
+    Create a TTSMaker order, also the runner of TTSMaker jobs
+
+    :param url: URL of TTSMaker API
+    :param token: developer token
+    :param text: text content of audio
+    :param voice_id: ID of speaker voice
+    :param audio_format: mp3/ogg/aac/opus/wav
+    :param audio_speed: range 0.5-2.0
+    :param audio_volume: range 0-10
+    :param text_paragraph_pause_time: auto insert audio paragraph pause time, range 500-5000, unit: millisecond
+    :return: URL of generated audio
+    """
+    text = normalize_text(text, "ttsmaker")
+    if not text:
+        raise RuntimeError("Text content is empty after normalization!")
+    with request_log("ttsmaker", "synthesize", voice=voice_id, characters=len(text)), stage("upstream"):
+        generated_audio_url: str | None = TTSMaker.create_tts_order(
+            url,
+            token,
+            text,
+            voice_id,
+            audio_format,
+            audio_speed,
+            audio_volume,
+            text_paragraph_pause_time,
+        )
+    if generated_audio_url is None:
+        raise RuntimeError("Fail to create TTS order")
+    # a call sharing another caller's in-flight request is only billed once
+    if TTSMaker.coalescer.led():
+        TokenStatusCache.consume("ttsmaker", len(text), url, token)
+    return generated_audio_url
+
+
+async def create_tts_order(  # pylint: disable=R0913
     url: str,
     token: str,
     text: str,
@@ -119,7 +184,7 @@ def create_tts_order(  # pylint: disable=R0913
     :param token: developer token
     :param text: text content of audio
     :param voice_id: ID of speaker voice
-    :param audio_format: mp3/ogg/aac/opus/wav, defaults to "mp3"
+    :param audio_format: mp3/ogg/aac/opus/wav, defaults to "mp3", all of them are produced natively by TTSMaker
     :param audio_speed: range 0.5-2.0, 0.5: 50% speed, 1.0: 100% speed, 2.0: 200% speed, defaults to 1.0
     :param audio_volume: range 0-10, 1: volume+10%, 8: volume+80%, 10: volume+100%, defaults to 0.0
     :param text_paragraph_pause_time: auto insert audio paragraph pause time, range 500-5000, unit: millisecond,
@@ -127,23 +192,77 @@ def create_tts_order(  # pylint: disable=R0913
                                         all pauses will be canceled automatically, defaults to 0
     :return: URL of generated audio
     """
-    if len(text) > int(text_limit):
+    with request_log("ttsmaker", "synthesize", audio_format=audio_format):
+        with stage("validation"):
+            if audio_format not in NATIVE_FORMATS["ttsmaker"]:
+                logger.error(f"Unsupported audio format: {audio_format}")
+                raise gr.Error(f"Unsupported audio format: {audio_format}")
+            if count_characters(text, "ttsmaker") > int(text_limit):
+                logger.error("The length of the text content exceeds the character limit!")
+                raise gr.Error("The length of the text content exceeds the character limit!")
+        try:
+            generated_audio_url: str = await run_cancellable(
+                synthesize_ttsmaker,
+                url,
+                token,
+                text,
+                voice_id,
+                audio_format,
+                audio_speed,
+                audio_volume,
+                text_paragraph_pause_time,
+            )
+            with stage("response"):
+                return gr.Audio(value=generated_audio_url)
+        except RuntimeError as e:
+            raise gr.Error(e)
+
+
+def submit_ttsmaker_job(  # pylint: disable=R0913
+    url: str,
+    token: str,
+    text: str,
+    text_limit: float,
+    voice_id: int,
+    audio_format: str = "mp3",
+    audio_speed: float = 1.0,
+    audio_volume: float = 0.0,
+    text_paragraph_pause_time: int = 0,
+) -> str:
+    """
+    Queue a TTSMaker job instead of creating the order in the event handler
+
+    :param url: URL of TTSMaker API
+    :param token: developer token, kept in memory until the job finishes
+    :param text: text content of audio
+    :param text_limit: maximum allowed characters of the voice
+    :param voice_id: ID of speaker voice
+    :param audio_format: mp3/ogg/aac/opus/wav
+    :param audio_speed: range 0.5-2.0
+    :param audio_volume: range 0-10
+    :param text_paragraph_pause_time: auto insert audio paragraph pause time, range 500-5000, unit: millisecond
+    :return: job id
+    """
+    if audio_format not in NATIVE_FORMATS["ttsmaker"]:
+        logger.error(f"Unsupported audio format: {audio_format}")
+        raise gr.Error(f"Unsupported audio format: {audio_format}")
+    if count_characters(text, "ttsmaker") > int(text_limit):
         logger.error("The length of the text content exceeds the character limit!")
         raise gr.Error("The length of the text content exceeds the character limit!")
-    try:
-        generated_audio_url: str = TTSMaker.create_tts_order(
-            url,
-            token,
-            text,
-            voice_id,
-            audio_format,
-            audio_speed,
-            audio_volume,
-            text_paragraph_pause_time,
-        )
-        return gr.Audio(value=generated_audio_url)
-    except RuntimeError as e:
-        raise gr.Error(e)
+
+    return JobQueue.submit(
+        "ttsmaker",
+        {
+            "url": url,
+            "token": token,
+            "text": text,
+            "voice_id": voice_id,
+            "audio_format": audio_format,
+            "audio_speed": audio_speed,
+            "audio_volume": audio_volume,
+            "text_paragraph_pause_time": text_paragraph_pause_time,
+        },
+    )
 
 
 def check_token_status(url: str, token: str):
@@ -162,22 +281,43 @@ def check_token_status(url: str, token: str):
         raise gr.Error("Token of TTSMaker API is empty!")
 
     try:
-        max_chars, used_chars, avail_chars, left_days = TTSMaker.get_token_status(url, token)
+        quota: Quota = TokenStatusCache.get("ttsmaker", url, token)
         return (
-            gr.Textbox(value=max_chars),
-            gr.Textbox(value=used_chars),
-            gr.Textbox(value=avail_chars),
-            gr.Textbox(value=left_days),
+            gr.Textbox(value=quota.limit),
+            gr.Textbox(value=quota.used),
+            gr.Textbox(value=quota.available),
+            gr.Textbox(value=round(max(0.0, quota.reset_at - time.time()) / 86400, 2)),
         )
     except RuntimeError as e:
         raise gr.Error(e)
 
 
+def fetch_ttsmaker_quota(url: str, token: str) -> Quota:
+    """
+    Fetch the quota of a TTSMaker token
+
+    :param url: URL of TTSMaker API
+    :param token: developer token
+    :return: quota
+    """
+    token_status: TokenStatus | None = TTSMaker.get_token_status(url, token)
+    if token_status is None:
+        raise RuntimeError("Fail to get token status")
+    now: float = time.time()
+    return Quota(
+        used=token_status.used_characters,
+        limit=token_status.max_characters,
+        reset_at=now + token_status.remaining_days * 86400,
+        fetched_at=now,
+    )
+
+
 def clear_ttsmaker_info() -> tuple[gr.Textbox, gr.Textbox, gr.Textbox, gr.Audio, gr.Markdown]:
     """
     Clear all stored TTSMaker information
     """
     if TTSMaker.clear_info():
+        DropdownCache.invalidate("ttsmaker")
         logger.warning("Clear all stored TTSMaker information")
         gr.Warning("Clear all stored TTSMaker information")
         return (
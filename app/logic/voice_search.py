@@ -0,0 +1,317 @@
+"""
+In-memory search index over the voice catalogs of every provider
+"""
+
+import heapq
+import re
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+import gradio as gr
+from api import EdgeTTS, ElevenLabs, TTSMaker
+from loguru import logger
+
+TOKEN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+|[^\W\d_]+")
+FACETS: tuple[str, ...] = ("provider", "locale", "language", "gender", "tag")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Split text into lowercase search tokens, also splitting camel case, e.g. "en-US-AriaNeural" gives en, us, aria and
+    neural.
+
+    :param text: text
+    :return: tokens
+    """
+    return [token.lower() for token in TOKEN.findall(text)]
+
+
+def _deletes(token: str) -> set[str]:
+    """
+    Variants of a token with one character removed, two tokens within one edit share a variant or are variants.
+    """
+    return {token[:i] + token[i + 1 :] for i in range(len(token))}
+
+
+@dataclass(slots=True, frozen=True)
+class VoiceDoc:
+    """
+    A voice of any provider, as indexed.
+    """
+
+    provider: str
+    voice_id: str
+    name: str
+    locale: str
+    gender: str
+    tags: tuple[str, ...]
+
+    @property
+    def key(self) -> tuple[str, str]:
+        """
+        Unique key of the voice across providers.
+        """
+        return self.provider, self.voice_id
+
+    def facet_values(self) -> Iterable[tuple[str, str]]:
+        """
+        Facet values of the voice, lowercase.
+        """
+        yield "provider", self.provider
+        if self.locale:
+            yield "locale", self.locale.lower()
+            yield "language", self.locale.split("-")[0].lower()
+        if self.gender:
+            yield "gender", self.gender.lower()
+        for tag in self.tags:
+            yield "tag", tag.lower()
+
+
+def edge_voices() -> list[VoiceDoc]:
+    """
+    Voices of the loaded edge-tts catalog.
+    """
+    if EdgeTTS.catalog is None:
+        return []
+    return [
+        VoiceDoc(
+            "edge-tts",
+            voice.short_name,
+            voice.friendly_name,
+            voice.locale,
+            voice.gender,
+            voice.categories + voice.personalities,
+        )
+        for voice in EdgeTTS.catalog.voices.values()
+    ]
+
+
+def elevenlabs_voices() -> list[VoiceDoc]:
+    """
+    Voices of the loaded ElevenLabs catalog, labels are tags.
+    """
+    return [
+        VoiceDoc(
+            "elevenlabs",
+            voice.voice_id,
+            voice.name,
+            "",
+            voice.gender,
+            tuple(label for label in (voice.accent, voice.age, voice.use_case, voice.description) if label),
+        )
+        for voice in ElevenLabs.voices_db.values()
+    ]
+
+
+def ttsmaker_voices() -> list[VoiceDoc]:
+    """
+    Voices of the loaded TTSMaker catalog.
+    """
+    return [
+        VoiceDoc("ttsmaker", str(voice.id), voice.name, voice.language, voice.gender, ())
+        for voice in TTSMaker.voices_db.values()
+    ]
+
+
+class VoiceIndex:
+    """
+    Token, prefix, fuzzy and facet index over the voices of every provider.
+
+    Each voice is indexed under the tokens of its name, id, locale, gender and tags. A query token matches voice tokens
+    equal to it, starting with it (through a sorted vocabulary) or, from four characters on, one edit away from it
+    (through one-deletion variants of the vocabulary), and all query tokens must match. Searching never loads a
+    catalog: `sync` compares the catalog version of each provider with the indexed one and re-indexes only the
+    providers that changed.
+    """
+
+    sources: dict[str, tuple[Callable[[], int], Callable[[], list[VoiceDoc]]]] = {}
+    versions: dict[str, int] = {}
+    docs: dict[tuple[str, str], VoiceDoc] = {}
+    postings: dict[str, set[tuple[str, str]]] = {}
+    facets: dict[tuple[str, str], set[tuple[str, str]]] = {}
+    vocabulary: list[str] = []
+    variants: dict[str, set[str]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def register(cls, provider: str, version: Callable[[], int], voices: Callable[[], list[VoiceDoc]]) -> None:
+        """
+        Register the catalog of a provider.
+
+        :param provider: provider name
+        :param version: returns the current catalog version of the provider
+        :param voices: returns the voices of the loaded catalog, without loading it
+        """
+        cls.sources[provider] = (version, voices)
+
+    @staticmethod
+    def _tokens(doc: VoiceDoc) -> set[str]:
+        return set(tokenize(" ".join((doc.voice_id, doc.name, doc.locale, doc.gender, *doc.tags))))
+
+    @classmethod
+    def _remove(cls, provider: str) -> set[str]:
+        """
+        Drop the voices of a provider.
+
+        :return: tokens which no longer match any voice
+        """
+        emptied: set[str] = set()
+        for key in [key for key in cls.docs if key[0] == provider]:
+            doc: VoiceDoc = cls.docs.pop(key)
+            for token in cls._tokens(doc):
+                cls.postings[token].discard(key)
+                if not cls.postings[token]:
+                    del cls.postings[token]
+                    emptied.add(token)
+            for facet in doc.facet_values():
+                cls.facets[facet].discard(key)
+                if not cls.facets[facet]:
+                    del cls.facets[facet]
+        return emptied
+
+    @classmethod
+    def _add(cls, docs: list[VoiceDoc]) -> set[str]:
+        """
+        Index voices.
+
+        :return: tokens new to the vocabulary
+        """
+        added: set[str] = set()
+        for doc in docs:
+            cls.docs[doc.key] = doc
+            for token in cls._tokens(doc):
+                if token not in cls.postings:
+                    cls.postings[token] = set()
+                    added.add(token)
+                cls.postings[token].add(doc.key)
+            for facet in doc.facet_values():
+                cls.facets.setdefault(facet, set()).add(doc.key)
+        return added
+
+    @classmethod
+    def sync(cls) -> None:
+        """
+        Re-index the providers whose catalog changed since they were indexed.
+        """
+        changed: list[str] = [
+            provider for provider, (version, _) in cls.sources.items() if cls.versions.get(provider) != version()
+        ]
+        if not changed:
+            return
+        with cls._lock:
+            for provider in changed:
+                version, voices = cls.sources[provider]
+                current: int = version()
+                emptied: set[str] = cls._remove(provider)
+                added: set[str] = cls._add(voices())
+                for token in emptied - added:
+                    for variant in _deletes(token):
+                        cls.variants[variant].discard(token)
+                for token in added - emptied:
+                    for variant in _deletes(token):
+                        cls.variants.setdefault(variant, set()).add(token)
+                cls.versions[provider] = current
+                logger.debug(f"Voice index: {provider} re-indexed, {len(cls.docs)} voices")
+            cls.vocabulary = sorted(cls.postings)
+
+    @classmethod
+    def _expand(cls, term: str) -> dict[str, float]:
+        """
+        Get the vocabulary tokens matching a query token, weighted exact 3, prefix 2, fuzzy 1.
+        """
+        matches: dict[str, float] = {}
+        start: int = bisect_left(cls.vocabulary, term)
+        for token in cls.vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            matches[token] = 3.0 if token == term else 2.0
+        if len(term) >= 4:
+            for variant in _deletes(term) | {term}:
+                for token in cls.variants.get(variant, ()):
+                    matches.setdefault(token, 1.0)
+                if variant in cls.postings:
+                    matches.setdefault(variant, 1.0)
+        return matches
+
+    @classmethod
+    def search(cls, query: str = "", limit: int = 50, **facets: str | None) -> list[VoiceDoc]:
+        """
+        Search voices of every loaded catalog.
+
+        :param query: free text, every token must match a token of the voice exactly, as a prefix or within one edit
+        :param limit: maximum number of voices returned
+        :param facets: exact filters among provider, locale, language, gender and tag, case insensitive
+        :return: voices, best matches first
+        """
+        cls.sync()
+        with cls._lock:
+            candidates: set[tuple[str, str]] | None = None
+            for facet, value in facets.items():
+                if facet not in FACETS:
+                    raise RuntimeError(f"Unknown facet: {facet}")
+                if value:
+                    keys: set[tuple[str, str]] = cls.facets.get((facet, value.lower()), set())
+                    candidates = keys if candidates is None else candidates & keys
+            scores: dict[tuple[str, str], float] | None = None
+            for term in tokenize(query):
+                matched: dict[tuple[str, str], float] = {}
+                for token, weight in cls._expand(term).items():
+                    for key in cls.postings[token]:
+                        if weight > matched.get(key, 0.0) and (candidates is None or key in candidates):
+                            matched[key] = weight
+                scores = (
+                    matched if scores is None else {key: scores[key] + w for key, w in matched.items() if key in scores}
+                )
+            if scores is None:
+                scores = dict.fromkeys(cls.docs if candidates is None else candidates, 0.0)
+            ranked = heapq.nsmallest(limit, scores, key=lambda key: (-scores[key], cls.docs[key].name))
+            return [cls.docs[key] for key in ranked]
+
+
+VoiceIndex.register("edge-tts", lambda: EdgeTTS.catalog_version, edge_voices)
+VoiceIndex.register("elevenlabs", lambda: ElevenLabs.catalog_version, elevenlabs_voices)
+VoiceIndex.register("ttsmaker", lambda: TTSMaker.catalog_version, ttsmaker_voices)
+
+
+def load_voice_catalogs() -> None:
+    """
+    Load the catalogs that need no credentials, TTSMaker voices are indexed once its tab loaded them.
+    """
+    for name, load in (("edge-tts", EdgeTTS.get_catalog), ("elevenlabs", ElevenLabs.get_voices)):
+        try:
+            load()
+        except Exception as e:  # pylint: disable=W0718
+            logger.warning(f"Fail to load {name} voices for the search index: {e}")
+
+
+def search_voices(query: str, provider: str, language: str, gender: str) -> gr.Dataframe:
+    """
+    Search the voices of every provider.
+
+    :param query: free text
+    :param provider: provider name, empty for all
+    :param language: language code such as "en" or locale such as "en-US", empty for all
+    :param gender: gender, empty for all
+    :return: dataframe component of the matching voices
+    """
+    location: dict[str, str] = {"locale" if "-" in (language or "") else "language": language}
+    try:
+        voices: list[VoiceDoc] = VoiceIndex.search(query, provider=provider, gender=gender, **location)
+    except RuntimeError as e:
+        raise gr.Error(e)
+    return gr.Dataframe(
+        value=[
+            [voice.provider, voice.voice_id, voice.name, voice.locale, voice.gender, ", ".join(voice.tags)]
+            for voice in voices
+        ]
+    )
+
+
+def refresh_voice_search(query: str, provider: str, language: str, gender: str) -> gr.Dataframe:
+    """
+    Load the catalogs, then search.
+    """
+    load_voice_catalogs()
+    return search_voices(query, provider, language, gender)
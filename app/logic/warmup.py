@@ -0,0 +1,200 @@
+"""
+Cache warming from the most requested prompts
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable, Iterator
+
+import config
+from loguru import logger
+
+from .request_log import read_request_logs, request_log
+from .segment_cache import SegmentCache
+from .text_normalizer import normalize_text
+
+
+@dataclass(slots=True, frozen=True)
+class Prompt:
+    """
+    A synthesis request as seen by the cache: provider, voice, normalized text and the settings changing the audio.
+    """
+
+    provider: str
+    voice: str
+    text: str
+    settings: tuple[tuple[str, Any], ...] = ()
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> "Prompt":
+        """
+        Build a prompt from a request log entry or a line of a prompt list.
+
+        :param data: fields of the prompt
+        :return: prompt
+        """
+        provider: str = data["provider"]
+        return cls(
+            provider=provider,
+            voice=str(data["voice"]),
+            text=normalize_text(data["text"], provider),
+            settings=tuple(sorted((data.get("settings") or {}).items())),
+        )
+
+    @property
+    def cache_key(self) -> str:
+        """
+        Key of the whole text in the audio cache.
+        """
+        return SegmentCache.key(self.provider, self.voice, self.text, **dict(self.settings))
+
+
+def mine_request_logs(entries: Iterable[dict[str, Any]]) -> Counter[Prompt]:
+    """
+    Count the successful synthesis requests per prompt, only entries written with `REQUEST_LOG_TEXT` have one.
+
+    :param entries: request entries
+    :return: number of requests of each prompt
+    """
+    counts: Counter[Prompt] = Counter()
+    for entry in entries:
+        if entry.get("operation") != "synthesize" or entry.get("status") != "ok" or not entry.get("text"):
+            continue
+        try:
+            counts[Prompt.from_json(entry)] += 1
+        except (KeyError, TypeError):
+            continue
+    return counts
+
+
+def read_prompt_list(path: str) -> Counter[Prompt]:
+    """
+    Read a prompt list, JSON lines of provider, voice, text, settings and an optional request count.
+
+    :param path: file path
+    :return: number of requests of each prompt, 1 when the line does not say
+    """
+    counts: Counter[Prompt] = Counter()
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                data: dict[str, Any] = json.loads(line)
+                counts[Prompt.from_json(data)] += int(data.get("count", 1))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Ignore line {number} of {path}: {e}")
+    return counts
+
+
+class CacheWarmer:
+    """
+    Pre-synthesize the most requested prompts into the audio cache, so they are served from it right after a restart.
+
+    Prompts are warmed in order of popularity through the same synthesis function as user requests, so they land
+    under the same cache keys. Prompts already cached cost nothing, the others are skipped once they would take a
+    provider over its `WARMUP_BUDGETS` character budget for the run.
+    """
+
+    runners: dict[str, Callable[..., Any]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def register(cls, provider: str, runner: Callable[..., Any]) -> None:
+        """
+        Register the function synthesizing a prompt of a provider into the cache.
+
+        :param provider: provider name
+        :param runner: function called with the voice, the text and the settings of the prompt as keyword arguments
+        """
+        cls.runners[provider] = runner
+
+    @classmethod
+    def top_prompts(cls, top_n: int = config.WARMUP_TOP_N) -> list[Prompt]:
+        """
+        Get the most requested prompts of the providers that can be warmed.
+
+        :param top_n: number of prompts
+        :return: prompts, most requested first
+        """
+        counts: Counter[Prompt] = (
+            read_prompt_list(config.WARMUP_PROMPTS) if config.WARMUP_PROMPTS else mine_request_logs(read_request_logs())
+        )
+        return [
+            prompt
+            for prompt, _ in counts.most_common()
+            if prompt.provider in cls.runners and config.WARMUP_BUDGETS.get(prompt.provider, 0) > 0
+        ][:top_n]
+
+    @classmethod
+    def warm(cls, prompts: Iterable[Prompt]) -> dict[str, int]:
+        """
+        Synthesize the prompts that are not cached yet, within the character budget of each provider.
+
+        :param prompts: prompts, most requested first
+        :return: characters synthesized per provider
+        """
+        if not cls._lock.acquire(blocking=False):
+            logger.warning("Cache warming already running")
+            return {}
+        spent: Counter[str] = Counter()
+        try:
+            cached = failed = skipped = 0
+            for prompt in prompts:
+                if SegmentCache.lookup(prompt.cache_key) is not None:
+                    cached += 1
+                    continue
+                if spent[prompt.provider] + len(prompt.text) > config.WARMUP_BUDGETS.get(prompt.provider, 0):
+                    skipped += 1
+                    continue
+                try:
+                    # a request of its own, so warming is not mined as user traffic
+                    with request_log(prompt.provider, "warmup"):
+                        cls.runners[prompt.provider](voice=prompt.voice, text=prompt.text, **dict(prompt.settings))
+                    spent[prompt.provider] += len(prompt.text)
+                except Exception as e:  # pylint: disable=W0718
+                    failed += 1
+                    logger.warning(f"Fail to warm {prompt.provider} prompt: {e}")
+            logger.info(
+                f"Cache warming: {sum(spent.values())} characters synthesized {dict(spent)}, {cached} already cached, "
+                f"{skipped} over budget, {failed} failed"
+            )
+        finally:
+            cls._lock.release()
+        return dict(spent)
+
+    @classmethod
+    def _schedule(cls) -> Iterator[float]:
+        """
+        Yield the seconds to wait before each run.
+        """
+        if config.WARMUP_ON_START:
+            yield 0
+        if not config.WARMUP_HOUR:
+            return
+        while True:
+            now: datetime = datetime.now()
+            target: datetime = now.replace(hour=int(config.WARMUP_HOUR), minute=0, second=0, microsecond=0)
+            if target <= now:
+                target += timedelta(days=1)
+            yield (target - now).total_seconds()
+
+    @classmethod
+    def start(cls) -> None:
+        """
+        Warm the cache in a background thread at startup and/or every day at `WARMUP_HOUR`, as configured.
+        """
+
+        def run() -> None:
+            for delay in cls._schedule():
+                time.sleep(delay)
+                try:
+                    cls.warm(cls.top_prompts())
+                except Exception as e:  # pylint: disable=W0718
+                    logger.error(f"Cache warming failed: {e}")
+
+        threading.Thread(target=run, name="cache-warmer", daemon=True).start()
@@ -0,0 +1,23 @@
+"""
+Command line of the cache warmer: `python -m logic.warmup_cli [--top N] [--dry-run]` from `app`
+"""
+
+import argparse
+
+import config
+
+from .providers import register_providers
+from .warmup import CacheWarmer, Prompt
+
+if __name__ == "__main__":
+    register_providers()
+    parser = argparse.ArgumentParser(description="Warm the synthesis cache with the most requested prompts")
+    parser.add_argument("--top", type=int, default=config.WARMUP_TOP_N, help="number of prompts to warm")
+    parser.add_argument("--dry-run", action="store_true", help="only list the prompts")
+    args = parser.parse_args()
+    top: list[Prompt] = CacheWarmer.top_prompts(args.top)
+    if args.dry_run:
+        for item in top:
+            print(f"{item.provider:<12} {item.voice:<32} {item.text[:60]!r}")
+    else:
+        CacheWarmer.warm(top)
@@ -1,4 +1,8 @@
 """
 Gradio Web UI module
 """
+from .audio_routes import register_audio_routes
+from .job_routes import register_job_routes
+from .metrics_routes import register_metrics_routes
 from .ui import ui
+from .voice_routes import register_voice_routes
@@ -0,0 +1,63 @@
+"""
+HTTP routes serving the audio store
+"""
+
+import mimetypes
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from logic.audio_store import AudioStore
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single `bytes=start-end` Range header.
+
+    :param header: value of the Range header
+    :param size: size of the file
+    :return: first and last byte (inclusive), None if the header is absent or not a single byte range
+    """
+    if not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[6:].strip().partition("-")
+    if not start_text:
+        # suffix range, the last N bytes
+        length: int = int(end_text)
+        return max(size - length, 0), size - 1
+    start: int = int(start_text)
+    end: int = int(end_text) if end_text else size - 1
+    return start, min(end, size - 1)
+
+
+def register_audio_routes(app: FastAPI) -> None:
+    """
+    Add `/audio/{name}` to the Gradio server, serving stored audio with range request support.
+
+    :param app: FastAPI app of the Gradio server
+    """
+
+    @app.get("/audio/{name}")
+    def get_audio(name: str, request: Request) -> StreamingResponse:
+        try:
+            size: int = AudioStore.size(name)
+        except (FileNotFoundError, RuntimeError) as e:
+            raise HTTPException(status_code=404, detail="Audio not found") from e
+
+        media_type: str = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        headers: dict[str, str] = {"Accept-Ranges": "bytes"}
+        try:
+            byte_range: tuple[int, int] | None = parse_range(request.headers.get("Range", ""), size)
+        except ValueError:
+            byte_range = None
+        if byte_range is None:
+            headers["Content-Length"] = str(size)
+            return StreamingResponse(AudioStore.iter_range(name), media_type=media_type, headers=headers)
+
+        start, end = byte_range
+        if start > end:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            AudioStore.iter_range(name, start, end), status_code=206, media_type=media_type, headers=headers
+        )
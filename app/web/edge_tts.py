@@ -1,14 +1,21 @@
 """
 Edge TTS Gradio UI
 """
+import config
 import gradio as gr
 from logic.edgetts import (
     clear_edgetts_info,
     get_edgetts_audio,
     get_edgetts_language_code,
+    get_edgetts_script_audio,
     get_edgetts_single_voice_info,
     get_edgetts_voices,
+    submit_edgetts_job,
 )
+from logic.jobs import follow_job
+from logic.transcoder import AUDIO_FORMATS
+
+from .lanes import JOB_LANE, METADATA_LANE, synthesis_lane
 
 # pylint: disable=E1101
 
@@ -49,6 +56,30 @@ with gr.Tab(label="Edge TTS"):
                     scale=1,
                 )
 
+            with gr.Accordion(label="Advanced Settings", open=False):
+                edgetts_audio_format = gr.Dropdown(
+                    label="Audio Format",
+                    info="edge-tts produces mp3, other formats are transcoded on the server.",
+                    choices=AUDIO_FORMATS,
+                    value="mp3",
+                    interactive=True,
+                )
+                edgetts_incremental = gr.Checkbox(
+                    label="Incremental",
+                    info="Synthesize sentence by sentence and reuse sentences already synthesized with this voice.",
+                    value=False,
+                    interactive=True,
+                )
+                edgetts_pause = gr.Slider(
+                    label="Paragraph Pause",
+                    info="Silence inserted between paragraphs (lines), in seconds.",
+                    value=0,
+                    minimum=0,
+                    maximum=5,
+                    step=0.1,
+                    interactive=True,
+                )
+
         with gr.Column():
             edgetts_text_input = gr.Textbox(
                 placeholder="Input text here...",
@@ -58,28 +89,86 @@ with gr.Tab(label="Edge TTS"):
             )
             with gr.Row():
                 edgetts_clear_button = gr.ClearButton(value="Clear")
+                edgetts_queue_button = gr.Button(value="Queue")
                 edgetts_submit_button = gr.Button(value="Submit", variant="primary")
-            edgetts_audio_output = gr.Audio(label="TTS Result", type="numpy", format="mp3")
+            edgetts_audio_output = gr.Audio(label="TTS Result", type="filepath")
+            with gr.Row():
+                edgetts_job_id = gr.Textbox(label="Job ID", interactive=False, max_lines=1, show_copy_button=True)
+                edgetts_job_status = gr.Markdown(visible=False)
+
+    with gr.Accordion(label="Script", open=False):
+        with gr.Row():
+            with gr.Column(variant="panel"):
+                edgetts_script_speakers = gr.Textbox(
+                    label="Speakers",
+                    info='One speaker per line, as "Name: voice", e.g. "Alice: en-US-AriaNeural".',
+                    placeholder="Alice: en-US-AriaNeural\nBob: en-US-GuyNeural",
+                    lines=4,
+                    interactive=True,
+                )
+                edgetts_script_gap = gr.Slider(
+                    label="Line Gap",
+                    info="Silence inserted between two lines, in seconds.",
+                    value=config.SCRIPT_GAP,
+                    minimum=0,
+                    maximum=5,
+                    step=0.1,
+                    interactive=True,
+                )
+            with gr.Column():
+                edgetts_script_input = gr.Textbox(
+                    label="Script",
+                    info='One line per speech, as "Name: text".',
+                    placeholder="Alice: Hello Bob!\nBob: Hi Alice, how are you?",
+                    lines=7,
+                    interactive=True,
+                )
+                edgetts_script_button = gr.Button(value="Synthesize Script", variant="primary")
 
 edgetts_language_code.focus(
     fn=get_edgetts_language_code,
     outputs=edgetts_language_code,
+    **METADATA_LANE,
 )
 
 edgetts_voices_input.focus(
     fn=get_edgetts_voices,
     inputs=edgetts_language_code,
     outputs=edgetts_voices_input,
+    **METADATA_LANE,
 )
 
 edgetts_voices_input.select(
     fn=get_edgetts_single_voice_info,
     inputs=edgetts_voices_input,
     outputs=[edgetts_gender, edgetts_content_categories, edgetts_voice_personalities],
+    **METADATA_LANE,
+)
+
+edgetts_submit_event = edgetts_submit_button.click(
+    fn=get_edgetts_audio,
+    inputs=[edgetts_text_input, edgetts_voices_input, edgetts_audio_format, edgetts_incremental, edgetts_pause],
+    outputs=edgetts_audio_output,
+    **synthesis_lane("edge-tts"),
+)
+
+edgetts_script_event = edgetts_script_button.click(
+    fn=get_edgetts_script_audio,
+    inputs=[edgetts_script_speakers, edgetts_script_input, edgetts_script_gap, edgetts_audio_format],
+    outputs=edgetts_audio_output,
+    **synthesis_lane("edge-tts"),
 )
 
-edgetts_submit_button.click(
-    fn=get_edgetts_audio, inputs=[edgetts_text_input, edgetts_voices_input], outputs=edgetts_audio_output
+edgetts_queue_button.click(
+    fn=submit_edgetts_job,
+    inputs=[edgetts_text_input, edgetts_voices_input, edgetts_audio_format, edgetts_incremental, edgetts_pause],
+    outputs=edgetts_job_id,
+    **JOB_LANE,
+).then(
+    fn=follow_job,
+    inputs=edgetts_job_id,
+    outputs=[edgetts_job_status, edgetts_audio_output],
+    **JOB_LANE,
 )
 
 edgetts_clear_button.add(
@@ -90,11 +179,16 @@ edgetts_clear_button.add(
         edgetts_content_categories,
         edgetts_voice_personalities,
         edgetts_text_input,
+        edgetts_script_speakers,
+        edgetts_script_input,
         edgetts_audio_output,
+        edgetts_job_id,
     ]
 )
 
 edgetts_clear_button.click(
     fn=clear_edgetts_info,
     outputs=[edgetts_gender, edgetts_content_categories, edgetts_voice_personalities],
+    cancels=[edgetts_submit_event, edgetts_script_event],
+    **METADATA_LANE,
 )
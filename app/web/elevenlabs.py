@@ -8,7 +8,13 @@ from logic.elevenlabs import (
     get_elevenlabs_single_voice_info,
     get_elevenlabs_token_status,
     get_elevenlabs_voices,
+    stream_elevenlabs_audio,
+    submit_elevenlabs_job,
 )
+from logic.jobs import follow_job
+from logic.transcoder import AUDIO_FORMATS
+
+from .lanes import JOB_LANE, METADATA_LANE, synthesis_lane
 
 # pylint: disable=E1101
 
@@ -141,6 +147,41 @@ with gr.Tab(label="ElevenLabs"):
                     value="True",
                     interactive=True,
                 )
+                elevenlabs_latency = gr.Slider(
+                    label="Streaming Latency Optimization",
+                    info="""Only used by Stream. 0: default mode (no latency optimizations),
+                        1-3: increasingly strong latency optimizations,
+                        4: maximum optimizations, also turns off the text normalizer.""",
+                    value=1,
+                    minimum=0,
+                    maximum=4,
+                    step=1,
+                    interactive=True,
+                )
+
+            with gr.Accordion(label="Advanced Settings", open=False):
+                elevenlabs_audio_format = gr.Dropdown(
+                    label="Audio Format",
+                    info="ElevenLabs produces mp3 and wav, other formats are transcoded on the server.",
+                    choices=AUDIO_FORMATS,
+                    value="mp3",
+                    interactive=True,
+                )
+                elevenlabs_incremental = gr.Checkbox(
+                    label="Incremental",
+                    info="Synthesize sentence by sentence and reuse sentences already synthesized with these settings.",
+                    value=False,
+                    interactive=True,
+                )
+                elevenlabs_pause = gr.Slider(
+                    label="Paragraph Pause",
+                    info="Silence inserted between paragraphs (lines), in seconds.",
+                    value=0,
+                    minimum=0,
+                    maximum=5,
+                    step=0.1,
+                    interactive=True,
+                )
 
         with gr.Column():
             elevenlabs_text_input = gr.Textbox(
@@ -151,8 +192,20 @@ with gr.Tab(label="ElevenLabs"):
             )
             with gr.Row():
                 elevenlabs_clear_button = gr.ClearButton(value="Clear")
+                elevenlabs_stream_button = gr.Button(value="Stream")
+                elevenlabs_queue_button = gr.Button(value="Queue")
                 elevenlabs_submit_button = gr.Button(value="Submit", variant="primary")
-            elevenlabs_audio_output = gr.Audio(label="TTS Result", type="numpy", format="mp3", interactive=False)
+            elevenlabs_audio_output = gr.Audio(label="TTS Result", type="filepath", interactive=False)
+            elevenlabs_stream_output = gr.Audio(
+                label="Streaming Result",
+                format="mp3",
+                streaming=True,
+                autoplay=True,
+                interactive=False,
+            )
+            with gr.Row():
+                elevenlabs_job_id = gr.Textbox(label="Job ID", interactive=False, max_lines=1, show_copy_button=True)
+                elevenlabs_job_status = gr.Markdown(visible=False)
 
 elevenlabs_token_input.submit(
     fn=get_elevenlabs_token_status,
@@ -163,11 +216,13 @@ elevenlabs_token_input.submit(
         elevenlabs_characters_limit,
         elevenlabs_characters_reset_time,
     ],
+    **METADATA_LANE,
 )
 
 elevenlabs_voices_input.focus(
     fn=get_elevenlabs_voices,
     outputs=elevenlabs_voices_input,
+    **METADATA_LANE,
 )
 
 elevenlabs_voices_input.select(
@@ -181,9 +236,10 @@ elevenlabs_voices_input.select(
         elevenlabs_usecase,
         elevenlabs_sample_audio,
     ],
+    **METADATA_LANE,
 )
 
-elevenlabs_submit_button.click(
+elevenlabs_submit_event = elevenlabs_submit_button.click(
     fn=get_elevenlabs_audio,
     inputs=[
         elevenlabs_token_input,
@@ -194,8 +250,53 @@ elevenlabs_submit_button.click(
         elevenlabs_similarity,
         elevenlabs_style,
         elevenlabs_spaker_boost,
+        elevenlabs_audio_format,
+        elevenlabs_incremental,
+        elevenlabs_pause,
     ],
     outputs=elevenlabs_audio_output,
+    **synthesis_lane("elevenlabs"),
+)
+
+elevenlabs_stream_event = elevenlabs_stream_button.click(
+    fn=stream_elevenlabs_audio,
+    inputs=[
+        elevenlabs_token_input,
+        elevenlabs_text_input,
+        elevenlabs_voices_input,
+        elevenlabs_model,
+        elevenlabs_stability,
+        elevenlabs_similarity,
+        elevenlabs_style,
+        elevenlabs_spaker_boost,
+        elevenlabs_latency,
+    ],
+    outputs=elevenlabs_stream_output,
+    **synthesis_lane("elevenlabs"),
+)
+
+elevenlabs_queue_button.click(
+    fn=submit_elevenlabs_job,
+    inputs=[
+        elevenlabs_token_input,
+        elevenlabs_text_input,
+        elevenlabs_voices_input,
+        elevenlabs_model,
+        elevenlabs_stability,
+        elevenlabs_similarity,
+        elevenlabs_style,
+        elevenlabs_spaker_boost,
+        elevenlabs_audio_format,
+        elevenlabs_incremental,
+        elevenlabs_pause,
+    ],
+    outputs=elevenlabs_job_id,
+    **JOB_LANE,
+).then(
+    fn=follow_job,
+    inputs=elevenlabs_job_id,
+    outputs=[elevenlabs_job_status, elevenlabs_audio_output],
+    **JOB_LANE,
 )
 
 elevenlabs_clear_button.add(
@@ -213,6 +314,8 @@ elevenlabs_clear_button.add(
         elevenlabs_characters_reset_time,
         elevenlabs_text_input,
         elevenlabs_audio_output,
+        elevenlabs_stream_output,
+        elevenlabs_job_id,
     ]
 )
 
@@ -226,4 +329,6 @@ elevenlabs_clear_button.click(
         elevenlabs_usecase,
         elevenlabs_sample_audio,
     ],
+    cancels=[elevenlabs_submit_event, elevenlabs_stream_event],
+    **METADATA_LANE,
 )
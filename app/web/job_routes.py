@@ -0,0 +1,39 @@
+"""
+HTTP routes of the job queue
+"""
+
+from dataclasses import asdict
+from typing import Any
+
+from fastapi import Body, FastAPI, HTTPException
+from logic.audio_store import AudioStore
+from logic.job_queue import Job, JobQueue
+
+
+def register_job_routes(app: FastAPI) -> None:
+    """
+    Add `POST /jobs` and `GET /jobs/{job_id}` to the Gradio server, job results are served by `/audio/{name}`.
+
+    :param app: FastAPI app of the Gradio server
+    """
+
+    @app.post("/jobs")
+    def submit_job(
+        provider: str = Body(),
+        payload: dict[str, Any] = Body(),
+        priority: str | None = Body(default=None),
+    ) -> dict[str, str]:
+        try:
+            if provider in JobQueue.runners:
+                JobQueue.validate(provider, payload)
+            return {"id": JobQueue.submit(provider, payload, priority)}
+        except RuntimeError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+
+    @app.get("/jobs/{job_id}")
+    def get_job(job_id: str) -> dict[str, Any]:
+        try:
+            job: Job = JobQueue.get(job_id)
+        except RuntimeError as e:
+            raise HTTPException(status_code=404, detail=str(e)) from e
+        return {**asdict(job), "result": AudioStore.url(job.result) if job.result else None}
@@ -0,0 +1,47 @@
+"""
+Jobs Gradio UI
+"""
+import gradio as gr
+from logic.jobs import follow_job, get_job_status
+
+from .lanes import JOB_LANE
+
+# pylint: disable=E1101
+
+with gr.Tab(label="Jobs"):
+    with gr.Row():
+        with gr.Column(variant="panel"):
+            jobs_id_input = gr.Textbox(
+                label="Job ID",
+                info="Paste the id of a queued job. Press Enter to refresh its status once.",
+                interactive=True,
+                max_lines=1,
+            )
+            with gr.Row():
+                jobs_refresh_button = gr.Button(value="Refresh")
+                jobs_follow_button = gr.Button(value="Follow", variant="primary")
+
+        with gr.Column():
+            jobs_status = gr.Markdown(visible=False)
+            jobs_audio_output = gr.Audio(label="Job Result", interactive=False)
+
+jobs_id_input.submit(
+    fn=get_job_status,
+    inputs=jobs_id_input,
+    outputs=[jobs_status, jobs_audio_output],
+    **JOB_LANE,
+)
+
+jobs_refresh_button.click(
+    fn=get_job_status,
+    inputs=jobs_id_input,
+    outputs=[jobs_status, jobs_audio_output],
+    **JOB_LANE,
+)
+
+jobs_follow_button.click(
+    fn=follow_job,
+    inputs=jobs_id_input,
+    outputs=[jobs_status, jobs_audio_output],
+    **JOB_LANE,
+)
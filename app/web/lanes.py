@@ -0,0 +1,25 @@
+"""
+Concurrency lanes of the Gradio events
+"""
+from typing import Any
+
+import config
+
+# catalog, voice info, token and clear events: short and mostly cached, they must not wait behind synthesis
+METADATA_LANE: dict[str, Any] = {"concurrency_id": "metadata", "concurrency_limit": config.METADATA_CONCURRENCY}
+
+# job submission and following, following holds its slot while it polls
+JOB_LANE: dict[str, Any] = {"concurrency_id": "jobs", "concurrency_limit": config.JOB_CONCURRENCY}
+
+
+def synthesis_lane(provider: str) -> dict[str, Any]:
+    """
+    Get the lane of the synthesis events of a provider, shared by all their buttons.
+
+    :param provider: provider name
+    :return: keyword arguments of a Gradio event
+    """
+    return {
+        "concurrency_id": f"synthesis-{provider}",
+        "concurrency_limit": config.SYNTHESIS_CONCURRENCY.get(provider, config.SYNTHESIS_CONCURRENCY_DEFAULT),
+    }
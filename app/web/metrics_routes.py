@@ -0,0 +1,19 @@
+"""
+HTTP route of the metrics
+"""
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from logic.status import render_metrics
+
+
+def register_metrics_routes(app: FastAPI) -> None:
+    """
+    Add `GET /metrics` (Prometheus text format) to the Gradio server.
+
+    :param app: FastAPI app of the Gradio server
+    """
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def get_metrics() -> str:
+        return render_metrics()
@@ -0,0 +1,23 @@
+"""
+Provider status Gradio UI
+"""
+import gradio as gr
+from logic.status import describe_breakers, get_breaker_status
+
+# pylint: disable=E1101
+
+with gr.Tab(label="Status") as status_tab:
+    status_breakers = gr.Markdown(value=describe_breakers)
+    status_refresh_button = gr.Button(value="Refresh")
+
+status_tab.select(
+    fn=get_breaker_status,
+    outputs=status_breakers,
+    queue=False,
+)
+
+status_refresh_button.click(
+    fn=get_breaker_status,
+    outputs=status_breakers,
+    queue=False,
+)
@@ -2,6 +2,8 @@
 TTSMaker Gradio UI
 """
 import gradio as gr
+from logic.jobs import follow_job
+from logic.transcoder import AUDIO_FORMATS
 from logic.ttsmaker import (
     check_token_status,
     clear_ttsmaker_info,
@@ -10,8 +12,11 @@ from logic.ttsmaker import (
     get_ttsmaker_single_voice_info,
     get_ttsmaker_voices,
     refresh_characters_limit,
+    submit_ttsmaker_job,
 )
 
+from .lanes import JOB_LANE, METADATA_LANE, synthesis_lane
+
 # pylint: disable=E1101
 
 with gr.Tab(label="TTSMaker"):
@@ -101,7 +106,7 @@ with gr.Tab(label="TTSMaker"):
             with gr.Accordion(label="Advanced Settings", open=False):
                 ttsmaker_audio_format = gr.Dropdown(
                     label="Audio Format",
-                    choices=["mp3", "ogg", "acc", "opus", "wav"],
+                    choices=AUDIO_FORMATS,
                     value="mp3",
                     interactive=True,
                 )
@@ -147,8 +152,12 @@ with gr.Tab(label="TTSMaker"):
             ttsmaker_left_characters = gr.Markdown(visible=False)
             with gr.Row():
                 ttsmaker_clear_button = gr.ClearButton(value="Clear")
+                ttsmaker_queue_button = gr.Button(value="Queue")
                 ttsmaker_submit_button = gr.Button(value="Submit", variant="primary")
             ttsmaker_audio_output = gr.Audio(label="TTS Result", interactive=False)
+            with gr.Row():
+                ttsmaker_job_id = gr.Textbox(label="Job ID", interactive=False, max_lines=1, show_copy_button=True)
+                ttsmaker_job_status = gr.Markdown(visible=False)
 
 ttsmaker_clear_button.add(
     components=[
@@ -164,44 +173,46 @@ ttsmaker_clear_button.add(
         ttsmaker_token_used,
         ttsmaker_token_available,
         ttsmaker_token_remaining_days,
+        ttsmaker_job_id,
     ]
 )
-ttsmaker_clear_button.click(
-    fn=clear_ttsmaker_info,
-    outputs=[ttsmaker_gender, ttsmaker_queue, ttsmaker_text_limit, ttsmaker_sample_audio],
-)
 
 ttsmaker_token_input.submit(
     fn=check_token_status,
     inputs=[ttsmaker_url_input, ttsmaker_token_input],
     outputs=[ttsmaker_token_max, ttsmaker_token_used, ttsmaker_token_available, ttsmaker_token_remaining_days],
+    **METADATA_LANE,
 )
 
 ttsmaker_languages_input.focus(
     fn=get_ttsmaker_languages,
     inputs=[ttsmaker_url_input, ttsmaker_token_input],
     outputs=ttsmaker_languages_input,
+    **METADATA_LANE,
 )
 
 ttsmaker_voices_input.focus(
     fn=get_ttsmaker_voices,
     inputs=[ttsmaker_url_input, ttsmaker_token_input, ttsmaker_languages_input],
     outputs=ttsmaker_voices_input,
+    **METADATA_LANE,
 )
 
 ttsmaker_voices_input.select(
     fn=get_ttsmaker_single_voice_info,
     inputs=[ttsmaker_url_input, ttsmaker_token_input, ttsmaker_voices_input, ttsmaker_text_input],
     outputs=[ttsmaker_gender, ttsmaker_queue, ttsmaker_text_limit, ttsmaker_sample_audio, ttsmaker_left_characters],
+    **METADATA_LANE,
 )
 
 ttsmaker_text_input.input(
     fn=refresh_characters_limit,
     inputs=[ttsmaker_text_limit, ttsmaker_text_input],
     outputs=ttsmaker_left_characters,
+    queue=False,
 )
 
-ttsmaker_submit_button.click(
+ttsmaker_submit_event = ttsmaker_submit_button.click(
     fn=create_tts_order,
     inputs=[
         ttsmaker_url_input,
@@ -215,4 +226,34 @@ ttsmaker_submit_button.click(
         ttsmaker_text_paragraph_pause_time,
     ],
     outputs=ttsmaker_audio_output,
+    **synthesis_lane("ttsmaker"),
+)
+
+ttsmaker_clear_button.click(
+    fn=clear_ttsmaker_info,
+    outputs=[ttsmaker_gender, ttsmaker_queue, ttsmaker_text_limit, ttsmaker_sample_audio],
+    cancels=[ttsmaker_submit_event],
+    **METADATA_LANE,
+)
+
+ttsmaker_queue_button.click(
+    fn=submit_ttsmaker_job,
+    inputs=[
+        ttsmaker_url_input,
+        ttsmaker_token_input,
+        ttsmaker_text_input,
+        ttsmaker_text_limit,
+        ttsmaker_voices_input,
+        ttsmaker_audio_format,
+        ttsmaker_audio_speed,
+        ttsmaker_audio_volume,
+        ttsmaker_text_paragraph_pause_time,
+    ],
+    outputs=ttsmaker_job_id,
+    **JOB_LANE,
+).then(
+    fn=follow_job,
+    inputs=ttsmaker_job_id,
+    outputs=[ttsmaker_job_status, ttsmaker_audio_output],
+    **JOB_LANE,
 )
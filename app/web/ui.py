@@ -1,8 +1,15 @@
 """
 User Interface
 """
+import os
+
+import config
 import gradio as gr
 
+# Gradio copies the files it serves into its own directory, apart from the audio store, so evicting stored audio never
+# breaks a result already shown
+os.environ.setdefault("GRADIO_TEMP_DIR", os.path.join(config.CACHE_DIR, "gradio"))
+
 # Gradio UI
 with gr.Blocks(title="Free TTS API Demo") as ui:
     gr.HTML(value="""<h1 align="center">Free TTS API Demo</h1>""")
@@ -16,3 +23,12 @@ with gr.Blocks(title="Free TTS API Demo") as ui:
 
     # TTS Maker
     from . import ttsmaker  # isort: skip
+
+    # Jobs
+    from . import jobs  # isort: skip
+
+    # Voice search
+    from . import voice_search  # isort: skip
+
+    # Provider status
+    from . import status  # isort: skip
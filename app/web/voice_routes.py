@@ -0,0 +1,35 @@
+"""
+HTTP route of the voice search
+"""
+
+from dataclasses import asdict
+from typing import Any
+
+from fastapi import FastAPI, HTTPException
+from logic.voice_search import VoiceIndex
+
+
+def register_voice_routes(app: FastAPI) -> None:
+    """
+    Add `GET /voices/search` to the Gradio server.
+
+    :param app: FastAPI app of the Gradio server
+    """
+
+    @app.get("/voices/search")
+    def search_voices(
+        q: str = "",
+        provider: str | None = None,
+        locale: str | None = None,
+        language: str | None = None,
+        gender: str | None = None,
+        tag: str | None = None,
+        limit: int = 50,
+    ) -> list[dict[str, Any]]:
+        try:
+            voices = VoiceIndex.search(
+                q, limit, provider=provider, locale=locale, language=language, gender=gender, tag=tag
+            )
+        except RuntimeError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        return [asdict(voice) for voice in voices]
@@ -0,0 +1,39 @@
+"""
+Voice search Gradio UI
+"""
+import gradio as gr
+from logic.voice_search import refresh_voice_search, search_voices
+
+from .lanes import METADATA_LANE
+
+# pylint: disable=E1101
+
+with gr.Tab(label="Voices") as voice_search_tab:
+    with gr.Row():
+        voice_search_query = gr.Textbox(label="Search", placeholder="name, language, gender, style...", scale=3)
+        voice_search_provider = gr.Dropdown(
+            label="Provider", choices=["", "edge-tts", "elevenlabs", "ttsmaker"], value="", scale=1
+        )
+        voice_search_language = gr.Textbox(label="Language", placeholder="en or en-US", scale=1)
+        voice_search_gender = gr.Dropdown(label="Gender", choices=["", "female", "male"], value="", scale=1)
+    voice_search_results = gr.Dataframe(
+        headers=["Provider", "Voice", "Name", "Locale", "Gender", "Tags"], interactive=False, wrap=True
+    )
+
+voice_search_inputs = [voice_search_query, voice_search_provider, voice_search_language, voice_search_gender]
+
+voice_search_tab.select(
+    fn=refresh_voice_search,
+    inputs=voice_search_inputs,
+    outputs=voice_search_results,
+    **METADATA_LANE,
+)
+
+for voice_search_input in voice_search_inputs:
+    voice_search_input.change(
+        fn=search_voices,
+        inputs=voice_search_inputs,
+        outputs=voice_search_results,
+        queue=False,
+        show_progress="hidden",
+    )
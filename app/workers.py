@@ -0,0 +1,146 @@
+"""
+Multi-process serving: several worker processes behind one port
+"""
+
+import asyncio
+import re
+import signal
+import subprocess
+import sys
+import zlib
+from pathlib import Path
+
+from logic.job_queue import JobQueue
+from loguru import logger
+
+SESSION_HASH = re.compile(rb"session_hash[\"']?\s*[:=]\s*[\"']?([\w-]+)")
+CONTENT_LENGTH = re.compile(rb"(?im)^content-length:\s*(\d+)")
+# bodies read before picking a worker, queue join requests are small JSON documents
+MAX_PEEKED_BODY: int = 64 * 1024
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Copy bytes from a stream to another until either side closes.
+    """
+    try:
+        while data := await reader.read(64 * 1024):
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+class AffinityProxy:
+    """
+    HTTP proxy spreading requests over the worker processes.
+
+    Gradio keeps queue sessions (the join request and its event stream) in the memory of the process that accepted
+    them, so every request of a session must reach the same worker. The proxy reads the head of each request (and the
+    body of small ones) to find the Gradio `session_hash` and pins the session to a worker by its hash, requests
+    without a session go to the worker with the fewest open connections. Clients sharing an address (NAT, reverse
+    proxy) are spread like any other. Requests are forwarded with `Connection: close`, so a kept-alive connection
+    never carries the requests of another session to the wrong worker.
+    """
+
+    def __init__(self, backends: list[tuple[str, int]]) -> None:
+        self.backends: list[tuple[str, int]] = backends
+        self.connections: list[int] = [0] * len(backends)
+
+    def pick(self, session: str | None) -> int:
+        """
+        Get the worker serving a request.
+
+        :param session: Gradio session hash of the request, if any
+        :return: index of the worker
+        """
+        if session:
+            return zlib.crc32(session.encode()) % len(self.backends)
+        return min(range(len(self.backends)), key=self.connections.__getitem__)
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader) -> tuple[bytes, str | None]:
+        """
+        Read the head of a request and its body if small enough to hold a session hash, rewritten to close the
+        connection after the response.
+
+        :param reader: client stream
+        :return: bytes to forward first, session hash
+        """
+        head: bytes = await reader.readuntil(b"\r\n\r\n")
+        lines: list[bytes] = [
+            line for line in head[:-4].split(b"\r\n") if not line.lower().startswith((b"connection:", b"keep-alive:"))
+        ]
+        length: re.Match | None = CONTENT_LENGTH.search(head)
+        body: bytes = b""
+        if length is not None and int(length.group(1)) <= MAX_PEEKED_BODY:
+            body = await reader.readexactly(int(length.group(1)))
+        session: re.Match | None = SESSION_HASH.search(lines[0]) or SESSION_HASH.search(body)
+        request: bytes = b"\r\n".join([*lines, b"Connection: close", b"", b""]) + body
+        return request, session.group(1).decode() if session else None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Forward a client connection to its worker.
+        """
+        try:
+            request, session = await self.read_request(reader)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+            writer.close()
+            return
+        index: int = self.pick(session)
+        host, port = self.backends[index]
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            logger.error(f"Worker {host}:{port} unreachable: {e}")
+            writer.close()
+            return
+        self.connections[index] += 1
+        try:
+            upstream_writer.write(request)
+            await asyncio.gather(_pipe(reader, upstream_writer), _pipe(upstream_reader, writer))
+        finally:
+            self.connections[index] -= 1
+
+    async def serve(self, host: str, port: int) -> None:
+        """
+        Accept connections forever.
+
+        :param host: public host
+        :param port: public port
+        """
+        server: asyncio.Server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"Serving {len(self.backends)} workers on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def run_workers(count: int, host: str, port: int) -> None:
+    """
+    Start `count` worker processes on the ports following `port` and serve them all on `port`.
+
+    :param count: number of worker processes
+    :param host: public host
+    :param port: public port
+    """
+    JobQueue.recover()
+    entry: str = str(Path(__file__).with_name("entry.py"))
+    backends: list[tuple[str, int]] = [("127.0.0.1", port + index + 1) for index in range(count)]
+    processes: list[subprocess.Popen] = [
+        subprocess.Popen(  # pylint: disable=R1732
+            [sys.executable, entry, "--worker", str(index), "--host", worker_host, "--port", str(worker_port)]
+        )
+        for index, (worker_host, worker_port) in enumerate(backends)
+    ]
+    try:
+        asyncio.run(AffinityProxy(backends).serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGTERM)
+        for process in processes:
+            process.wait()